@@ -2,22 +2,69 @@ import contextlib
 import os
 
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
 
-from data_control import Constants
+import template_env
+from data_control import Constants, constants_service
+from router.metrics import MetricsMiddleware
 from router.overlord_api import router as overlord_api_router
+from router.render_cache import render_cache
+from router.render_pool import render_executor
+from router.renderer import WIKI_DIR
+from router.timing import router as timing_router
+from router.watcher import FileWatcher
+from router.wiki_render import link_graph, on_files_changed, page_index
 from router.wiki_render import router as wiki_router
+from router.wiki_search import router as search_router
+from router.wiki_search import search_service
+from template_env import (
+    ASSET_MANIFEST,
+    IMAGE_MANIFEST,
+    STATIC_DIR,
+    AssetStaticFiles,
+    invalidate_static_versions,
+    load_asset_manifest,
+    load_image_manifest,
+)
 
 
 @contextlib.asynccontextmanager
 async def lifespan(app: FastAPI):
-    Constants.req_from_over()
+    await constants_service.start()
+
+    # Без манифеста хеши статики считаются лениво, по первому запросу файла
+    load_asset_manifest(os.getenv("WIKI_ASSET_MANIFEST", ASSET_MANIFEST))
+    load_image_manifest(os.getenv("WIKI_IMAGE_MANIFEST", IMAGE_MANIFEST))
+
+    # Вотчер стартует до сборки индекса, чтобы не потерять правки между ними
+    watcher = None
+    if os.getenv("WIKI_WATCH", "1") == "1":
+        watcher = FileWatcher([WIKI_DIR, STATIC_DIR])
+        watcher.subscribe(invalidate_static_versions)
+        watcher.subscribe(on_files_changed)
+        watcher.subscribe(search_service.on_files_changed)
+        watcher.start()
+        render_cache.validate_stamps = False
+        template_env.validate_static_stamps = False
+
+    page_index.build()
+    link_graph.build()
+    render_executor.start()
+    search_service.start()
+    # Новые константы - новый текст страниц, индекс поиска тоже пересобирается
+    Constants.subscribe(search_service.on_constants_changed)
 
     try:
         yield
 
     finally:
-        pass
+        Constants.unsubscribe(search_service.on_constants_changed)
+        search_service.stop()
+        render_executor.shutdown()
+        await constants_service.stop()
+        if watcher is not None:
+            watcher.stop()
+            render_cache.validate_stamps = True
+            template_env.validate_static_stamps = True
 
 
 app = FastAPI(
@@ -30,9 +77,13 @@ app = FastAPI(
 if os.getenv("FASTAPISTATIC") == "1":
     app.mount(
         "/static",
-        StaticFiles(directory="static"),
+        AssetStaticFiles(directory="static"),
         name="static",
     )
 
+app.add_middleware(MetricsMiddleware)
+
 app.include_router(overlord_api_router)
+app.include_router(search_router)
+app.include_router(timing_router)
 app.include_router(wiki_router)
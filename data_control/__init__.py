@@ -1 +1 @@
-from .constants import Constants
+from .constants import Constants, ConstantsService, constants_service
@@ -1,14 +1,362 @@
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Iterable, NamedTuple, Optional
+
 import requests
+from requests.adapters import HTTPAdapter
+
+log = logging.getLogger(__name__)
+
+OVERLORD_URL = "http://127.0.0.1:9100"
+CONSTANTS_SNAPSHOT = Path(__file__).resolve().parents[1] / "build" / "constants.json"
+# Таймауты запроса к overlord: (соединение, чтение), в секундах
+TIMEOUT = (2.0, 5.0)
+
+# (изменившиеся ключи, новая версия)
+ChangeCallback = Callable[[set[str], int], None]
+
+
+class ConstSnapshot(NamedTuple):
+    version: int
+    data: dict[str, str]
+    # Когда значения последний раз поменялись, для Last-Modified страниц
+    updated_at: float
+
+
+def overlord_url() -> str:
+    return os.getenv("OVERLORD_URL", OVERLORD_URL).rstrip("/")
+
+
+def parse_constants(raw) -> dict[str, str]:
+    if not isinstance(raw, dict):
+        raise ValueError(f"expected a JSON object, got {type(raw).__name__}")
+
+    return {str(k): str(v) for k, v in raw.items()}
+
+
+def fetch_constants(
+    session: Optional[requests.Session] = None,
+    url: Optional[str] = None,
+    timeout=TIMEOUT,
+) -> dict[str, str]:
+    resp = (session or requests).get(f"{url or overlord_url()}/config", timeout=timeout)
+    resp.raise_for_status()
+    return parse_constants(resp.json())
 
 
 class Constants:
-    _data = {}
+    # Снапшот меняется одним присваиванием: версия и данные всегда от
+    # одного ответа, а сам словарь после публикации никто не трогает
+    _snapshot = ConstSnapshot(0, {}, 0.0)
+    _lock = threading.Lock()
+    _callbacks: list[ChangeCallback] = []
 
     @classmethod
     def req_from_over(cls) -> None:
-        resp = requests.get("http://127.0.0.1:9100/config")
-        cls._data = resp.json()  # Похуй что может упасть если честно
+        # Синхронный вариант для скриптов: без overlord падает с ошибкой
+        cls.set_all_const(fetch_constants())
+
+    @classmethod
+    def set_all_const(
+        cls, data: dict[str, str], updated_at: Optional[float] = None
+    ) -> set[str]:
+        # Возвращает ключи, у которых поменялось значение. Одинаковый ответ
+        # версию не двигает, иначе каждое обновление сбрасывало бы кеш
+        return cls._swap(lambda old: dict(data), updated_at)
+
+    @classmethod
+    def update_const(
+        cls, values: dict[str, str], removed: Iterable[str] = ()
+    ) -> set[str]:
+        # Частичное обновление (пуш от overlord) поверх текущего снапшота
+        def merge(old: dict[str, str]) -> dict[str, str]:
+            data = {**old, **values}
+            for key in removed:
+                data.pop(key, None)
+
+            return data
+
+        return cls._swap(merge)
+
+    @classmethod
+    def _swap(
+        cls,
+        make: Callable[[dict[str, str]], dict[str, str]],
+        updated_at: Optional[float] = None,
+    ) -> set[str]:
+        with cls._lock:
+            old = cls._snapshot
+            data = make(old.data)
+            if old.version and old.data == data:
+                return set()
+
+            changed = {
+                key
+                for key in old.data.keys() | data.keys()
+                if old.data.get(key) != data.get(key)
+            }
+            cls._snapshot = ConstSnapshot(
+                old.version + 1,
+                data,
+                time.time() if updated_at is None else updated_at,
+            )
+            version = cls._snapshot.version
+            callbacks = list(cls._callbacks)
+
+        for callback in callbacks:
+            try:
+                callback(changed, version)
+
+            except Exception:
+                log.exception("constants change callback failed")
+
+        return changed
+
+    @classmethod
+    def subscribe(cls, callback: ChangeCallback) -> None:
+        with cls._lock:
+            cls._callbacks.append(callback)
+
+    @classmethod
+    def unsubscribe(cls, callback: ChangeCallback) -> None:
+        with cls._lock:
+            if callback in cls._callbacks:
+                cls._callbacks.remove(callback)
+
+    @classmethod
+    def snapshot(cls) -> ConstSnapshot:
+        return cls._snapshot
 
     @classmethod
     def get_all_const(cls) -> dict[str, str]:
-        return cls._data
+        return cls._snapshot.data
+
+    @classmethod
+    def get_version(cls) -> int:
+        # Растёт при каждой замене снапшота, по нему инвалидируется кеш рендера
+        return cls._snapshot.version
+
+
+class ConstantsService:
+    # Константы из overlord в фоне: при старте сразу поднимаются из
+    # последнего удачного снапшота на диске, потом раз в interval секунд
+    # перезапрашиваются. Пока overlord лежит, работаем на том, что есть
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        snapshot_path: Optional[Path] = None,
+        interval: float = 60.0,
+        retry: float = 5.0,
+        timeout=TIMEOUT,
+    ):
+        self.url = url
+        self.snapshot_path = snapshot_path
+        self.interval = interval
+        self.retry = retry
+        self.timeout = timeout
+
+        self.source = ""
+        self.refreshes = 0
+        self.pushes = 0
+        self.failures = 0
+        self.last_success = 0.0
+        self.last_error = ""
+
+        self._session: Optional[requests.Session] = None
+        # В Session одно соединение, а refresh() зовут и опрос, и пуши
+        self._fetch_lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        # refresh() и пуш пишут снапшот из разных потоков to_thread
+        self._save_lock = threading.Lock()
+        self._saved_version = 0
+
+    @classmethod
+    def from_env(cls) -> "ConstantsService":
+        return cls(
+            url=overlord_url(),
+            snapshot_path=Path(
+                os.getenv("WIKI_CONSTANTS_SNAPSHOT", CONSTANTS_SNAPSHOT)
+            ),
+            interval=float(os.getenv("WIKI_CONSTANTS_REFRESH", "60")),
+        )
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+
+        # Один Session на сервис: соединение с overlord переиспользуется
+        self._session = requests.Session()
+        self._session.mount("http://", HTTPAdapter(pool_maxsize=1))
+        self._session.mount("https://", HTTPAdapter(pool_maxsize=1))
+
+        if self.load_snapshot():
+            delay = 0.0
+
+        else:
+            # Снапшота нет (первый запуск): ждём overlord, но не дольше
+            # таймаута, и стартуем в любом случае
+            ok = await self.refresh() is not None
+            delay = self.interval if ok else min(self.retry, self.interval)
+
+        self._task = asyncio.create_task(self._run(delay))
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+
+            except asyncio.CancelledError:
+                pass
+
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    async def refresh(self) -> Optional[set[str]]:
+        # Изменившиеся ключи или None, если overlord не ответил
+        data = await self._fetch_or_log()
+        if data is None:
+            return None
+
+        self.source = "overlord"
+        changed = Constants.set_all_const(data)
+        if changed:
+            await asyncio.to_thread(self.save_snapshot, Constants.snapshot())
+
+        return changed
+
+    async def refresh_keys(self, keys: Iterable[str]) -> Optional[set[str]]:
+        # Пуш без значений: overlord назвал ключи, а сами значения берутся
+        # из его /config. Остальные ключи не трогаются, их догонит опрос
+        data = await self._fetch_or_log()
+        if data is None:
+            return None
+
+        keys = set(keys)
+        return await self.apply(
+            {key: data[key] for key in keys if key in data}, keys - data.keys()
+        )
+
+    async def _fetch_or_log(self) -> Optional[dict[str, str]]:
+        # requests блокирующий, так что запрос уходит в поток
+        try:
+            data = await asyncio.to_thread(self._fetch)
+
+        except (requests.RequestException, ValueError) as e:
+            self.failures += 1
+            self.last_error = str(e)
+            log.warning("cannot fetch constants from overlord: %s", e)
+            return None
+
+        self.refreshes += 1
+        self.last_success = time.time()
+        self.last_error = ""
+        return data
+
+    def _fetch(self) -> dict[str, str]:
+        # Запросы в overlord по очереди: Session не рассчитан на
+        # одновременное использование из нескольких потоков
+        with self._fetch_lock:
+            return fetch_constants(self._session, self.url, self.timeout)
+
+    async def apply(
+        self, values: dict[str, str], removed: Iterable[str] = ()
+    ) -> set[str]:
+        # Изменения, присланные самим overlord, без похода за /config
+        changed = Constants.update_const(values, removed)
+        self.pushes += 1
+        if changed:
+            self.source = "push"
+            await asyncio.to_thread(self.save_snapshot, Constants.snapshot())
+
+        return changed
+
+    def load_snapshot(self) -> bool:
+        if self.snapshot_path is None:
+            return False
+
+        try:
+            raw = json.loads(self.snapshot_path.read_text(encoding="utf-8"))
+            data = parse_constants(raw["constants"])
+            saved_at = float(raw.get("saved_at", 0.0))
+
+        except FileNotFoundError:
+            return False
+
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            log.warning("ignoring constants snapshot %s: %s", self.snapshot_path, e)
+            return False
+
+        Constants.set_all_const(data, saved_at)
+        self.source = "snapshot"
+        with self._save_lock:
+            self._saved_version = Constants.get_version()
+
+        return True
+
+    def save_snapshot(self, snapshot: ConstSnapshot) -> None:
+        if self.snapshot_path is None:
+            return
+
+        # Через временный файл: оборванная запись не должна испортить
+        # последний удачный снапшот. Записи идут по одной, и более старая
+        # версия, опоздавшая к замку, уже сохранённую не перетирает
+        path = self.snapshot_path
+        with self._save_lock:
+            if snapshot.version <= self._saved_version:
+                return
+
+            tmp = None
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                with tempfile.NamedTemporaryFile(
+                    "w",
+                    encoding="utf-8",
+                    dir=path.parent,
+                    prefix=f".{path.name}.",
+                    suffix=".tmp",
+                    delete=False,
+                ) as f:
+                    tmp = Path(f.name)
+                    json.dump(
+                        {"saved_at": snapshot.updated_at, "constants": snapshot.data},
+                        f,
+                        ensure_ascii=False,
+                    )
+
+                os.replace(tmp, path)
+                self._saved_version = snapshot.version
+
+            except OSError as e:
+                log.warning("cannot save constants snapshot %s: %s", path, e)
+                if tmp is not None:
+                    tmp.unlink(missing_ok=True)
+
+    def stats(self) -> dict:
+        return {
+            "version": Constants.get_version(),
+            "source": self.source,
+            "refreshes": self.refreshes,
+            "pushes": self.pushes,
+            "failures": self.failures,
+            "last_success": self.last_success,
+            "last_error": self.last_error,
+        }
+
+    async def _run(self, delay: float) -> None:
+        while True:
+            await asyncio.sleep(delay)
+            ok = await self.refresh() is not None
+            delay = self.interval if ok else min(self.retry, self.interval)
+
+
+constants_service = ConstantsService.from_env()
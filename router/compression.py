@@ -0,0 +1,51 @@
+import gzip
+from typing import Iterable, Optional
+
+try:
+    import brotli
+
+except ImportError:
+    brotli = None
+
+# В порядке предпочтения, если клиент согласен на несколько
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+# Мельче этого сжатие почти ничего не даёт
+MIN_SIZE = 512
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=11)
+
+    # mtime=0, чтобы одинаковое тело давало одинаковые байты
+    return gzip.compress(body, compresslevel=9, mtime=0)
+
+
+def choose_encoding(
+    accept_encoding: Optional[str], available: Iterable[str] = ENCODINGS
+) -> Optional[str]:
+    if not accept_encoding:
+        return None
+
+    accepted: dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, *params = item.split(";")
+        q = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+
+                except ValueError:
+                    q = 0.0
+
+        accepted[name.strip().lower()] = q
+
+    best = None
+    for encoding in available:
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > 0 and (best is None or q > best[1]):
+            best = (encoding, q)
+
+    return best[0] if best else None
@@ -6,6 +6,8 @@ from .img_block_extension import ImgBlockExtension
 from .img_extension import ImgExtension
 from .img_url_extension import ImgUrlExtension
 from .lobotomy_extension import LobotomyExtension
+from .macro_extension import MacroExtension
+from .preprocessor_chain import PreprocessorChainExtension
 from .redact_extension import RedactExtension
 from .small_text_extension import SmallTextExtension
 from .strikethrough_extension import StrikethroughExtension
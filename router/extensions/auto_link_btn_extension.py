@@ -3,27 +3,13 @@ from __future__ import annotations
 import re
 import shlex
 import xml.etree.ElementTree as etree
-from datetime import datetime
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
-from markdown import Extension, Markdown
+from markdown import Extension
 from markdown.treeprocessors import Treeprocessor
 
-RU_MONTHS = {
-    "января": 1,
-    "февраля": 2,
-    "марта": 3,
-    "апреля": 4,
-    "мая": 5,
-    "июня": 6,
-    "июля": 7,
-    "августа": 8,
-    "сентября": 9,
-    "октября": 10,
-    "ноября": 11,
-    "декабря": 12,
-}
+from ..page_index import get_page_index
 
 
 class _Args:
@@ -108,96 +94,40 @@ class AutoLinkButtonsTreeprocessor(Treeprocessor):
         self, folder: Path, exclude: List[str], current_path: Path
     ) -> List[Dict[str, str]]:
         out: List[Dict[str, str]] = []
+        files, sub_indexes = get_page_index(self.wiki_dir).children(folder)
 
-        for md_file in sorted(folder.glob("*.md")):
-            if md_file.resolve() == current_path:
+        # Список ссылок зависит от состава папки и меты каждого соседа
+        deps = getattr(self.md, "dependencies", None)
+        if deps is not None:
+            deps.add(folder)
+
+        for info in files:
+            if info.path == current_path:
                 continue
 
-            name_no_ext = md_file.stem.lower()
-            if name_no_ext in exclude:
+            if info.path.stem.lower() in exclude:
                 continue
 
-            meta = self._read_meta(md_file)
-            title = meta.get("title") or md_file.stem
-            date = self._parse_date(meta.get("date"), md_file.stat().st_mtime)
-            href = self._href_from(md_file)
-            out.append({"title": title, "href": href, "date": date.isoformat()})
+            if deps is not None:
+                deps.add(info.path)
 
-        for subdir in sorted(folder.iterdir()):
-            if not subdir.is_dir():
-                continue
+            title = info.title or info.path.stem
+            out.append({"title": title, "href": info.href, "date": info.date})
 
-            index_file = subdir / "index.md"
-            if not index_file.exists():
-                continue
+        for info in sub_indexes:
+            subdir = info.path.parent
+            if deps is not None:
+                deps.add(subdir)
+                deps.add(info.path)
 
-            name_no_ext = subdir.name.lower()
-            if name_no_ext in exclude:
+            if subdir.name.lower() in exclude:
                 continue
 
-            meta = self._read_meta(index_file)
-            title = meta.get("title") or subdir.name
-            date = self._parse_date(meta.get("date"), index_file.stat().st_mtime)
-            href = self._href_from(index_file)
-            out.append({"title": title, "href": href, "date": date.isoformat()})
+            title = info.title or subdir.name
+            out.append({"title": title, "href": info.href, "date": info.date})
 
         return out
 
-    def _href_from(self, md_path: Path) -> str:
-        rel = md_path.resolve().relative_to(self.wiki_dir).with_suffix("")
-        return "/wiki/" + str(rel).replace("\\", "/")
-
-    def _read_meta(self, md_path: Path) -> Dict[str, str]:
-        try:
-            text = md_path.read_text(encoding="utf-8")
-        except FileNotFoundError:
-            return {}
-
-        head = []
-        for line in text.splitlines():
-            if not line.strip():
-                break
-
-            head.append(line)
-        head_text = "\n".join(head)
-
-        md = Markdown(extensions=["meta"])
-        md.convert(head_text)
-
-        meta = {}
-        for k, v in getattr(md, "Meta", {}).items():
-            if isinstance(v, list):
-                meta[k.lower()] = v[0]
-            else:
-                meta[k.lower()] = str(v)
-
-        return meta
-
-    def _parse_date(self, raw: Optional[str], fallback_ts: float) -> datetime:
-        if not raw:
-            return datetime.fromtimestamp(fallback_ts)
-
-        raw = raw.strip()
-        for fmt in ("%Y-%m-%d", "%Y/%m/%d", "%d.%m.%Y"):
-            try:
-                return datetime.strptime(raw, fmt)
-
-            except ValueError:
-                pass
-
-        parts = raw.split()
-        if len(parts) >= 3:
-            try:
-                day = int(parts[0])
-                month = RU_MONTHS[parts[1].lower()]
-                year = int(parts[2])
-                return datetime(year, month, day)
-
-            except Exception:
-                pass
-
-        return datetime.fromtimestamp(fallback_ts)
-
     def _sort(self, items: List[Dict[str, str]], mode: str) -> List[Dict[str, str]]:
         if mode == "date":
             return sorted(items, key=lambda x: x["date"], reverse=True)
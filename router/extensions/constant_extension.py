@@ -4,18 +4,88 @@ from markdown import Markdown
 from markdown.extensions import Extension
 from markdown.postprocessors import Postprocessor
 
+# (смещение в html, ключ) - куда вставлять значения констант
+ConstSlots = tuple[tuple[int, str], ...]
+
+# Метка вместо значения в отложенном режиме. Символы из Private Use Area,
+# в тексте вики их нет
+SLOT_START = "\ue000"
+SLOT_END = "\ue001"
+SLOT_RE = re.compile(f"{SLOT_START}([^{SLOT_END}]*){SLOT_END}")
+
+
+class DeferredConstError(Exception):
+    # Константа внутри другого макроса: результат зависит от значения,
+    # вставкой его не собрать
+    pass
+
+
+def missing_const(key: str) -> str:
+    return f"<missing const: {key}>"
+
+
+def cut_slots(html: str) -> tuple[str, ConstSlots]:
+    parts = []
+    slots = []
+    pos = length = 0
+    for m in SLOT_RE.finditer(html):
+        chunk = html[pos : m.start()]
+        parts.append(chunk)
+        length += len(chunk)
+        slots.append((length, m.group(1)))
+        pos = m.end()
+
+    parts.append(html[pos:])
+    return "".join(parts), tuple(slots)
+
+
+def fits_constants(slots: ConstSlots, constants: dict[str, str]) -> bool:
+    # Значения с ! или \ MacroPostprocessor отдаёт старой цепочке, где они
+    # могут повлиять на соседние макросы, - такие только полным рендером
+    for _, key in slots:
+        value = constants.get(key)
+        if value is not None and ("!" in value or "\\" in value):
+            return False
+
+    return True
+
+
+def splice_constants(html: str, slots: ConstSlots, constants: dict[str, str]) -> str:
+    parts = []
+    pos = 0
+    for offset, key in slots:
+        parts.append(html[pos:offset])
+        parts.append(constants.get(key, missing_const(key)))
+        pos = offset
+
+    parts.append(html[pos:])
+    # Markdown.convert() обрезает пробелы по краям уже со значениями
+    return "".join(parts).strip()
+
 
 class ConstPostprocessor(Postprocessor):
+    PATTERN = re.compile(r"(?<!\\)!const\[(.+?)\]")
+
     def __init__(self, constants):
         self.constants = constants
+        # Вместо значений - метки, см. WikiRenderer.render(deferred=True)
+        self.deferred = False
+        # Ключи, которые спрашивали за текущую конвертацию
+        self.used: set[str] = set()
+
+    def lookup(self, raw: str) -> str:
+        key = raw.strip()
+        self.used.add(key)
+        if self.deferred:
+            return f"{SLOT_START}{key}{SLOT_END}"
+
+        return self.constants.get(key, missing_const(key))
 
     def run(self, text):
-        def replace_const(m):
-            key = m.group(1).strip()
-            return self.constants.get(key, f"<missing const: {key}>")
+        if self.deferred and self.PATTERN.search(text):
+            raise DeferredConstError()
 
-        pattern = re.compile(r"(?<!\\)!const\[(.+?)\]")
-        text = pattern.sub(replace_const, text)
+        text = self.PATTERN.sub(lambda m: self.lookup(m.group(1)), text)
 
         text = text.replace(r"\!const", "!const")
         return text
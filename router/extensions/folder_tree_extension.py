@@ -8,20 +8,18 @@ class FolderTreePreprocessor(Preprocessor):
     RE_START = re.compile(r"^!folder\[\s*$")
     RE_END = re.compile(r"^\s*\]\s*$")
 
-    def run(self, lines):
-        new_lines = []
-        i = 0
+    def iter_lines(self, lines):
+        lines = iter(lines)
 
-        while i < len(lines):
-            if self.RE_START.match(lines[i]):
-                i += 1
+        for line in lines:
+            if self.RE_START.match(line):
                 paths = []
-                while i < len(lines) and not self.RE_END.match(lines[i]):
-                    line = lines[i].strip()
+                for line in lines:
+                    if self.RE_END.match(line):
+                        break
+                    line = line.strip()
                     if line:
                         paths.append(line)
-                    i += 1
-                i += 1
 
                 tree = {}
                 for path_str in paths:
@@ -54,16 +52,16 @@ class FolderTreePreprocessor(Preprocessor):
                 else:
                     lines_tree = render(tree, "")
 
-                new_lines.append('<div class="foldertree">')
-                new_lines.append("<pre>")
-                new_lines.extend(lines_tree)
-                new_lines.append("</pre>")
-                new_lines.append("</div>")
+                yield '<div class="foldertree">'
+                yield "<pre>"
+                yield from lines_tree
+                yield "</pre>"
+                yield "</div>"
             else:
-                new_lines.append(lines[i])
-                i += 1
+                yield line
 
-        return new_lines
+    def run(self, lines):
+        return list(self.iter_lines(lines))
 
 
 class FolderTreeExtension(Extension):
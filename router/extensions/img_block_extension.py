@@ -4,7 +4,9 @@ from xml.etree import ElementTree as etree
 from markdown.blockprocessors import BlockProcessor
 from markdown.extensions import Extension
 
-from template_env import static_url
+from template_env import STATIC_DIR, static_url
+
+from .responsive_img import append_img
 
 
 class ImgBlockProcessor(BlockProcessor):
@@ -63,6 +65,7 @@ class ImgBlockProcessor(BlockProcessor):
         else:
             width, height, mode = "40%", None, "max"
 
+        rel_path = ""
         if ".." in raw_path:
             url = ""
 
@@ -70,6 +73,10 @@ class ImgBlockProcessor(BlockProcessor):
             rel_path = f"images/{raw_path.lstrip('/')}"
             url = self.resolver(rel_path)
 
+            deps = getattr(self.parser.md, "dependencies", None)
+            if deps is not None:
+                deps.add(STATIC_DIR / rel_path)
+
         content_lines: list[str] = []
         for line in lines[1:]:
             if line.strip().lower() == "!endimgblock":
@@ -80,9 +87,7 @@ class ImgBlockProcessor(BlockProcessor):
         wrapper = etree.SubElement(parent, "div")
         wrapper.set("class", f"img-side {pos}")
 
-        img = etree.SubElement(wrapper, "img")
-        img.set("src", url)
-        img.set("alt", "")
+        img = append_img(wrapper, rel_path, url, width)
 
         if mode == "hard":
             style = f"width:{width};"
@@ -4,7 +4,9 @@ from xml.etree import ElementTree as etree
 from markdown.blockprocessors import BlockProcessor
 from markdown.extensions import Extension
 
-from template_env import static_url
+from template_env import STATIC_DIR, static_url
+
+from .responsive_img import append_img
 
 
 class ImgBlockProcessor(BlockProcessor):
@@ -62,6 +64,7 @@ class ImgBlockProcessor(BlockProcessor):
         else:
             width, height, mode = "100%", None, "max"
 
+        rel_path = ""
         if ".." in raw_path:
             url = ""
 
@@ -69,12 +72,14 @@ class ImgBlockProcessor(BlockProcessor):
             rel_path = f"images/{raw_path.lstrip('/')}"
             url = self.resolver(rel_path)
 
+            deps = getattr(self.parser.md, "dependencies", None)
+            if deps is not None:
+                deps.add(STATIC_DIR / rel_path)
+
         wrapper = etree.SubElement(parent, "div")
         wrapper.set("class", f"img-side {pos}")
 
-        img = etree.SubElement(wrapper, "img")
-        img.set("src", url)
-        img.set("alt", "")
+        img = append_img(wrapper, rel_path, url, width)
 
         if mode == "hard":
             style = f"width:{width};"
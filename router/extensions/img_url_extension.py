@@ -1,28 +1,36 @@
 import re
+from typing import Optional
 
 from markdown import Markdown
 from markdown.extensions import Extension
 from markdown.postprocessors import Postprocessor
 
-from template_env import static_url
+from template_env import STATIC_DIR, static_url
 
 
 class ImgUrlPostprocessor(Postprocessor):
-    def __init__(self, resolver):
+    PATTERN = re.compile(r"(?<!\\)!img_url\[(.+?)\]")
+
+    def __init__(self, resolver, md: Optional[Markdown] = None):
+        super().__init__(md)
         self.resolver = resolver
 
-    def run(self, text: str) -> str:
-        def replace(m):
-            raw = m.group(1).strip()
+    def url_for(self, raw: str) -> str:
+        raw = raw.strip()
+
+        if ".." in raw:
+            return "<invalid img path>"
 
-            if ".." in raw:
-                return "<invalid img path>"
+        path = f"images/{raw.lstrip('/')}"
 
-            path = f"images/{raw.lstrip('/')}"
-            return self.resolver(path)
+        deps = getattr(self.md, "dependencies", None)
+        if deps is not None:
+            deps.add(STATIC_DIR / path)
 
-        pattern = re.compile(r"(?<!\\)!img_url\[(.+?)\]")
-        text = pattern.sub(replace, text)
+        return self.resolver(path)
+
+    def run(self, text: str) -> str:
+        text = self.PATTERN.sub(lambda m: self.url_for(m.group(1)), text)
 
         return text.replace(r"\!img_url", "!img_url")
 
@@ -30,7 +38,7 @@ class ImgUrlPostprocessor(Postprocessor):
 class ImgUrlExtension(Extension):
     def extendMarkdown(self, md: Markdown):
         md.postprocessors.register(
-            ImgUrlPostprocessor(static_url),
+            ImgUrlPostprocessor(static_url, md),
             "img_url_postprocessor",
             10,
         )
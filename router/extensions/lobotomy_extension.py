@@ -3,35 +3,32 @@ import re
 from markdown.extensions import Extension
 from markdown.preprocessors import Preprocessor
 
+from .preprocessor_chain import LineStream
+
 
 class LobotomyPreprocessor(Preprocessor):
     RE_START = re.compile(r"^!lob\[\s*$")
     RE_END = re.compile(r"^\s*\]\s*$")
 
-    def run(self, lines):
-        new_lines = []
-        i = 0
+    def iter_lines(self, lines):
+        lines = LineStream(lines)
 
-        while i < len(lines):
-            if self.RE_START.match(lines[i]):
-                i += 1
+        for line in lines:
+            if self.RE_START.match(line):
                 params = {}
-                while i < len(lines) and not self.RE_END.match(lines[i]):
-                    line = lines[i].rstrip()
+                for line in lines:
+                    if self.RE_END.match(line):
+                        break
+                    line = line.rstrip()
                     if line and ":" in line:
                         key, val = map(str.strip, line.split(":", 1))
-                        i += 1
                         extra = []
-                        while i < len(lines) and (
-                            lines[i].startswith(" ") or not lines[i].strip()
+                        while (nxt := lines.peek()) is not None and (
+                            nxt.startswith(" ") or not nxt.strip()
                         ):
-                            extra.append(lines[i].lstrip())
-                            i += 1
+                            extra.append(next(lines).lstrip())
                         val = "\n".join([val] + extra)
                         params[key.lower()] = val
-                        continue
-                    i += 1
-                i += 1
 
                 style = params.get("style", "base")
                 if style.lower() == "base":
@@ -48,12 +45,12 @@ class LobotomyPreprocessor(Preprocessor):
      data-arr="{arr}">
 </div>
 '''
-                new_lines.append(html)
+                yield html
             else:
-                new_lines.append(lines[i])
-                i += 1
+                yield line
 
-        return new_lines
+    def run(self, lines):
+        return list(self.iter_lines(lines))
 
 
 class LobotomyExtension(Extension):
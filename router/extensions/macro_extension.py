@@ -0,0 +1,93 @@
+import re
+
+from markdown import Markdown
+from markdown.extensions import Extension
+from markdown.postprocessors import Postprocessor
+
+from .constant_extension import ConstPostprocessor
+from .img_url_extension import ImgUrlPostprocessor
+from .redact_extension import RedactPostprocessor
+
+NAMES = ("const", "img_url", "redact")
+
+
+class _Fallback(Exception):
+    pass
+
+
+class MacroPostprocessor(Postprocessor):
+    # !const, !img_url и !redact за один проход по документу вместо трёх
+    # sub + трёх replace. Результат обязан совпадать с цепочкой старых
+    # постпроцессоров, поэтому всё, где они влияют друг на друга (макрос
+    # внутри макроса, константа с ! или \ внутри или сразу после !),
+    # отдаётся им как раньше.
+
+    PATTERN = re.compile(
+        r"(?<!\\)!(const|img_url|redact)\[(.+?)\]|\\!(const|img_url|redact)"
+    )
+
+    def __init__(
+        self,
+        const: ConstPostprocessor,
+        img_url: ImgUrlPostprocessor,
+        redact: RedactPostprocessor,
+    ):
+        super().__init__(img_url.md)
+        self.const = const
+        self.img_url = img_url
+        self.redact = redact
+
+    def _replace(self, m: re.Match) -> str:
+        name = m.group(1)
+        if name is None:
+            return "!" + m.group(3)
+
+        inner = m.group(2)
+        if "!" in inner:
+            raise _Fallback()
+
+        if name == "const":
+            # После ! значение может само дописать имя макроса: !!const[k]
+            # при k = redact[x] цепочка замажет то, что получилось
+            if m.start() and m.string[m.start() - 1] == "!":
+                raise _Fallback()
+
+            value = self.const.lookup(inner)
+            if "!" in value or "\\" in value:
+                raise _Fallback()
+
+            return value
+
+        if name == "img_url":
+            return self.img_url.url_for(inner)
+
+        return self.redact.mask(inner)
+
+    def run_sequential(self, text: str) -> str:
+        for processor in (self.const, self.img_url, self.redact):
+            text = processor.run(text)
+
+        return text
+
+    def run(self, text: str) -> str:
+        if "!" not in text:
+            return text
+
+        try:
+            return self.PATTERN.sub(self._replace, text)
+
+        except _Fallback:
+            return self.run_sequential(text)
+
+
+class MacroExtension(Extension):
+    # Подключается после Const/ImgUrl/Redact и подменяет их постпроцессоры
+    # одним общим, старые остаются внутри для запасного пути
+    def extendMarkdown(self, md: Markdown):
+        processors = [md.postprocessors[f"{name}_postprocessor"] for name in NAMES]
+        for name in NAMES:
+            md.postprocessors.deregister(f"{name}_postprocessor")
+
+        md.postprocessors.register(
+            MacroPostprocessor(*processors), "macro_postprocessor", 10
+        )
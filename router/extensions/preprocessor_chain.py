@@ -0,0 +1,66 @@
+from typing import Iterable, Optional
+
+from markdown import Markdown
+from markdown.extensions import Extension
+from markdown.preprocessors import Preprocessor
+from markdown.util import Registry
+
+
+class LineStream:
+    # Итератор по строкам с подглядыванием на одну вперёд, для макросов,
+    # которые решают, забирать ли следующую строку
+
+    def __init__(self, lines: Iterable[str]):
+        self._it = iter(lines)
+        self._next: Optional[str] = None
+
+    def __iter__(self) -> "LineStream":
+        return self
+
+    def __next__(self) -> str:
+        if self._next is not None:
+            line, self._next = self._next, None
+            return line
+
+        return next(self._it)
+
+    def peek(self) -> Optional[str]:
+        if self._next is None:
+            self._next = next(self._it, None)
+
+        return self._next
+
+
+class PreprocessorChain(Preprocessor):
+    # Все препроцессоры за один прогон. Наши построчные (у которых есть
+    # iter_lines) склеиваются в конвейер генераторов и не собирают
+    # промежуточных списков; встроенные из Python-Markdown (meta,
+    # fenced_code, html_block...) работают со списком и остаются на своих
+    # местах, так что порядок и результат те же, что у реестра.
+
+    def __init__(self, md: Markdown, processors: list[Preprocessor]):
+        super().__init__(md)
+        self.processors = processors
+
+    def run(self, lines: list[str]) -> list[str]:
+        stream: Iterable[str] = lines
+        for processor in self.processors:
+            iter_lines = getattr(processor, "iter_lines", None)
+            if iter_lines is not None:
+                stream = iter_lines(stream)
+
+            else:
+                stream = processor.run(
+                    stream if isinstance(stream, list) else list(stream)
+                )
+
+        return stream if isinstance(stream, list) else list(stream)
+
+
+class PreprocessorChainExtension(Extension):
+    # Подключается последним: забирает все зарегистрированные
+    # препроцессоры в порядке приоритетов и заменяет их одной цепочкой
+    def extendMarkdown(self, md: Markdown):
+        chain = PreprocessorChain(md, list(md.preprocessors))
+        md.preprocessors = Registry()
+        md.preprocessors.register(chain, "preprocessor_chain", 30)
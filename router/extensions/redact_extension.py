@@ -6,13 +6,14 @@ from markdown.postprocessors import Postprocessor
 
 
 class RedactPostprocessor(Postprocessor):
-    def run(self, text: str) -> str:
-        def mask_content(match: re.Match) -> str:
-            content = match.group(1)
-            return "".join("█" if not c.isspace() else c for c in content)
+    PATTERN = re.compile(r"(?<!\\)!redact\[(.+?)\]")
+
+    @staticmethod
+    def mask(content: str) -> str:
+        return "".join("█" if not c.isspace() else c for c in content)
 
-        pattern = re.compile(r"(?<!\\)!redact\[(.+?)\]")
-        text = pattern.sub(mask_content, text)
+    def run(self, text: str) -> str:
+        text = self.PATTERN.sub(lambda m: self.mask(m.group(1)), text)
 
         return text.replace(r"\!redact", "!redact")
 
@@ -0,0 +1,47 @@
+import re
+from xml.etree import ElementTree as etree
+
+from template_env import image_variants, srcset
+
+# Ширина колонки с текстом (.content-tile за вычетом паддингов)
+CONTENT_WIDTH = 704
+
+
+def sizes_for(width: str) -> str:
+    m = re.match(r"^(\d+)(%|px)$", width)
+    if m and m.group(2) == "px":
+        return f"{m.group(1)}px"
+
+    pct = int(m.group(1)) if m else 100
+    return f"(max-width: 800px) {pct}vw, {CONTENT_WIDTH * pct // 100}px"
+
+
+def append_img(parent: etree.Element, rel_path: str, url: str, width: str):
+    # <img> с srcset по нарезке из scripts/build_images.py, если она есть.
+    # picture в CSS стоит display: contents, так что вёрстка .img-side
+    # видит img как и раньше.
+    variants = image_variants(rel_path) if url else None
+    target = parent
+
+    if variants is not None:
+        picture = etree.SubElement(parent, "picture")
+        source = etree.SubElement(picture, "source")
+        source.set("type", "image/webp")
+        source.set("srcset", srcset(variants["webp"]))
+        source.set("sizes", sizes_for(width))
+        target = picture
+
+    img = etree.SubElement(target, "img")
+    img.set("src", url)
+    img.set("alt", "")
+
+    if variants is not None:
+        img.set("srcset", srcset(variants["fallback"]))
+        img.set("sizes", sizes_for(width))
+        img.set("width", str(variants["width"]))
+        img.set("height", str(variants["height"]))
+
+    img.set("loading", "lazy")
+    img.set("decoding", "async")
+
+    return img
@@ -7,15 +7,16 @@ from markdown.preprocessors import Preprocessor
 class SmallTextPreprocessor(Preprocessor):
     RE = re.compile(r"^\s*-\#\s+(.*)$")
 
-    def run(self, lines):
-        result = []
+    def iter_lines(self, lines):
         for line in lines:
             m = self.RE.match(line)
             if m:
-                result.append(f'<div class="small">{m.group(1).strip()}</div>')
+                yield f'<div class="small">{m.group(1).strip()}</div>'
             else:
-                result.append(line)
-        return result
+                yield line
+
+    def run(self, lines):
+        return list(self.iter_lines(lines))
 
 
 class SmallTextExtension(Extension):
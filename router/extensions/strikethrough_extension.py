@@ -7,12 +7,12 @@ from markdown.preprocessors import Preprocessor
 class StrikethroughPreprocessor(Preprocessor):
     RE = re.compile(r"~~(.*?)~~")
 
-    def run(self, lines):
-        new_lines = []
+    def iter_lines(self, lines):
         for line in lines:
-            line = self.RE.sub(r"<del>\1</del>", line)
-            new_lines.append(line)
-        return new_lines
+            yield self.RE.sub(r"<del>\1</del>", line)
+
+    def run(self, lines):
+        return list(self.iter_lines(lines))
 
 
 class StrikethroughExtension(Extension):
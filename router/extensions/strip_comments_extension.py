@@ -7,16 +7,51 @@ from markdown.preprocessors import Preprocessor
 class StripCommentsPreprocessor(Preprocessor):
     RE = re.compile(r"<!--.*?-->", re.DOTALL)
 
+    def _strip(self, lines):
+        # Строки без комментариев проходят как есть; с комментарием копятся,
+        # пока он не закроется, и только этот кусок идёт через регулярку
+        chunk = None
+        for line in lines:
+            if chunk is None:
+                if "<!--" not in line:
+                    yield line
+                    continue
+
+                chunk = line
+
+            else:
+                chunk += "\n" + line
+                if "-->" not in line:
+                    continue
+
+            text = self.RE.sub("", chunk)
+            if "<!--" not in text:
+                yield from text.split("\n")
+                chunk = None
+
+        if chunk is not None:
+            yield from self.RE.sub("", chunk).split("\n")
+
+    def iter_lines(self, lines):
+        # Пустые строки в начале и в конце документа выкидываются
+        started = False
+        blank = []
+        for line in self._strip(lines):
+            line = line.rstrip()
+            if not line:
+                if started:
+                    blank.append(line)
+                continue
+
+            started = True
+            if blank:
+                yield from blank
+                blank.clear()
+
+            yield line
+
     def run(self, lines):
-        text = "\n".join(lines)
-        text = self.RE.sub("", text)
-        stripped_lines = [line.rstrip() for line in text.split("\n")]
-        while stripped_lines and not stripped_lines[0].strip():
-            stripped_lines.pop(0)
-        while stripped_lines and not stripped_lines[-1].strip():
-            stripped_lines.pop()
-
-        return stripped_lines
+        return list(self.iter_lines(lines))
 
 
 class StripCommentsExtension(Extension):
@@ -35,33 +35,31 @@ class TableImgPreprocessor(Preprocessor):
 
         return width, height, mode
 
-    def run(self, lines):
-        new_lines = []
-
+    def _replace(self, m):
+        url = m.group("url").strip()
+        size_str = m.group("size") or "100%"
+        width, height, mode = self.parse_size(size_str)
+
+        if mode == "hard":
+            style = f"width:{width};"
+            if height:
+                style += f" height:{height};"
+        else:
+            style = f"max-width:{width};"
+            if height:
+                style += f" max-height:{height};"
+
+        return f'<img src="{url}" alt="" style="{style}">'
+
+    def iter_lines(self, lines):
         for line in lines:
             if "|" in line:
+                line = self.RE.sub(self._replace, line)
 
-                def repl(m):
-                    url = m.group("url").strip()
-                    size_str = m.group("size") or "100%"
-                    width, height, mode = self.parse_size(size_str)
-
-                    if mode == "hard":
-                        style = f"width:{width};"
-                        if height:
-                            style += f" height:{height};"
-                    else:
-                        style = f"max-width:{width};"
-                        if height:
-                            style += f" max-height:{height};"
-
-                    return f'<img src="{url}" alt="" style="{style}">'
+            yield line
 
-                line = self.RE.sub(repl, line)
-
-            new_lines.append(line)
-
-        return new_lines
+    def run(self, lines):
+        return list(self.iter_lines(lines))
 
 
 class TableImgExtension(Extension):
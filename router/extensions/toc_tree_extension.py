@@ -1,5 +1,6 @@
 import hashlib
 import re
+from typing import Iterable, Iterator
 
 from markdown.extensions import Extension
 from markdown.preprocessors import Preprocessor
@@ -26,6 +27,15 @@ class TocTreePreprocessor(Preprocessor):
     RE_TOC = re.compile(r"^\s*\[TOC\]\s*$", re.IGNORECASE)
     RE_HEADER = re.compile(r"^(#{1,6})\s+(.*)")
 
+    def iter_lines(self, lines: Iterable[str]) -> Iterator[str]:
+        # Оглавлению нужны все заголовки документа, так что список
+        # собирается, но заменять его стоит только если [TOC] вообще есть
+        lines = list(lines)
+        if not any(self.RE_TOC.match(line) for line in lines):
+            return iter(lines)
+
+        return iter(self.run(lines))
+
     def run(self, lines: list[str]) -> list[str]:
         headers: list[tuple[int, str, str]] = []
         in_code_block = False
@@ -1,10 +1,65 @@
 import re
+import threading
 from pathlib import Path
+from typing import Iterable, Optional
 
 from markdown import Markdown
 from markdown.extensions import Extension
 from markdown.preprocessors import Preprocessor
 
+# Сколько шаблонов может быть вложено друг в друга
+MAX_DEPTH = 8
+
+
+class WarnTemplateStore:
+    # Шаблоны !warn в памяти: файл читается один раз на процесс и лежит,
+    # пока его не сбросит вотчер (или render_pool при смене поколения)
+
+    def __init__(self):
+        # None - файла нет, это тоже запоминается
+        self._templates: dict[Path, Optional[tuple[str, ...]]] = {}
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.loads = 0
+
+    def get(self, warn_file: Path) -> Optional[tuple[str, ...]]:
+        with self._lock:
+            if warn_file in self._templates:
+                return self._templates[warn_file]
+
+            generation = self.generation
+
+        try:
+            lines: Optional[tuple[str, ...]] = tuple(
+                warn_file.read_text(encoding="utf-8").splitlines()
+            )
+
+        except FileNotFoundError:
+            lines = None
+
+        with self._lock:
+            self.loads += 1
+            # Пока файл читался, его могли поменять: такое не запоминаем
+            if generation == self.generation:
+                self._templates[warn_file] = lines
+
+        return lines
+
+    def invalidate(self, paths: Optional[Iterable[Path]] = None) -> None:
+        with self._lock:
+            self.generation += 1
+            if paths is None:
+                self._templates.clear()
+                return
+
+            for path in paths:
+                path = Path(path).resolve()
+                for known in [p for p in self._templates if p.is_relative_to(path)]:
+                    del self._templates[known]
+
+
+warn_templates = WarnTemplateStore()
+
 
 class WarnIncludePreprocessor(Preprocessor):
     RE = re.compile(r"(?<!\\)!warn\[(?P<name>[^\]]+)\]")
@@ -13,29 +68,47 @@ class WarnIncludePreprocessor(Preprocessor):
         super().__init__(md)
         self.base_dir = Path(base_dir).resolve()
 
-    def run(self, lines):
-        out = []
+    def iter_lines(self, lines):
+        return self._expand(lines, ())
+
+    def _expand(self, lines, stack: tuple[Path, ...]):
         for line in lines:
             m = self.RE.search(line)
             if not m:
-                out.append(line)
+                yield line
                 continue
 
             name = m.group("name").strip()
             warn_file = (self.base_dir / f"{name}.md").resolve()
 
-            if not warn_file.exists():
-                out.append(f"Template '{name}' not found.")
+            # Страница зависит от шаблона, даже если его пока нет
+            deps = getattr(self.md, "dependencies", None)
+            if deps is not None:
+                deps.add(warn_file)
+
+            if warn_file in stack:
+                yield f"Template '{name}' includes itself."
+                continue
+
+            if len(stack) >= MAX_DEPTH:
+                yield f"Template '{name}' is nested too deep."
                 continue
 
             try:
-                content = warn_file.read_text(encoding="utf-8").splitlines()
-                out.extend(content)
-        
+                content = warn_templates.get(warn_file)
+
             except Exception as e:
-                out.append(f"Error reading '{name}': {e}")
-        
-        return out
+                yield f"Error reading '{name}': {e}"
+                continue
+
+            if content is None:
+                yield f"Template '{name}' not found."
+                continue
+
+            yield from self._expand(content, stack + (warn_file,))
+
+    def run(self, lines):
+        return list(self.iter_lines(lines))
 
 
 class WarnIncludeExtension(Extension):
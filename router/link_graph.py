@@ -0,0 +1,432 @@
+import json
+import posixpath
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, NamedTuple, Optional
+from urllib.parse import unquote, urljoin, urlsplit
+
+from .extensions.auto_link_btn_extension import AutoLinkButtonsTreeprocessor, _Args
+from .extensions.button_extension import ButtonTreeProcessor
+from .extensions.strip_comments_extension import StripCommentsPreprocessor
+from .extensions.warn_include_extension import MAX_DEPTH, WarnIncludePreprocessor
+from .extensions.wiki_link_extension import WikiLinkProcessor
+from .page_index import page_href
+from .render_cache import file_stamp
+
+LINKS_CACHE_VERSION = 1
+
+WIKI_LINK_RE = re.compile(WikiLinkProcessor.RE)
+MD_LINK_RE = re.compile(r"(?<![!\\])\[[^\]\n]*\]\(\s*<?([^)\s>]+)")
+# [^1]: - это сноска, а не ссылка
+REF_LINK_RE = re.compile(r"^ {0,3}\[(?!\^)[^\]\n]+\]:\s*<?([^\s>]+)", re.MULTILINE)
+HREF_RE = re.compile(r"""<a\s[^>]*?href\s*=\s*["']([^"']+)["']""", re.IGNORECASE)
+AUTO_LINK_RE = re.compile(AutoLinkButtonsTreeprocessor.RE.pattern, re.MULTILINE)
+CODE_RE = re.compile(r"^(```|~~~).*?^\1[^\n]*$|`[^`\n]+`", re.MULTILINE | re.DOTALL)
+# Ссылки с макросами зависят от констант, по исходнику их не проверить
+MACRO_RE = re.compile(r"!(const|img_url|redact)\[")
+
+LINK_RES = (WIKI_LINK_RE, ButtonTreeProcessor.RE, MD_LINK_RE, REF_LINK_RE, HREF_RE)
+
+
+class FileLinks(NamedTuple):
+    urls: tuple[str, ...]
+    # По кортежу исключений на каждый !auto_link_btn в файле
+    autos: tuple[tuple[str, ...], ...]
+    warns: tuple[str, ...]
+
+
+class Link(NamedTuple):
+    source: Path
+    url: str
+    target: Path
+
+
+def parse_links(text: str) -> FileLinks:
+    text = StripCommentsPreprocessor.RE.sub("", text)
+    text = CODE_RE.sub("", text)
+
+    urls = []
+    for regex in LINK_RES:
+        for m in regex.finditer(text):
+            url = m.group(1).strip()
+            if url and not MACRO_RE.search(url):
+                urls.append(url)
+
+    autos = []
+    for m in AUTO_LINK_RE.finditer(text):
+        exclude = str(_Args(m.group("args") or "").get("exclude", ""))
+        autos.append(tuple(x.strip().lower() for x in exclude.split(",") if x.strip()))
+
+    warns = tuple(
+        m.group("name").strip() for m in WarnIncludePreprocessor.RE.finditer(text)
+    )
+    return FileLinks(tuple(urls), tuple(autos), warns)
+
+
+class LinkGraph:
+    # Кто на кого ссылается внутри вики: блок «ссылаются сюда», битые
+    # ссылки и страницы-сироты. Ссылки достаются из исходников и кешируются
+    # по mtime, так что после правки перечитываются только изменившиеся
+    # файлы, а рёбра пересчитываются только у тех страниц, которых правка
+    # касается: сама страница, включающие её шаблон !warn и соседи по
+    # папке с !auto_link_btn, если страница появилась или пропала.
+
+    def __init__(self, wiki_dir: Path):
+        self.wiki_dir = Path(wiki_dir).resolve()
+        self.warn_dir = self.wiki_dir / "_warn"
+
+        self._files: dict[Path, tuple[Optional[int], FileLinks]] = {}
+        # Прямые ссылки из файла (страницы или шаблона) и обратно
+        self._links: dict[Path, list[Link]] = {}
+        self._linked_from: dict[Path, set[Path]] = {}
+        # Все ссылки страницы: свои, из шаблонов !warn и !auto_link_btn
+        self._targets: dict[Path, frozenset[Path]] = {}
+        self._backlinks: dict[Path, set[Path]] = {}
+        # Шаблоны !warn страницы вместе с вложенными и обратно
+        self._includes: dict[Path, frozenset[Path]] = {}
+        self._included_by: dict[Path, set[Path]] = {}
+        # Страницы по папкам и index.md подпапок по папке-родителю, для
+        # !auto_link_btn
+        self._folders: dict[Path, set[Path]] = {}
+        self._child_indexes: dict[Path, set[Path]] = {}
+        # Что поменялось с прошлого _relink(): разбор файла и набор страниц
+        self._dirty: set[Path] = set()
+        self._moved: set[Path] = set()
+        # Когда у страницы последний раз менялся список «ссылаются сюда»
+        self._changed_at: dict[Path, float] = {}
+        self._built = False
+        self._lock = threading.RLock()
+
+    def is_page(self, md_path: Path) -> bool:
+        # _warn и прочие служебные папки - это шаблоны, а не страницы
+        rel = md_path.relative_to(self.wiki_dir)
+        return not any(part.startswith("_") for part in rel.parts)
+
+    def build(self) -> None:
+        with self._lock:
+            self._built = True
+            self.refresh()
+
+    def refresh(self) -> set[Path]:
+        # Возвращает страницы, у которых поменялся список «ссылаются сюда»
+        with self._lock:
+            self._built = True
+            seen = set()
+            for md_file in self.wiki_dir.rglob("*.md"):
+                md_file = md_file.resolve()
+                seen.add(md_file)
+                self._update(md_file)
+
+            for gone in set(self._files) - seen:
+                self._remove(gone)
+
+            return self._relink()
+
+    def refresh_paths(self, paths: Iterable[Path]) -> set[Path]:
+        with self._lock:
+            if not self._built:
+                return set()
+
+            for path in paths:
+                path = Path(path).resolve()
+                if not path.is_relative_to(self.wiki_dir):
+                    continue
+
+                if path.is_dir():
+                    for md_file in path.rglob("*.md"):
+                        self._update(md_file.resolve())
+
+                for known in [p for p in self._files if p.is_relative_to(path)]:
+                    self._update(known)
+
+                if path.suffix == ".md":
+                    self._update(path)
+
+            return self._relink()
+
+    def load(self, path: Path) -> bool:
+        # Разобранные ссылки с прошлого запуска, для CLI: refresh() потом
+        # перечитает только файлы с другим mtime
+        try:
+            data = json.loads(Path(path).read_text(encoding="utf-8"))
+
+        except (FileNotFoundError, ValueError):
+            return False
+
+        if data.get("version") != LINKS_CACHE_VERSION:
+            return False
+
+        with self._lock:
+            for rel, (stamp, urls, autos, warns) in data["files"].items():
+                links = FileLinks(tuple(urls), tuple(map(tuple, autos)), tuple(warns))
+                self._store(self.wiki_dir / rel, stamp, links)
+
+        return True
+
+    def save(self, path: Path) -> None:
+        with self._lock:
+            files = {
+                str(p.relative_to(self.wiki_dir)): [stamp, *links]
+                for p, (stamp, links) in sorted(self._files.items())
+            }
+
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(
+            json.dumps(
+                {"version": LINKS_CACHE_VERSION, "files": files}, ensure_ascii=False
+            ),
+            encoding="utf-8",
+        )
+
+    def backlinks(self, md_path: Path) -> list[Path]:
+        self._ensure_built()
+        with self._lock:
+            return sorted(self._backlinks.get(Path(md_path).resolve(), ()))
+
+    def changed_at(self, md_path: Path) -> float:
+        with self._lock:
+            return self._changed_at.get(Path(md_path).resolve(), 0.0)
+
+    def outgoing(self, md_path: Path) -> list[Link]:
+        self._ensure_built()
+        with self._lock:
+            return list(self._links.get(Path(md_path).resolve(), ()))
+
+    def dead_links(self) -> list[Link]:
+        self._ensure_built()
+        with self._lock:
+            return [
+                link
+                for source in sorted(self._links)
+                for link in self._links[source]
+                if link.target not in self._files
+            ]
+
+    def orphans(self) -> list[Path]:
+        # Главная страница - точка входа, ссылок на неё не ждём
+        self._ensure_built()
+        root = self.wiki_dir / "index.md"
+        with self._lock:
+            return sorted(
+                p
+                for p in self._files
+                if p != root and self.is_page(p) and not self._backlinks.get(p)
+            )
+
+    def resolve(self, source: Path, url: str) -> Optional[Path]:
+        # Так же, как роут /wiki/{page}: папка или хвостовой слеш - index.md,
+        # иначе .md. Всё, что ведёт не в вики, не проверяется
+        parts = urlsplit(url)
+        if parts.scheme or parts.netloc or not parts.path:
+            return None
+
+        path = urljoin(page_href(self.wiki_dir, source), unquote(parts.path))
+        trailing = path.endswith("/")
+        path = posixpath.normpath(path)
+        if path == "/wiki/static" or path.startswith("/wiki/static/"):
+            return None
+
+        if path != "/wiki" and not path.startswith("/wiki/"):
+            return None
+
+        target = self.wiki_dir / path[len("/wiki/") :]
+        if trailing or target == self.wiki_dir or target.is_dir():
+            return target / "index.md"
+
+        return target.with_suffix(".md")
+
+    def _ensure_built(self) -> None:
+        if not self._built:
+            self.build()
+
+    def _update(self, md_path: Path) -> None:
+        stamp = file_stamp(md_path)
+        if stamp is None:
+            self._remove(md_path)
+            return
+
+        cached = self._files.get(md_path)
+        if cached is not None and cached[0] == stamp:
+            return
+
+        try:
+            text = md_path.read_text(encoding="utf-8")
+
+        except (OSError, UnicodeDecodeError):
+            self._remove(md_path)
+            return
+
+        self._store(md_path, stamp, parse_links(text))
+
+    def _store(self, md_path: Path, stamp: Optional[int], links: FileLinks) -> None:
+        cached = self._files.get(md_path)
+        self._files[md_path] = (stamp, links)
+        if cached is None:
+            self._move(md_path, added=True)
+
+        # Правка текста без ссылок (заголовок, абзац) рёбер не трогает
+        if cached is None or cached[1] != links:
+            self._dirty.add(md_path)
+
+    def _remove(self, md_path: Path) -> None:
+        if self._files.pop(md_path, None) is not None:
+            self._move(md_path, added=False)
+            self._dirty.add(md_path)
+
+    def _move(self, md_path: Path, added: bool) -> None:
+        if not self.is_page(md_path):
+            return
+
+        indexes = [(self._folders, md_path.parent)]
+        if md_path.name == "index.md":
+            indexes.append((self._child_indexes, md_path.parent.parent))
+
+        for index, key in indexes:
+            if added:
+                index.setdefault(key, set()).add(md_path)
+
+            else:
+                _discard(index, key, md_path)
+
+        self._moved.add(md_path)
+
+    def _relink(self) -> set[Path]:
+        dirty, self._dirty = self._dirty, set()
+        moved, self._moved = self._moved, set()
+
+        # Появилась или пропала папка: ссылка на неё ведёт уже не туда
+        # (folder.md или folder/index.md, см. resolve())
+        sources = set(dirty)
+        for page in moved:
+            folder = page.parent
+            if folder != self.wiki_dir:
+                for target in (folder.with_suffix(".md"), folder / "index.md"):
+                    sources.update(self._linked_from.get(target, ()))
+
+        for source in sources:
+            for link in self._links.pop(source, ()):
+                _discard(self._linked_from, link.target, source)
+
+            cached = self._files.get(source)
+            if cached is None:
+                continue
+
+            resolved = [(url, self.resolve(source, url)) for url in cached[1].urls]
+            links = [Link(source, url, target) for url, target in resolved if target]
+            self._links[source] = links
+            for link in links:
+                self._linked_from.setdefault(link.target, set()).add(source)
+
+        pages = set(moved)
+        for source in sources:
+            if self.is_page(source):
+                pages.add(source)
+            pages.update(self._included_by.get(source, ()))
+
+        # Соседи по папке с !auto_link_btn выводят и новую страницу
+        for page in moved:
+            neighbours = set(self._folders.get(page.parent, ()))
+            if page.name == "index.md":
+                neighbours.update(self._folders.get(page.parent.parent, ()))
+
+            pages.update(p for p in neighbours if self._files[p][1].autos)
+
+        changed: set[Path] = set()
+        for page in pages:
+            old = self._targets.pop(page, frozenset())
+            new = self._collect_targets(page)
+            if new:
+                self._targets[page] = new
+
+            for target in old - new:
+                _discard(self._backlinks, target, page)
+            for target in new - old:
+                self._backlinks.setdefault(target, set()).add(page)
+
+            changed.update(old ^ new)
+
+        now = time.time()
+        for target in changed:
+            self._changed_at[target] = now
+
+        return changed
+
+    def _collect_targets(self, page: Path) -> frozenset[Path]:
+        for warn_file in self._includes.pop(page, ()):
+            _discard(self._included_by, warn_file, page)
+
+        cached = self._files.get(page)
+        if cached is None:
+            return frozenset()
+
+        parsed = cached[1]
+        targets = {link.target for link in self._links.get(page, ())}
+
+        # Ссылки из шаблонов !warn попадают в страницу вместе с текстом
+        included = self._included(parsed)
+        for warn_file in included:
+            targets.update(link.target for link in self._links.get(warn_file, ()))
+            self._included_by.setdefault(warn_file, set()).add(page)
+
+        if included:
+            self._includes[page] = frozenset(included)
+
+        for exclude in parsed.autos:
+            targets.update(self._auto_links(page, exclude))
+
+        targets.discard(page)
+        return frozenset(targets)
+
+    def _included(self, parsed: FileLinks) -> set[Path]:
+        # Шаблоны !warn страницы вместе с вложенными
+        seen: set[Path] = set()
+        level = [parsed]
+        for _ in range(MAX_DEPTH):
+            nested = []
+            for links in level:
+                for name in links.warns:
+                    warn_file = (self.warn_dir / f"{name}.md").resolve()
+                    cached = self._files.get(warn_file)
+                    if warn_file not in seen and cached is not None:
+                        nested.append(cached[1])
+                    seen.add(warn_file)
+
+            level = nested
+
+        return seen
+
+    def _auto_links(self, source: Path, exclude: tuple[str, ...]) -> Iterable[Path]:
+        # То же, что выводит !auto_link_btn: соседи по папке и index.md подпапок
+        folder = source.parent
+        for page in self._folders.get(folder, ()):
+            if page.stem.lower() not in exclude:
+                yield page
+
+        for index in self._child_indexes.get(folder, ()):
+            if index.parent.name.lower() not in exclude:
+                yield index
+
+
+def _discard(index: dict[Path, set[Path]], key: Path, value: Path) -> None:
+    values = index.get(key)
+    if values is not None:
+        values.discard(value)
+        if not values:
+            del index[key]
+
+
+_graphs: dict[Path, LinkGraph] = {}
+_graphs_lock = threading.Lock()
+
+
+def get_link_graph(wiki_dir: Path) -> LinkGraph:
+    wiki_dir = Path(wiki_dir).resolve()
+    with _graphs_lock:
+        graph = _graphs.get(wiki_dir)
+        if graph is None:
+            graph = _graphs[wiki_dir] = LinkGraph(wiki_dir)
+
+    return graph
@@ -0,0 +1,140 @@
+import bisect
+import math
+import os
+import resource
+import time
+from typing import Iterable, Optional
+
+# Границы корзин задержек, секунды
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+START_TIME = time.time()
+
+Labels = tuple[tuple[str, str], ...]
+Sample = tuple[str, Labels, float]
+
+
+class Histogram:
+    # Без блокировок: пишут в него только из event loop (мидлварь и
+    # корутины роутов), и /metrics читает оттуда же, так что горячий путь
+    # ни с кем не делит замок
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        # метки -> [счётчики по корзинам, последняя - +Inf], сумма
+        self.series: dict[Labels, list] = {}
+
+    def observe(self, labels: Labels, value: float) -> None:
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def samples(self, name: str) -> list[Sample]:
+        return histogram_samples(
+            name,
+            self.buckets,
+            [
+                (labels, counts, total)
+                for labels, (counts, total) in self.series.items()
+            ],
+        )
+
+
+def histogram_samples(
+    name: str, buckets: tuple, series: Iterable[tuple[Labels, list[int], float]]
+) -> list[Sample]:
+    samples = []
+    for labels, counts, total in sorted(series):
+        cumulative = 0
+        for bound, count in zip([*buckets, math.inf], counts):
+            cumulative += count
+            le = "+Inf" if bound == math.inf else format_value(bound)
+            samples.append((f"{name}_bucket", labels + (("le", le),), cumulative))
+
+        samples.append((f"{name}_sum", labels, total))
+        samples.append((f"{name}_count", labels, cumulative))
+
+    return samples
+
+
+request_latency = Histogram()
+render_latency = Histogram()
+
+
+class MetricsMiddleware:
+    # Чистая ASGI-мидлварь: BaseHTTPMiddleware гоняет тело через лишние
+    # очереди. Маршрут берётся шаблоном (/wiki/{page:path}), а не путём,
+    # иначе меток будет по числу страниц
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_status)
+
+        finally:
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            labels = (("route", route), ("status", str(status)))
+            request_latency.observe(labels, time.perf_counter() - start)
+
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+
+    if float(value).is_integer():
+        return str(int(value))
+
+    return repr(float(value))
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def exposition(families: Iterable[tuple[str, str, str, list[Sample]]]) -> str:
+    # Текстовый формат Prometheus 0.0.4: (имя, тип, описание, значения)
+    lines = []
+    for name, kind, help_text, samples in families:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for sample_name, labels, value in samples:
+            if labels:
+                pairs = ",".join(f'{k}="{escape_label(v)}"' for k, v in labels)
+                sample_name = f"{sample_name}{{{pairs}}}"
+            lines.append(f"{sample_name} {format_value(value)}")
+
+    return "\n".join(lines) + "\n"
+
+
+def process_rss() -> Optional[int]:
+    # Текущий RSS из /proc, где его нет - пиковый из getrusage
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+    except (OSError, ValueError, IndexError):
+        pass
+
+    try:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    except (OSError, ValueError):
+        return None
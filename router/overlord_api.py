@@ -1,8 +1,316 @@
-from fastapi import APIRouter
+import hmac
+import os
+import time
+from typing import Any, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, ValidationError
+
+from data_control.constants import Constants, constants_service, parse_constants
+
+from .extensions.warn_include_extension import warn_templates
+from .metrics import (
+    START_TIME,
+    exposition,
+    histogram_samples,
+    process_rss,
+    render_latency,
+    request_latency,
+)
+from .page_index import page_href
+from .render_cache import render_cache
+from .render_pool import render_executor
+from .renderer import WIKI_DIR
+from .timing import TIMING_ENABLED, stage_stats
+from .wiki_render import render_flight
+from .wiki_search import search_service
 
 router = APIRouter()
 
 
+class ConstantsPush(BaseModel):
+    # Новые значения и удалённые ключи. Если пришли только keys, значения
+    # именно этих ключей забираются из /config самого overlord. Значения
+    # любые, к строкам они приводятся так же, как при опросе, через
+    # parse_constants()
+    constants: dict[str, Any] = {}
+    removed: list[str] = []
+    keys: list[str] = []
+
+
+def check_token(authorization: Optional[str] = Header(None)) -> None:
+    # Без OVERLORD_PUSH_TOKEN пуш выключен совсем
+    token = os.getenv("OVERLORD_PUSH_TOKEN", "")
+    if not token:
+        raise HTTPException(status_code=403, detail="Push is disabled")
+
+    scheme, _, value = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(
+        value.strip().encode(), token.encode()
+    ):
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+
 @router.get("/ping")
 async def ping_overlord():
     return {"ok": True}
+
+
+@router.get("/metrics")
+async def metrics():
+    # Счётчики этого процесса: под несколькими воркерами uvicorn каждый
+    # отдаёт свои
+    return Response(
+        content=exposition(metric_families()),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+def metric_families() -> list:
+    def value(name: str, kind: str, help_text: str, number: float) -> tuple:
+        return name, kind, help_text, [(name, (), number)]
+
+    cache = render_cache.stats()
+    lookups = cache["hits"] + cache["misses"]
+    executor = render_executor.stats()
+    flight = render_flight.stats()
+    constants = Constants.snapshot()
+    service = constants_service.stats()
+    now = time.time()
+
+    families = [
+        (
+            "wiki_http_request_duration_seconds",
+            "histogram",
+            "HTTP request latency by route template and status.",
+            request_latency.samples("wiki_http_request_duration_seconds"),
+        ),
+        (
+            "wiki_render_duration_seconds",
+            "histogram",
+            "Markdown render time in the render pool, queue included.",
+            render_latency.samples("wiki_render_duration_seconds"),
+        ),
+        value("wiki_render_cache_entries", "gauge", "Cached pages.", cache["size"]),
+        value(
+            "wiki_render_cache_max_entries",
+            "gauge",
+            "Render cache capacity.",
+            cache["max_entries"],
+        ),
+        value(
+            "wiki_render_cache_hits_total",
+            "counter",
+            "Render cache hits.",
+            cache["hits"],
+        ),
+        value(
+            "wiki_render_cache_misses_total",
+            "counter",
+            "Render cache misses.",
+            cache["misses"],
+        ),
+        value(
+            "wiki_render_cache_hit_ratio",
+            "gauge",
+            "Render cache hits over all lookups since start.",
+            cache["hits"] / lookups if lookups else 0.0,
+        ),
+        value(
+            "wiki_render_cache_evictions_total",
+            "counter",
+            "Pages evicted from the render cache.",
+            cache["evictions"],
+        ),
+        value(
+            "wiki_render_cache_invalidations_total",
+            "counter",
+            "Pages invalidated in the render cache.",
+            cache["invalidations"],
+        ),
+        value(
+            "wiki_render_shared_total",
+            "counter",
+            "Requests that waited for a render started by another request.",
+            flight["shared"],
+        ),
+        value(
+            "wiki_render_executor_workers",
+            "gauge",
+            "Render pool size.",
+            executor["workers"],
+        ),
+        value(
+            "wiki_render_executor_queued",
+            "gauge",
+            "Renders waiting for a free worker.",
+            executor["queued"],
+        ),
+        value(
+            "wiki_render_executor_running",
+            "gauge",
+            "Renders in progress.",
+            executor["running"],
+        ),
+        value(
+            "wiki_render_executor_peak_queued",
+            "gauge",
+            "Largest render queue seen since start.",
+            executor["peak_queued"],
+        ),
+        value(
+            "wiki_render_executor_completed_total",
+            "counter",
+            "Finished renders.",
+            executor["completed"],
+        ),
+        value(
+            "wiki_render_executor_failed_total",
+            "counter",
+            "Renders that raised.",
+            executor["failed"],
+        ),
+        value(
+            "wiki_render_executor_rejected_total",
+            "counter",
+            "Renders rejected with 503 because the queue was full.",
+            executor["rejected"],
+        ),
+        value(
+            "wiki_constants_version",
+            "gauge",
+            "Version of the constants snapshot in use.",
+            constants.version,
+        ),
+        value(
+            "wiki_constants_age_seconds",
+            "gauge",
+            "Time since the constants values last changed.",
+            now - constants.updated_at if constants.updated_at else 0.0,
+        ),
+        value(
+            "wiki_constants_refresh_age_seconds",
+            "gauge",
+            "Time since the last successful fetch from overlord.",
+            now - service["last_success"] if service["last_success"] else 0.0,
+        ),
+        value(
+            "wiki_constants_refreshes_total",
+            "counter",
+            "Successful fetches from overlord.",
+            service["refreshes"],
+        ),
+        value(
+            "wiki_constants_refresh_failures_total",
+            "counter",
+            "Failed fetches from overlord.",
+            service["failures"],
+        ),
+        value(
+            "wiki_constants_pushes_total",
+            "counter",
+            "Constant updates pushed by overlord.",
+            service["pushes"],
+        ),
+        value(
+            "wiki_warn_template_loads_total",
+            "counter",
+            "!warn template file reads.",
+            warn_templates.loads,
+        ),
+        value(
+            "wiki_search_rebuilds_total",
+            "counter",
+            "Search index rebuilds.",
+            search_service.rebuilds,
+        ),
+        value(
+            "process_cpu_seconds_total",
+            "counter",
+            "User and system CPU time of the process.",
+            time.process_time(),
+        ),
+        value(
+            "process_start_time_seconds",
+            "gauge",
+            "Process start time, unix seconds.",
+            START_TIME,
+        ),
+    ]
+
+    rss = process_rss()
+    if rss is not None:
+        families.append(
+            value("process_resident_memory_bytes", "gauge", "Resident memory.", rss)
+        )
+
+    if TIMING_ENABLED:
+        # Гистограммы WIKI_TIMING в мс, тут - в секундах
+        families.append(
+            (
+                "wiki_stage_duration_seconds",
+                "histogram",
+                "Time per render stage and Markdown processor (WIKI_TIMING).",
+                histogram_samples(
+                    "wiki_stage_duration_seconds",
+                    tuple(b / 1000 for b in stage_stats.buckets),
+                    [
+                        ((("stage", name),), counts, total / 1000)
+                        for name, counts, total in stage_stats.series()
+                    ],
+                ),
+            )
+        )
+
+    return families
+
+
+async def read_push(request: Request) -> ConstantsPush:
+    # Тело разбирается в зависимости после check_token: объявленное
+    # параметром, FastAPI читал бы и проверял его до любой авторизации
+    try:
+        return ConstantsPush.model_validate_json(await request.body())
+
+    except ValidationError as e:
+        raise RequestValidationError(
+            [{**err, "loc": ("body", *err["loc"])} for err in e.errors()]
+        )
+
+
+@router.post("/overlord/constants")
+async def push_constants(
+    _: None = Depends(check_token), push: ConstantsPush = Depends(read_push)
+):
+    # Пуш долетает до одного воркера uvicorn, остальные догонят опросом
+    # Кто что использует - до изменения: привязанные к версии страницы
+    # выкидываются из кеша прямо в нём
+    users = render_cache.const_users()
+    if push.constants or push.removed:
+        changed = await constants_service.apply(
+            parse_constants(push.constants), push.removed
+        )
+
+    else:
+        # Пустой пуш - просто внеочередной опрос
+        refreshed = await (
+            constants_service.refresh_keys(push.keys)
+            if push.keys
+            else constants_service.refresh()
+        )
+        if refreshed is None:
+            raise HTTPException(status_code=502, detail="Cannot fetch constants")
+
+        changed = refreshed
+
+    # Сами страницы перерисовываются лениво, при следующем запросе
+    pages = {page for key in changed for page in users.get(key, ())}
+    return {
+        "version": Constants.get_version(),
+        "changed": sorted(changed),
+        "pages": sorted(page_href(WIKI_DIR, page) for page in pages),
+    }
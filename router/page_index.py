@@ -0,0 +1,242 @@
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, NamedTuple, Optional
+
+from markdown import Markdown
+
+RU_MONTHS = {
+    "января": 1,
+    "февраля": 2,
+    "марта": 3,
+    "апреля": 4,
+    "мая": 5,
+    "июня": 6,
+    "июля": 7,
+    "августа": 8,
+    "сентября": 9,
+    "октября": 10,
+    "ноября": 11,
+    "декабря": 12,
+}
+
+
+class PageInfo(NamedTuple):
+    path: Path
+    title: Optional[str]
+    date: str  # ISO, уже с фоллбеком на mtime
+    background: Optional[str]
+    mtime: float
+    href: str
+
+
+def page_href(wiki_dir: Path, md_path: Path) -> str:
+    rel = md_path.relative_to(wiki_dir).with_suffix("")
+    return "/wiki/" + str(rel).replace("\\", "/")
+
+
+def parse_date(raw: Optional[str], fallback_ts: float) -> datetime:
+    if not raw:
+        return datetime.fromtimestamp(fallback_ts)
+
+    raw = raw.strip()
+    for fmt in ("%Y-%m-%d", "%Y/%m/%d", "%d.%m.%Y"):
+        try:
+            return datetime.strptime(raw, fmt)
+
+        except ValueError:
+            pass
+
+    parts = raw.split()
+    if len(parts) >= 3:
+        try:
+            day = int(parts[0])
+            month = RU_MONTHS[parts[1].lower()]
+            year = int(parts[2])
+            return datetime(year, month, day)
+
+        except Exception:
+            pass
+
+    return datetime.fromtimestamp(fallback_ts)
+
+
+class PageIndex:
+    # Мета всех страниц вики в памяти: !auto_link_btn и прочие списки
+    # страниц берут данные отсюда, а не лезут в файловую систему.
+
+    def __init__(self, wiki_dir: Path):
+        self.wiki_dir = Path(wiki_dir).resolve()
+        self.generation = 0
+
+        self._pages: dict[Path, PageInfo] = {}
+        self._by_folder: dict[Path, dict[Path, PageInfo]] = {}
+        # index.md подпапок, сгруппированные по папке уровнем выше
+        self._sub_indexes: dict[Path, dict[Path, PageInfo]] = {}
+        self._built = False
+        self._lock = threading.RLock()
+        self._meta_md = Markdown(extensions=["meta"])
+
+    def build(self) -> None:
+        with self._lock:
+            self._pages.clear()
+            self._by_folder.clear()
+            self._sub_indexes.clear()
+            self._built = True
+            self.refresh()
+
+    def refresh(self) -> None:
+        # Инкрементально: перечитываются только файлы с изменившимся mtime
+        with self._lock:
+            self._built = True
+            seen = set()
+            for md_file in self.wiki_dir.rglob("*.md"):
+                md_file = md_file.resolve()
+                seen.add(md_file)
+                self._update(md_file)
+
+            for gone in set(self._pages) - seen:
+                self._remove(gone)
+
+    def refresh_paths(self, paths: Iterable[Path]) -> None:
+        with self._lock:
+            if not self._built:
+                return
+
+            for path in paths:
+                path = Path(path).resolve()
+                if not path.is_relative_to(self.wiki_dir):
+                    continue
+
+                if path.suffix == ".md" and not path.is_dir():
+                    self._update(path)
+
+                elif path.is_dir():
+                    for md_file in path.glob("*.md"):
+                        self._update(md_file.resolve())
+
+                    for known in list(self._by_folder.get(path, {})):
+                        self._update(known)
+
+                else:
+                    # Папку снесли целиком
+                    for known in [p for p in self._pages if p.is_relative_to(path)]:
+                        self._remove(known)
+
+    def get(self, md_path: Path) -> Optional[PageInfo]:
+        self._ensure_built()
+        with self._lock:
+            return self._pages.get(Path(md_path).resolve())
+
+    def children(self, folder: Path) -> tuple[list[PageInfo], list[PageInfo]]:
+        # (страницы в папке, index.md подпапок) в том же порядке, что давали
+        # sorted(glob("*.md")) и sorted(iterdir())
+        self._ensure_built()
+        folder = Path(folder).resolve()
+        with self._lock:
+            files = sorted(
+                self._by_folder.get(folder, {}).values(), key=lambda p: p.path
+            )
+            indexes = sorted(
+                self._sub_indexes.get(folder, {}).values(), key=lambda p: p.path
+            )
+
+        return files, indexes
+
+    def pages(self) -> list[PageInfo]:
+        self._ensure_built()
+        with self._lock:
+            return sorted(self._pages.values(), key=lambda p: p.path)
+
+    def _ensure_built(self) -> None:
+        if not self._built:
+            self.build()
+
+    def _update(self, md_path: Path) -> None:
+        try:
+            st = md_path.stat()
+
+        except OSError:
+            self._remove(md_path)
+            return
+
+        old = self._pages.get(md_path)
+        if old is not None and old.mtime == st.st_mtime:
+            return
+
+        meta = self._read_meta(md_path)
+        info = PageInfo(
+            path=md_path,
+            title=meta.get("title"),
+            date=parse_date(meta.get("date"), st.st_mtime).isoformat(),
+            background=meta.get("background"),
+            mtime=st.st_mtime,
+            href=self._href_from(md_path),
+        )
+
+        self._pages[md_path] = info
+        self._by_folder.setdefault(md_path.parent, {})[md_path] = info
+        if md_path.name == "index.md":
+            self._sub_indexes.setdefault(md_path.parent.parent, {})[md_path] = info
+
+        self.generation += 1
+
+    def _remove(self, md_path: Path) -> None:
+        if self._pages.pop(md_path, None) is None:
+            return
+
+        for group, key in (
+            (self._by_folder, md_path.parent),
+            (self._sub_indexes, md_path.parent.parent),
+        ):
+            pages = group.get(key)
+            if pages is not None:
+                pages.pop(md_path, None)
+                if not pages:
+                    del group[key]
+
+        self.generation += 1
+
+    def _href_from(self, md_path: Path) -> str:
+        return page_href(self.wiki_dir, md_path)
+
+    def _read_meta(self, md_path: Path) -> dict[str, str]:
+        try:
+            text = md_path.read_text(encoding="utf-8")
+        except FileNotFoundError:
+            return {}
+
+        head = []
+        for line in text.splitlines():
+            if not line.strip():
+                break
+
+            head.append(line)
+        head_text = "\n".join(head)
+
+        md = self._meta_md
+        md.reset()
+        md.convert(head_text)
+
+        meta = {}
+        for k, v in getattr(md, "Meta", {}).items():
+            if isinstance(v, list):
+                meta[k.lower()] = v[0]
+            else:
+                meta[k.lower()] = str(v)
+
+        return meta
+
+
+_indexes: dict[Path, PageIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_page_index(wiki_dir: Path) -> PageIndex:
+    wiki_dir = Path(wiki_dir).resolve()
+    with _indexes_lock:
+        index = _indexes.get(wiki_dir)
+        if index is None:
+            index = _indexes[wiki_dir] = PageIndex(wiki_dir)
+
+    return index
@@ -0,0 +1,243 @@
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Iterable, NamedTuple, Optional
+
+from .renderer import RenderedPage
+
+
+def file_stamp(path: Path) -> Optional[int]:
+    # None тоже валидный штамп: файла не было, и если он появится - кеш протух
+    try:
+        return path.stat().st_mtime_ns
+
+    except OSError:
+        return None
+
+
+class CacheEntry(NamedTuple):
+    page: RenderedPage
+    stamps: dict[Path, Optional[int]]
+    # None - константы в странице слотами и подставляются при отдаче,
+    # такая запись годится для любой версии
+    const_version: Optional[int]
+    # Производные от page, которые считаются один раз на запись (тело
+    # ответа, ETag и т.п.), живут и умирают вместе с ней
+    artifacts: dict
+
+
+class RenderCache:
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[Path, CacheEntry] = OrderedDict()
+        # Обратный индекс: файл -> страницы, которые от него зависят
+        self._dependents: dict[Path, set[Path]] = {}
+        # И так же для констант: ключ -> страницы, где он есть
+        self._const_users: dict[str, set[Path]] = {}
+        self._lock = threading.Lock()
+
+        # Пока изменения ловит вотчер, штампы на каждом хите не проверяются
+        self.validate_stamps = True
+        # Растёт при каждой инвалидации, см. put()
+        self.generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+        # Кому сообщать об изменившихся файлах, замеченных при проверке.
+        # get() зовут из event loop, так что сами файлы копятся тут, а
+        # слушатели зовутся из process_stale() в тредпуле
+        self._stale_listeners: list[Callable[[Iterable[Path]], None]] = []
+        self._stale: set[Path] = set()
+        self._stale_lock = threading.Lock()
+
+    def on_stale(self, listener: Callable[[Iterable[Path]], None]) -> None:
+        self._stale_listeners.append(listener)
+
+    def has_stale(self) -> bool:
+        return bool(self._stale)
+
+    def process_stale(self) -> None:
+        # Блокирующий: слушатели перечитывают файлы. Второй вызов ждёт
+        # первого, чтобы рендер после него видел уже обновлённые индексы
+        with self._stale_lock:
+            with self._lock:
+                changed, self._stale = self._stale, set()
+
+            if changed:
+                for listener in self._stale_listeners:
+                    listener(changed)
+
+    def get(self, md_path: Path, const_version: int) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self._entries.get(md_path)
+
+        if entry is None or not self._is_fresh(entry, const_version):
+            with self._lock:
+                self.misses += 1
+
+            return None
+
+        with self._lock:
+            self.hits += 1
+            if md_path in self._entries:
+                self._entries.move_to_end(md_path)
+
+        return entry
+
+    def peek(self, md_path: Path, const_version: int) -> Optional[CacheEntry]:
+        # Как get(), но для фоновых читателей вроде поиска: не двигает ни
+        # счётчики, ни очередь вытеснения
+        with self._lock:
+            entry = self._entries.get(md_path)
+
+        if entry is None or not self._is_fresh(entry, const_version):
+            return None
+
+        return entry
+
+    def put(
+        self,
+        md_path: Path,
+        page: RenderedPage,
+        const_version: Optional[int],
+        page_stamp: Optional[int],
+        generation: Optional[int] = None,
+        extra_dependencies: Iterable[Path] = (),
+        artifacts: Optional[dict] = None,
+    ) -> CacheEntry:
+        # Штамп самой страницы снимается до чтения файла, чтобы правка,
+        # прилетевшая во время рендера, не осела в кеше как свежая
+        dependencies = page.dependencies.union(extra_dependencies)
+        stamps = {dep: file_stamp(dep) for dep in dependencies}
+        stamps[md_path] = page_stamp
+        entry = CacheEntry(page, stamps, const_version, dict(artifacts or {}))
+
+        with self._lock:
+            # Пока страница рендерилась, вотчер мог что-то инвалидировать,
+            # такой результат лучше не кешировать вовсе
+            if generation is not None and generation != self.generation:
+                return entry
+
+            self._drop(md_path)
+            self._entries[md_path] = entry
+            for dep in stamps:
+                self._dependents.setdefault(dep, set()).add(md_path)
+            for key in page.const_keys:
+                self._const_users.setdefault(key, set()).add(md_path)
+
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+        return entry
+
+    def invalidate(self, md_path: Optional[Path] = None) -> None:
+        with self._lock:
+            self.generation += 1
+            if md_path is None:
+                self.invalidations += len(self._entries)
+                self._entries.clear()
+                self._dependents.clear()
+                self._const_users.clear()
+
+            elif self._drop(md_path):
+                self.invalidations += 1
+
+    def invalidate_paths(self, paths: Iterable[Path]) -> int:
+        # Выкидывает ровно те страницы, что зависят от изменившихся файлов
+        with self._lock:
+            self.generation += 1
+            pages: set[Path] = set()
+            for path in paths:
+                pages.update(self._dependents.get(path, ()))
+
+            dropped = sum(1 for page in pages if self._drop(page))
+            self.invalidations += dropped
+
+        return dropped
+
+    def invalidate_constants(self, keys: Iterable[str], version: int) -> set[Path]:
+        # Константы keys поменялись, и их новая версия - version. Страницы со
+        # слотами и так подставят свежие значения при отдаче, а привязанные к
+        # версии выкидываются, только если в них есть эти ключи. Остальные
+        # переезжают на новую версию без перерендера. Возвращает страницы
+        # из кеша, где встречаются ключи. Поколение не двигается: рендер,
+        # начатый со старыми значениями, и так не пройдёт проверку версии
+        with self._lock:
+            pages: set[Path] = set()
+            for key in keys:
+                pages.update(self._const_users.get(key, ()))
+
+            for md_path, entry in list(self._entries.items()):
+                if entry.const_version is None:
+                    continue
+
+                if md_path in pages:
+                    self._drop(md_path)
+                    self.invalidations += 1
+
+                elif entry.const_version == version - 1:
+                    self._entries[md_path] = entry._replace(const_version=version)
+
+        return pages
+
+    def const_users(self) -> dict[str, set[Path]]:
+        with self._lock:
+            return {key: set(pages) for key, pages in self._const_users.items()}
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def _drop(self, md_path: Path) -> bool:
+        entry = self._entries.pop(md_path, None)
+        if entry is None:
+            return False
+
+        for dep in entry.stamps:
+            pages = self._dependents.get(dep)
+            if pages is not None:
+                pages.discard(md_path)
+                if not pages:
+                    del self._dependents[dep]
+
+        for key in entry.page.const_keys:
+            pages = self._const_users.get(key)
+            if pages is not None:
+                pages.discard(md_path)
+                if not pages:
+                    del self._const_users[key]
+
+        return True
+
+    def _is_fresh(self, entry: CacheEntry, const_version: int) -> bool:
+        if entry.const_version is not None and entry.const_version != const_version:
+            return False
+
+        if not self.validate_stamps:
+            return True
+
+        changed = [
+            dep for dep, stamp in entry.stamps.items() if file_stamp(dep) != stamp
+        ]
+        if changed:
+            with self._lock:
+                self._stale.update(changed)
+
+            return False
+
+        return True
+
+
+render_cache = RenderCache(int(os.getenv("WIKI_RENDER_CACHE_SIZE", "512")))
@@ -0,0 +1,238 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+import template_env
+from .extensions.warn_include_extension import warn_templates
+from .page_index import get_page_index
+from .render_cache import file_stamp
+from .renderer import WIKI_DIR, RenderedPage, get_renderer
+
+# (штамп страницы, страница, время стадий рендера в мс при WIKI_TIMING)
+RenderResult = tuple[Optional[int], RenderedPage, dict[str, float]]
+
+
+class RenderQueueFull(Exception):
+    pass
+
+
+def render_file(md_path: Path, constants: dict[str, str]) -> Optional[RenderResult]:
+    # Штамп снимается до чтения, см. RenderCache.put()
+    page_stamp = file_stamp(md_path)
+    start = time.perf_counter()
+    try:
+        content = md_path.read_text(encoding="utf-8")
+
+    except FileNotFoundError:
+        return None
+
+    read_ms = (time.perf_counter() - start) * 1000
+    renderer = get_renderer()
+    # Страница с константами-слотами, значения подставляются при отдаче
+    page = renderer.render(md_path, content, constants, deferred=True)
+    timings = renderer.take_timings()
+    if timings:
+        timings["read"] = read_ms
+
+    return page_stamp, page, timings
+
+
+# region process backend
+
+# Поколения индекса и статики в главном процессе, которые воркер уже видел
+_seen: dict[str, Optional[int]] = {"index": None, "static": None}
+
+
+def _init_worker(
+    image_manifest: Path,
+    index_generation: int,
+    static_generation: int,
+    validate_static_stamps: bool,
+) -> None:
+    # Всё дорогое - один раз на процесс: Markdown со всеми расширениями и
+    # индекс страниц собираются заранее, до первого запроса
+    template_env.load_image_manifest(image_manifest)
+    # С вотчером в главном процессе хеши статики сбрасываются по поколению
+    template_env.validate_static_stamps = validate_static_stamps
+    get_renderer()
+    get_page_index(WIKI_DIR).build()
+    _seen["index"] = index_generation
+    _seen["static"] = static_generation
+
+
+def _ping() -> None:
+    pass
+
+
+def _render_in_worker(
+    md_path: Path,
+    constants: dict[str, str],
+    index_generation: int,
+    static_generation: int,
+) -> Optional[RenderResult]:
+    # Вотчер живёт в главном процессе, так что о правках воркер узнаёт
+    # по сменившимся поколениям и догоняет их сам
+    if _seen["index"] != index_generation:
+        # Шаблоны !warn - тоже .md, их правка двигает поколение индекса
+        get_page_index(WIKI_DIR).refresh()
+        warn_templates.invalidate()
+
+    if _seen["static"] != static_generation:
+        template_env.invalidate_static_versions()
+
+    _seen["index"] = index_generation
+    _seen["static"] = static_generation
+
+    return render_file(md_path, constants)
+
+
+# endregion
+
+
+class RenderExecutor:
+    # Отдельный пул под конвертацию Markdown, чтобы промахи кеша не съедали
+    # общий тредпул Starlette. Сколько рендеров идёт одновременно, решает
+    # семафор, поэтому очередь видна здесь, а не внутри пула.
+
+    def __init__(self, backend: str = "thread", workers: int = 4, max_queue: int = 0):
+        if backend not in ("thread", "process"):
+            raise ValueError(f"Unknown render backend: {backend!r}")
+
+        self.backend = backend
+        self.workers = max(1, workers)
+        # 0 - без ограничения
+        self.max_queue = max_queue
+
+        self._executor: Optional[Executor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._lock = threading.Lock()
+
+        self.queued = 0
+        self.running = 0
+        self.peak_queued = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    @classmethod
+    def from_env(cls) -> "RenderExecutor":
+        return cls(
+            backend=os.getenv("WIKI_RENDER_BACKEND", "thread"),
+            workers=int(os.getenv("WIKI_RENDER_WORKERS", str(os.cpu_count() or 4))),
+            max_queue=int(os.getenv("WIKI_RENDER_QUEUE", "0")),
+        )
+
+    def start(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                return
+
+            self._executor = self._new_executor()
+
+    def _new_executor(self) -> Executor:
+        if self.backend == "thread":
+            return ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="wiki-render"
+            )
+
+        # spawn, а не fork: в главном процессе уже крутятся потоки
+        executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(
+                template_env.IMAGE_MANIFEST,
+                get_page_index(WIKI_DIR).generation,
+                template_env.static_generation,
+                template_env.validate_static_stamps,
+            ),
+        )
+
+        # Процессы поднимаются по требованию, так что прогреваем их сразу,
+        # а не на первых запросах
+        for _ in range(self.workers):
+            executor.submit(_ping)
+
+        return executor
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+            self._semaphore = None
+
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    async def render(
+        self, md_path: Path, constants: dict[str, str]
+    ) -> Optional[RenderResult]:
+        if self.max_queue and self.queued >= self.max_queue:
+            self.rejected += 1
+            raise RenderQueueFull()
+
+        if self._executor is None:
+            self.start()
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.workers)
+        semaphore = self._semaphore
+
+        self.queued += 1
+        self.peak_queued = max(self.peak_queued, self.queued)
+        try:
+            await semaphore.acquire()
+
+        finally:
+            self.queued -= 1
+
+        self.running += 1
+        try:
+            loop = asyncio.get_running_loop()
+            if self.backend == "process":
+                # Константы едут с каждой задачей: словарь маленький, а
+                # смена конфига не требует поднимать воркеры заново
+                result = await loop.run_in_executor(
+                    self._executor,
+                    _render_in_worker,
+                    md_path,
+                    constants,
+                    get_page_index(WIKI_DIR).generation,
+                    template_env.static_generation,
+                )
+
+            else:
+                result = await loop.run_in_executor(
+                    self._executor, render_file, md_path, constants
+                )
+
+        except BaseException:
+            self.failed += 1
+            raise
+
+        else:
+            self.completed += 1
+            return result
+
+        finally:
+            self.running -= 1
+            semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend,
+            "workers": self.workers,
+            "queued": self.queued,
+            "running": self.running,
+            "peak_queued": self.peak_queued,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+
+
+render_executor = RenderExecutor.from_env()
@@ -0,0 +1,192 @@
+import threading
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from markdown import Markdown
+
+from .extensions import (
+    AutoLinkButtonsExtension,
+    ButtonExtension,
+    ConstExtension,
+    FolderTreeExtension,
+    ImgBlockExtension,
+    ImgExtension,
+    ImgUrlExtension,
+    LobotomyExtension,
+    MacroExtension,
+    PreprocessorChainExtension,
+    RedactExtension,
+    SmallTextExtension,
+    StrikethroughExtension,
+    StripCommentsExtension,
+    TableImgExtension,
+    TocTreeExtension,
+    WarnIncludeExtension,
+    WikiLinkExtension,
+)
+from .extensions.constant_extension import (
+    ConstSlots,
+    DeferredConstError,
+    cut_slots,
+    fits_constants,
+    splice_constants,
+)
+from .timing import TIMING_ENABLED, Profiler, instrument
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+WIKI_DIR = BASE_DIR / "wiki"
+
+
+class RenderedPage(NamedTuple):
+    html: str
+    title: str
+    data: str
+    background_url: str
+    # Все файлы и папки, от которых зависит результат (шаблоны, соседи и т.д.)
+    dependencies: frozenset[Path]
+    # Куда вставить константы, см. bind_constants(). None - значения уже
+    # подставлены при рендере и страница привязана к их версии
+    const_slots: Optional[ConstSlots] = None
+    # Какие константы есть на странице, в слотах или уже подставленные
+    const_keys: frozenset[str] = frozenset()
+
+
+def build_markdown(constants: Optional[dict[str, str]] = None) -> Markdown:
+    return Markdown(
+        extensions=[
+            AutoLinkButtonsExtension(wiki_dir=WIKI_DIR),  # Динамические кнопки
+            "fenced_code",  # Блоки кода через тройные кавычки (```), как на GitHub
+            "tables",  # Markdown-таблицы
+            TableImgExtension(),  # Поддержка картинок в таблицах
+            "meta",  # Заголовки-мета в начале файла (например, автор, дата)
+            TocTreeExtension(),  # Автоматическое оглавление по заголовкам
+            "admonition",  # Поддержка блоков с предупреждениями, заметками и пр.
+            "footnotes",  # Сноски
+            "smarty",  # Типографические ковычки
+            "nl2br",  # Превращает одиночные \n в <br />
+            WikiLinkExtension(),  # Поддержка [[url|name]] для вики-стилей
+            ConstExtension(constants=constants or {}),  # Константы для замены
+            ImgUrlExtension(),  # Для нормальной работы ссылок
+            ImgBlockExtension(),  # Для блоков с картинками и текстом
+            RedactExtension(),  # Для обфускации информации с сайта пока не заглянут в код
+            MacroExtension(),  # Три макроса выше за один проход
+            ImgExtension(),  # Макрос для картинок
+            ButtonExtension(),  # Работа с кнопками и их оформлением
+            StripCommentsExtension(),  # В пизду комментарии, так же стрипает весь текст
+            FolderTreeExtension(),  # Для создания красивых деревьев
+            SmallTextExtension(),  # Маленький текст
+            StrikethroughExtension(),  # Зачёркнутый текст
+            LobotomyExtension(),  # Немного красоты в вики
+            WarnIncludeExtension(),  # Подстановка теплейтов
+            PreprocessorChainExtension(),  # Все препроцессоры выше за один прогон
+        ],
+    )
+
+
+class WikiRenderer:
+    # Сборка Markdown со всеми расширениями дорогая (компиляция регулярок,
+    # регистрация процессоров), поэтому инстанс живёт всё время жизни потока,
+    # а между страницами только сбрасывается через reset().
+
+    def __init__(self):
+        self.md = build_markdown()
+        self._const_postprocessor = self.md.postprocessors["macro_postprocessor"].const
+
+        # WIKI_TIMING: время каждого процессора, забирается через take_timings()
+        self.profiler: Optional[Profiler] = None
+        if TIMING_ENABLED:
+            self.profiler = Profiler()
+            instrument(self.md, self.profiler)
+
+    def render(
+        self,
+        md_path: Path,
+        content: str,
+        constants: dict[str, str],
+        deferred: bool = False,
+    ) -> RenderedPage:
+        # deferred: константы не подставляются, а остаются слотами, и смена
+        # конфига overlord стоит одной вставки вместо конвертации. Если
+        # значение влияет на разбор, страница рендерится с ними как обычно
+        if deferred:
+            try:
+                page = self._convert(md_path, content, constants, deferred=True)
+
+            except DeferredConstError:
+                page = None
+
+            if page is not None:
+                html, slots = cut_slots(page.html)
+                if fits_constants(slots, constants):
+                    return page._replace(html=html, const_slots=slots)
+
+        return self._convert(md_path, content, constants)
+
+    def take_timings(self) -> dict[str, float]:
+        return self.profiler.take() if self.profiler is not None else {}
+
+    def _convert(
+        self,
+        md_path: Path,
+        content: str,
+        constants: dict[str, str],
+        deferred: bool = False,
+    ) -> RenderedPage:
+        md = self.md
+        md.reset()
+
+        # Состояние конкретного запроса, живёт ровно одну конвертацию
+        setattr(md, "current_file", md_path)
+        setattr(md, "dependencies", {Path(md_path).resolve()})
+        self._const_postprocessor.constants = constants
+        self._const_postprocessor.deferred = deferred
+        self._const_postprocessor.used = set()
+
+        try:
+            if self.profiler is not None:
+                # Своё время convert() - то, что не попало ни в один процессор
+                rendered_html = self.profiler.call("markdown", md.convert, content)
+            else:
+                rendered_html = md.convert(content)
+            meta = getattr(md, "Meta", {})
+            dependencies = frozenset(getattr(md, "dependencies"))
+            const_keys = frozenset(self._const_postprocessor.used)
+
+        finally:
+            setattr(md, "current_file", None)
+            setattr(md, "dependencies", None)
+            self._const_postprocessor.deferred = False
+
+        title = meta.get("title", [None])[0] or "ЗАБЫЛИ НАИМЕНОВАНИЕ УСТАНОВИТЬ"
+        data = meta.get("date", [None])[0] or "ЗАБЫЛИ ДАТУ УСТАНОВИТЬ"
+        background_url = meta.get("background", [None])[0] or "images/wallpaper.jpeg"
+
+        return RenderedPage(
+            rendered_html,
+            title,
+            data,
+            background_url,
+            dependencies,
+            const_keys=const_keys,
+        )
+
+
+def bind_constants(page: RenderedPage, constants: dict[str, str]) -> RenderedPage:
+    if page.const_slots is None:
+        return page
+
+    html = splice_constants(page.html, page.const_slots, constants)
+    return page._replace(html=html, const_slots=None)
+
+
+_local = threading.local()
+
+
+def get_renderer() -> WikiRenderer:
+    # Sync-роуты FastAPI крутятся в тредпуле, Markdown не потокобезопасен,
+    # поэтому у каждого потока свой рендерер
+    renderer = getattr(_local, "renderer", None)
+    if renderer is None:
+        renderer = _local.renderer = WikiRenderer()
+
+    return renderer
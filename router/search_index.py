@@ -0,0 +1,371 @@
+import heapq
+import json
+import math
+import mmap
+import re
+import struct
+from collections import Counter
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Iterable, NamedTuple, Optional
+
+from .extensions.toc_tree_extension import slugify
+from .stemmer import stem
+
+# Замазанный !redact текст - это █, в слова он не попадает
+WORD_RE = re.compile(r"[0-9a-zа-яё]+", re.IGNORECASE)
+
+MAGIC = b"WSIX"
+VERSION = 2
+# magic, версия, число терминов, смещения и длины блоков файла
+HEADER = struct.Struct("<4sII8Q")
+TERM = struct.Struct("<IIII")
+POSTING = struct.Struct("<If")
+
+# Вес вхождения в заголовок страницы и раздела относительно текста
+TITLE_BOOST = 5
+HEADING_BOOST = 3
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Сколько терминов разворачивает недописанное последнее слово запроса
+MAX_PREFIX_TERMS = 64
+MAX_TEXT = 4000
+SNIPPET_BEFORE = 60
+SNIPPET_AFTER = 140
+
+BLOCK_TAGS = {
+    "p", "div", "br", "li", "ul", "ol", "tr", "td", "th", "table", "pre",
+    "blockquote", "hr", "dd", "dt", "dl", "details", "summary", "nav",
+    "section", "article", "header", "footer", "aside", "figure", "figcaption",
+}  # fmt: skip
+# Строчные, но тоже разделяют слова: кнопки !auto_link_btn и картинки
+# идут в разметке вплотную, без пробелов между ними
+BREAK_TAGS = BLOCK_TAGS | {"a", "img", "span", "button", "label"}
+HEADING_TAGS = {f"h{i}" for i in range(1, 7)}
+
+
+class Section(NamedTuple):
+    href: str
+    anchor: str
+    title: str
+    heading: Optional[str]
+    text: str
+
+
+def tokenize(text: str) -> list[str]:
+    return [stem(w) for w in WORD_RE.findall(text)]
+
+
+class _SectionParser(HTMLParser):
+    # Режет отрендеренную страницу на разделы по заголовкам с id (их
+    # проставляет HeaderAnchorTreeprocessor через slugify)
+
+    def __init__(self):
+        super().__init__()
+        self.sections: list[tuple[str, Optional[str], list[str]]] = [("", None, [])]
+        self._skip: list[str] = []
+        self._heading: Optional[list[str]] = None
+        self._heading_id: Optional[str] = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if self._skip:
+            if tag == self._skip[-1]:
+                self._skip.append(tag)
+            return
+
+        # Ссылки на якоря этой же страницы - это оглавление, оно повторяет
+        # заголовки и только путает ранжирование
+        if tag in ("script", "style") or (
+            tag == "a" and (attrs.get("href") or "").startswith("#")
+        ):
+            self._skip.append(tag)
+
+        elif tag in HEADING_TAGS:
+            self._heading = []
+            self._heading_id = attrs.get("id")
+
+        elif tag in BREAK_TAGS:
+            self._chunks().append(" ")
+
+    def handle_endtag(self, tag):
+        if self._skip:
+            if tag == self._skip[-1]:
+                self._skip.pop()
+            return
+
+        if tag in HEADING_TAGS and self._heading is not None:
+            text = " ".join("".join(self._heading).split())
+            self.sections.append((self._heading_id or slugify(text), text, []))
+            self._heading = None
+
+        elif tag in BREAK_TAGS:
+            self._chunks().append(" ")
+
+    def handle_data(self, data):
+        if not self._skip:
+            self._chunks().append(data)
+
+    def _chunks(self) -> list[str]:
+        return self._heading if self._heading is not None else self.sections[-1][2]
+
+
+def extract_sections(html: str, href: str, title: str) -> list[Section]:
+    parser = _SectionParser()
+    parser.feed(html)
+    parser.close()
+
+    sections = []
+    for anchor, heading, chunks in parser.sections:
+        text = " ".join("".join(chunks).split())
+        # Вступление без текста всё равно нужно: по нему ищется заголовок
+        if text or heading is not None or not anchor:
+            sections.append(Section(href, anchor, title, heading, text[:MAX_TEXT]))
+
+    return sections
+
+
+def idf(n_docs: int, df: int) -> float:
+    return math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+
+
+# (частоты терминов раздела с бустами заголовков, длина текста в словах)
+SectionTerms = tuple[Counter, int]
+
+
+def section_terms(section: Section) -> SectionTerms:
+    body = tokenize(section.text)
+    tf = Counter(body)
+    for term in tokenize(section.heading or ""):
+        tf[term] += HEADING_BOOST
+    if not section.anchor:
+        for term in tokenize(section.title):
+            tf[term] += TITLE_BOOST
+
+    return tf, len(body)
+
+
+def weigh_sections(
+    sections: Iterable[Section], terms: Optional[list[SectionTerms]] = None
+) -> tuple[list[Section], dict[str, list[tuple[int, float]]]]:
+    # BM25 без idf: вес термина в разделе, idf досчитывается при поиске.
+    # terms - уже посчитанные section_terms(), чтобы не токенизировать
+    # заново разделы, которые не менялись
+    docs = list(sections)
+    if terms is None:
+        terms = [section_terms(section) for section in docs]
+
+    lengths = [length for _, length in terms]
+    avg_len = (sum(lengths) / len(lengths)) if lengths else 1.0
+    postings: dict[str, list[tuple[int, float]]] = {}
+    for doc_id, (tf, length) in enumerate(terms):
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * length / max(avg_len, 1.0))
+        for term, count in tf.items():
+            weight = count * (BM25_K1 + 1) / (count + norm)
+            postings.setdefault(term, []).append((doc_id, weight))
+
+    return docs, postings
+
+
+def build_index(
+    sections: Iterable[Section],
+    meta: Optional[dict] = None,
+    terms: Optional[list[SectionTerms]] = None,
+) -> bytes:
+    sections, postings = weigh_sections(sections, terms)
+
+    docs: list[list] = []
+    texts = bytearray()
+    for section in sections:
+        text = section.text.encode("utf-8")
+        docs.append(
+            [
+                section.href,
+                section.anchor,
+                section.title,
+                section.heading,
+                len(texts),
+                len(text),
+            ]
+        )
+        texts += text
+
+    sorted_terms = sorted(postings, key=lambda t: t.encode("utf-8"))
+    term_table = bytearray()
+    strings = bytearray()
+    posting_data = bytearray()
+    n_postings = 0
+    for term in sorted_terms:
+        raw = term.encode("utf-8")
+        entries = postings[term]
+        term_table += TERM.pack(len(strings), len(raw), n_postings, len(entries))
+        strings += raw
+        for doc_id, weight in entries:
+            posting_data += POSTING.pack(doc_id, weight)
+        n_postings += len(entries)
+
+    meta_raw = json.dumps(
+        {"meta": meta or {}, "docs": docs}, ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+    blocks = [meta_raw, bytes(term_table), bytes(strings), bytes(posting_data)]
+    offsets = []
+    pos = HEADER.size
+    for block in blocks:
+        offsets.append(pos)
+        pos += len(block)
+    offsets.append(pos)
+
+    header = HEADER.pack(
+        MAGIC,
+        VERSION,
+        len(sorted_terms),
+        offsets[0],
+        len(meta_raw),
+        offsets[1],
+        offsets[2],
+        offsets[3],
+        offsets[4],
+        len(texts),
+        0,
+    )
+    return header + b"".join(blocks) + bytes(texts)
+
+
+class SearchIndex:
+    # Читает файл из build_index() через mmap: в память целиком попадают
+    # только метаданные разделов, термины ищутся бинпоиском прямо по файлу
+
+    def __init__(self, path: Path):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (
+            magic,
+            version,
+            self.n_terms,
+            meta_off,
+            meta_len,
+            self._terms_off,
+            self._strings_off,
+            self._postings_off,
+            self._texts_off,
+            _,
+            _,
+        ) = HEADER.unpack_from(self._mm, 0)
+
+        if magic != MAGIC or version != VERSION:
+            self._mm.close()
+            raise ValueError(f"{path} is not a search index v{VERSION}")
+
+        data = json.loads(self._mm[meta_off : meta_off + meta_len])
+        self.meta: dict = data["meta"]
+        self.docs: list[list] = data["docs"]
+
+    def close(self) -> None:
+        self._mm.close()
+
+    def _term(self, i: int) -> tuple[bytes, int, int]:
+        str_off, str_len, post_off, post_count = TERM.unpack_from(
+            self._mm, self._terms_off + i * TERM.size
+        )
+        start = self._strings_off + str_off
+        return self._mm[start : start + str_len], post_off, post_count
+
+    def _lower_bound(self, key: bytes) -> int:
+        lo, hi = 0, self.n_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term(mid)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        return lo
+
+    def lookup(self, term: str, prefix: bool = False) -> list[tuple[str, int, int]]:
+        key = term.encode("utf-8")
+        i = self._lower_bound(key)
+        found = []
+        while i < self.n_terms and len(found) < MAX_PREFIX_TERMS:
+            raw, post_off, post_count = self._term(i)
+            if raw != key and not (prefix and raw.startswith(key)):
+                break
+
+            found.append((raw.decode("utf-8"), post_off, post_count))
+            i += 1
+
+        return found
+
+    def _postings(self, post_off: int, post_count: int):
+        start = self._postings_off + post_off * POSTING.size
+        return POSTING.iter_unpack(self._mm[start : start + post_count * POSTING.size])
+
+    def text(self, doc_id: int) -> str:
+        off, length = self.docs[doc_id][4], self.docs[doc_id][5]
+        start = self._texts_off + off
+        return self._mm[start : start + length].decode("utf-8")
+
+    def search(self, query: str, limit: int = 10) -> list[dict]:
+        words = WORD_RE.findall(query)
+        if not words:
+            return []
+
+        # Последнее слово, если после него нет пробела, ещё набирается
+        typing = not query[-1:].isspace()
+        n_docs = max(len(self.docs), 1)
+
+        per_term: list[dict[int, float]] = []
+        matched: set[str] = set()
+        for i, word in enumerate(words):
+            prefix = typing and i == len(words) - 1
+            scores: dict[int, float] = {}
+            for term, post_off, post_count in self.lookup(stem(word), prefix):
+                matched.add(term)
+                term_idf = idf(n_docs, post_count)
+                for doc_id, weight in self._postings(post_off, post_count):
+                    score = term_idf * weight
+                    if score > scores.get(doc_id, 0.0):
+                        scores[doc_id] = score
+
+            per_term.append(scores)
+
+        # Сначала разделы, где нашлись все слова, если таких нет - любые
+        common = set.intersection(*(set(s) for s in per_term))
+        candidates = common or set().union(*per_term)
+
+        ranked = heapq.nlargest(
+            limit,
+            candidates,
+            key=lambda d: sum(s.get(d, 0.0) for s in per_term),
+        )
+
+        results = []
+        for doc_id in ranked:
+            href, anchor, title, heading = self.docs[doc_id][:4]
+            results.append(
+                {
+                    "url": f"{href}#{anchor}" if anchor else href,
+                    "title": title,
+                    "heading": heading,
+                    "snippet": self.snippet(doc_id, matched),
+                    "score": round(sum(s.get(doc_id, 0.0) for s in per_term), 4),
+                }
+            )
+
+        return results
+
+    def snippet(self, doc_id: int, terms: set[str]) -> str:
+        text = self.text(doc_id)
+        for m in WORD_RE.finditer(text):
+            if stem(m.group()) in terms:
+                start = max(0, m.start() - SNIPPET_BEFORE)
+                end = min(len(text), m.end() + SNIPPET_AFTER)
+                return (
+                    ("…" if start else "")
+                    + text[start:end]
+                    + ("…" if end < len(text) else "")
+                )
+
+        end = min(len(text), SNIPPET_BEFORE + SNIPPET_AFTER)
+        return text[:end] + ("…" if end < len(text) else "")
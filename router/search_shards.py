@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Iterable
+
+from template_env import DERIVED_DIR
+
+from .search_index import Section, idf, weigh_sections
+
+# Клиентский индекс для статичной раздачи: index.json со списком разделов
+# и таблицей шардов, плюс по шарду на первую букву основы слова и куски с
+# отрывками текста для выдачи. Браузер грузит index.json и только те шарды,
+# с которых начинаются слова запроса, и куски, в которые попали результаты.
+SEARCH_DIR = DERIVED_DIR / "search"
+SHARDS_VERSION = 1
+MANIFEST_NAME = "index.json"
+# Сколько текста раздела уходит в выдачу вместо сниппета
+EXCERPT = 160
+# Разделов на один кусок с отрывками
+EXCERPT_CHUNK = 64
+# Точность весов в шардах: больше только раздувает JSON
+WEIGHT_DIGITS = 3
+
+
+def _dumps(data) -> bytes:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def shard_key(term: str) -> str:
+    return term[:1]
+
+
+def _file_name(prefix: str, data: bytes) -> str:
+    return f"{prefix}.{hashlib.sha256(data).hexdigest()[:12]}.json"
+
+
+def build_shards(sections: Iterable[Section]) -> tuple[dict, dict[str, bytes]]:
+    docs, postings = weigh_sections(sections)
+    n_docs = max(len(docs), 1)
+
+    # В шардах сразу idf * вес: клиенту остаётся только сложить
+    grouped: dict[str, dict[str, list]] = {}
+    for term in sorted(postings):
+        entries = postings[term]
+        term_idf = idf(n_docs, len(entries))
+        flat = []
+        for doc_id, weight in entries:
+            flat.extend((doc_id, round(term_idf * weight, WEIGHT_DIGITS)))
+
+        grouped.setdefault(shard_key(term), {})[term] = flat
+
+    # Имя файла содержит хеш содержимого, так что шарды можно кешировать
+    # навсегда, а index.json - перепроверять при каждой загрузке
+    files: dict[str, bytes] = {}
+    shards: dict[str, str] = {}
+    for key, terms in grouped.items():
+        data = _dumps(terms)
+        shards[key] = name = _file_name(f"t-{ord(key):x}", data)
+        files[name] = data
+
+    excerpts: list[str] = []
+    for start in range(0, len(docs), EXCERPT_CHUNK):
+        data = _dumps([s.text[:EXCERPT] for s in docs[start : start + EXCERPT_CHUNK]])
+        name = _file_name(f"x-{start // EXCERPT_CHUNK}", data)
+        files[name] = data
+        excerpts.append(name)
+
+    # Заголовок страницы общий для всех её разделов, хранится один раз
+    pages: dict[tuple[str, str], int] = {}
+    doc_rows = []
+    for s in docs:
+        page = pages.setdefault((s.href, s.title), len(pages))
+        doc_rows.append([page, s.anchor, s.heading])
+
+    manifest = {
+        "version": SHARDS_VERSION,
+        "pages": [list(page) for page in pages],
+        "docs": doc_rows,
+        "shards": shards,
+        "excerpts": excerpts,
+        "excerpt_chunk": EXCERPT_CHUNK,
+    }
+    return manifest, files
+
+
+def write_shards(sections: Iterable[Section], out_dir: Path = SEARCH_DIR) -> dict:
+    manifest, files = build_shards(sections)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    for name, data in files.items():
+        path = out_dir / name
+        if not path.exists():
+            tmp = path.with_name(f".{name}.tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+
+    # index.json пишется последним: он ссылается только на уже лежащие шарды
+    tmp = out_dir / f".{MANIFEST_NAME}.tmp"
+    tmp.write_bytes(_dumps(manifest))
+    os.replace(tmp, out_dir / MANIFEST_NAME)
+
+    for path in out_dir.glob("[tx]-*.json"):
+        if path.name not in files:
+            path.unlink()
+
+    return manifest
@@ -0,0 +1,38 @@
+import asyncio
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    # Одновременные вызовы с одним ключом ждут один и тот же результат:
+    # после деплоя популярная страница рендерится один раз, а не по разу
+    # на каждый запрос, пришедший, пока она рендерится.
+
+    def __init__(self):
+        self._calls: dict[Hashable, asyncio.Task] = {}
+
+        self.calls = 0
+        # Сколько вызовов не стали делать работу, а дождались чужой
+        self.shared = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._calls.get(key)
+        if task is not None:
+            self.shared += 1
+            return await asyncio.shield(task)
+
+        self.calls += 1
+        # Отдельная задача, чтобы отвалившийся первый клиент не отменил
+        # работу для остальных
+        task = asyncio.ensure_future(fn())
+        self._calls[key] = task
+        task.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._calls),
+            "calls": self.calls,
+            "shared": self.shared,
+        }
@@ -0,0 +1,141 @@
+import re
+
+# Стеммер Портера для русского (Snowball), без внешних зависимостей.
+# Нужен только для поиска: индекс и запрос проходят через один и тот же
+# код, так что важна согласованность, а не совпадение с эталоном до буквы.
+
+VOWELS = "аеиоуыэюя"
+
+PERFECTIVE_GERUND_1 = ("в", "вши", "вшись")
+PERFECTIVE_GERUND_2 = ("ив", "ивши", "ившись", "ыв", "ывши", "ывшись")
+
+ADJECTIVE = (
+    "ее", "ие", "ые", "ое", "ими", "ыми", "ей", "ий", "ый", "ой", "ем", "им",
+    "ым", "ом", "его", "ого", "ему", "ому", "их", "ых", "ую", "юю", "ая", "яя",
+    "ою", "ею",
+)  # fmt: skip
+
+PARTICIPLE_1 = ("ем", "нн", "вш", "ющ", "щ")
+PARTICIPLE_2 = ("ивш", "ывш", "ующ")
+
+REFLEXIVE = ("ся", "сь")
+
+VERB_1 = (
+    "ла", "на", "ете", "йте", "ли", "й", "л", "ем", "н", "ло", "но", "ет", "ют",
+    "ны", "ть", "ешь", "нно",
+)  # fmt: skip
+VERB_2 = (
+    "ила", "ыла", "ена", "ейте", "уйте", "ите", "или", "ыли", "ей", "уй", "ил",
+    "ыл", "им", "ым", "ен", "ило", "ыло", "ено", "ят", "ует", "уют", "ит", "ыт",
+    "ены", "ить", "ыть", "ишь", "ую", "ю",
+)  # fmt: skip
+
+NOUN = (
+    "а", "ев", "ов", "ие", "ье", "е", "иями", "ями", "ами", "еи", "ии", "и",
+    "ией", "ей", "ой", "ий", "й", "иям", "ям", "ием", "ем", "ам", "ом", "о",
+    "у", "ах", "иях", "ях", "ы", "ь", "ию", "ью", "ю", "ия", "ья", "я",
+)  # fmt: skip
+
+SUPERLATIVE = ("ейше", "ейш")
+DERIVATIONAL = ("ость", "ост")
+
+CYRILLIC_RE = re.compile(r"[а-я]")
+
+
+def _by_length(*groups: tuple[str, ...]) -> list[tuple[str, bool]]:
+    # (окончание, нужна ли перед ним а/я), длинные проверяются первыми
+    items = [(s, i == 0 and len(groups) > 1) for i, g in enumerate(groups) for s in g]
+    return sorted(items, key=lambda item: len(item[0]), reverse=True)
+
+
+_PERFECTIVE_GERUND = _by_length(PERFECTIVE_GERUND_1, PERFECTIVE_GERUND_2)
+_ADJECTIVE = _by_length(ADJECTIVE)
+_PARTICIPLE = _by_length(PARTICIPLE_1, PARTICIPLE_2)
+_REFLEXIVE = _by_length(REFLEXIVE)
+_VERB = _by_length(VERB_1, VERB_2)
+_NOUN = _by_length(NOUN)
+_SUPERLATIVE = _by_length(SUPERLATIVE)
+_DERIVATIONAL = _by_length(DERIVATIONAL)
+
+
+def _strip(word: str, start: int, endings: list[tuple[str, bool]]) -> str:
+    # Снимает самое длинное подходящее окончание, целиком лежащее в word[start:]
+    for ending, after_a in endings:
+        if not word.endswith(ending) or len(word) - len(ending) < start:
+            continue
+
+        if after_a:
+            pos = len(word) - len(ending) - 1
+            if pos < start or word[pos] not in "ая":
+                continue
+
+        return word[: len(word) - len(ending)]
+
+    return word
+
+
+def _regions(word: str) -> tuple[int, int]:
+    # RV - после первой гласной, R2 - R1 внутри R1
+    rv = len(word)
+    for i, c in enumerate(word):
+        if c in VOWELS:
+            rv = i + 1
+            break
+
+    def r_after(start: int) -> int:
+        for i in range(start + 1, len(word)):
+            if word[i] not in VOWELS and word[i - 1] in VOWELS:
+                return i + 1
+
+        return len(word)
+
+    r1 = r_after(0)
+    r2 = r_after(r1) if r1 < len(word) else len(word)
+    return rv, r2
+
+
+def stem(word: str) -> str:
+    word = word.lower().replace("ё", "е")
+    if len(word) < 3 or not CYRILLIC_RE.search(word):
+        return word
+
+    rv, r2 = _regions(word)
+
+    # Шаг 1
+    stripped = _strip(word, rv, _PERFECTIVE_GERUND)
+    if stripped == word:
+        word = _strip(word, rv, _REFLEXIVE)
+
+        stripped = _strip(word, rv, _ADJECTIVE)
+        if stripped != word:
+            stripped = _strip(stripped, rv, _PARTICIPLE)
+
+        else:
+            stripped = _strip(word, rv, _VERB)
+            if stripped == word:
+                stripped = _strip(word, rv, _NOUN)
+
+    word = stripped
+
+    # Шаг 2
+    if word.endswith("и") and len(word) - 1 >= rv:
+        word = word[:-1]
+
+    # Шаг 3
+    word = _strip(word, r2, _DERIVATIONAL)
+
+    # Шаг 4
+    if word.endswith("нн") and len(word) - 1 >= rv:
+        word = word[:-1]
+
+    else:
+        stripped = _strip(word, rv, _SUPERLATIVE)
+        if stripped != word:
+            word = stripped
+            if word.endswith("нн") and len(word) - 1 >= rv:
+                word = word[:-1]
+
+        elif word.endswith("ь") and len(word) - 1 >= rv:
+            word = word[:-1]
+
+    return word
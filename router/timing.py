@@ -0,0 +1,231 @@
+import bisect
+import contextlib
+import os
+import re
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Iterator, Optional
+
+from fastapi import APIRouter, HTTPException
+from markdown import Markdown
+
+router = APIRouter()
+
+# Замеры по стадиям включаются только явно: обёртки вокруг каждого
+# процессора Markdown стоят заметно
+TIMING_ENABLED = os.getenv("WIKI_TIMING", "0") == "1"
+
+# Границы корзин гистограмм, мс
+BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)
+# Больше записей в Server-Timing браузеры показывают плохо
+SERVER_TIMING_LIMIT = 12
+
+TOKEN_RE = re.compile(r"[^A-Za-z0-9!#$%&'*+.^_`|~-]")
+
+
+class Profiler:
+    # Собственное время каждого процессора: вложенные вызовы (генераторы
+    # препроцессоров тянут строки друг из друга, inline-паттерны работают
+    # внутри treeprocessor'а inline) вычитаются из родителя
+
+    def __init__(self):
+        self.totals: dict[str, float] = {}
+        self._stack: list[list] = []
+
+    def call(self, name: str, fn: Callable, *args):
+        frame = [time.perf_counter(), 0.0]
+        self._stack.append(frame)
+        try:
+            return fn(*args)
+
+        finally:
+            self._stack.pop()
+            elapsed = time.perf_counter() - frame[0]
+            self.totals[name] = self.totals.get(name, 0.0) + elapsed - frame[1]
+            if self._stack:
+                self._stack[-1][1] += elapsed
+
+    def wrap(self, name: str, fn: Callable) -> Callable:
+        return lambda *args: self.call(name, fn, *args)
+
+    def wrap_iter(self, name: str, fn: Callable) -> Callable:
+        def iter_lines(lines):
+            it = fn(lines)
+            while True:
+                try:
+                    line = self.call(name, next, it)
+
+                except StopIteration:
+                    return
+
+                yield line
+
+        return iter_lines
+
+    def take(self) -> dict[str, float]:
+        # Накопленное с прошлого take(), в мс
+        totals, self.totals = self.totals, {}
+        return {name: value * 1000 for name, value in totals.items()}
+
+
+def instrument(md: Markdown, profiler: Profiler) -> set[str]:
+    # Методы подменяются на инстансе, классы и остальные рендереры не
+    # трогаются. Возвращает имена наших процессоров (из router/extensions)
+    custom = set()
+
+    def label(stage: str, processor) -> str:
+        name = f"{stage}:{type(processor).__name__}"
+        if type(processor).__module__.startswith("router."):
+            custom.add(name)
+        return name
+
+    for chain in md.preprocessors:
+        for processor in getattr(chain, "processors", [chain]):
+            name = label("pre", processor)
+            if getattr(processor, "iter_lines", None) is not None:
+                processor.iter_lines = profiler.wrap_iter(name, processor.iter_lines)
+            else:
+                processor.run = profiler.wrap(name, processor.run)
+
+    for processor in md.parser.blockprocessors:
+        name = label("block", processor)
+        processor.test = profiler.wrap(name, processor.test)
+        processor.run = profiler.wrap(name, processor.run)
+
+    for processor in md.inlinePatterns:
+        processor.handleMatch = profiler.wrap(
+            label("inline", processor), processor.handleMatch
+        )
+
+    for stage, registry in (("tree", md.treeprocessors), ("post", md.postprocessors)):
+        for processor in registry:
+            processor.run = profiler.wrap(label(stage, processor), processor.run)
+
+    return custom
+
+
+class StageStats:
+    # Гистограммы времени по стадиям за всё время жизни процесса
+
+    def __init__(self, buckets: tuple = BUCKETS_MS):
+        self.buckets = buckets
+        # стадия -> [счётчики по корзинам (+ последняя - бесконечность), сумма]
+        self._stages: dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, timings: dict[str, float]) -> None:
+        with self._lock:
+            for name, ms in timings.items():
+                stage = self._stages.get(name)
+                if stage is None:
+                    stage = self._stages[name] = [[0] * (len(self.buckets) + 1), 0.0]
+
+                stage[0][bisect.bisect_left(self.buckets, ms)] += 1
+                stage[1] += ms
+
+    def series(self) -> list[tuple[str, list[int], float]]:
+        # (стадия, счётчики по корзинам, сумма в мс) для /metrics
+        with self._lock:
+            return [
+                (name, list(counts), total)
+                for name, (counts, total) in sorted(self._stages.items())
+            ]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stages.clear()
+
+    def snapshot(self) -> dict[str, dict]:
+        with self._lock:
+            return {
+                name: {
+                    "count": sum(counts),
+                    "sum_ms": total,
+                    "buckets": dict(zip([*map(str, self.buckets), "+Inf"], counts)),
+                }
+                for name, (counts, total) in sorted(self._stages.items())
+            }
+
+
+stage_stats = StageStats()
+
+
+class RequestTiming:
+    # Стадии одного запроса, уходят в заголовок Server-Timing
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages: dict[str, float] = {}
+
+    def add(self, timings: dict[str, float]) -> None:
+        for name, ms in timings.items():
+            self.stages[name] = self.stages.get(name, 0.0) + ms
+
+    def header(self, total: float) -> str:
+        stages = sorted(self.stages.items(), key=lambda x: -x[1])
+        entries = [f"total;dur={total:.2f}"] + [
+            f"{TOKEN_RE.sub('-', name)};dur={ms:.2f}"
+            for name, ms in stages[:SERVER_TIMING_LIMIT]
+        ]
+        return ", ".join(entries)
+
+
+_request_timing: ContextVar[Optional[RequestTiming]] = ContextVar(
+    "request_timing", default=None
+)
+
+
+def start_request() -> Optional[RequestTiming]:
+    # Контекст копируется в run_in_threadpool, так что стадии, замеренные
+    # в пуле, попадают в тот же объект
+    if not TIMING_ENABLED:
+        return None
+
+    timing = RequestTiming()
+    _request_timing.set(timing)
+    return timing
+
+
+def finish_request() -> Optional[str]:
+    # Значение для Server-Timing, None - запрос не замерялся
+    timing = _request_timing.get()
+    if timing is None:
+        return None
+
+    _request_timing.set(None)
+    total = (time.perf_counter() - timing.start) * 1000
+    stage_stats.observe({"request": total})
+    return timing.header(total)
+
+
+def record(timings: dict[str, float]) -> None:
+    if not TIMING_ENABLED:
+        return
+
+    stage_stats.observe(timings)
+    timing = _request_timing.get()
+    if timing is not None:
+        timing.add(timings)
+
+
+@contextlib.contextmanager
+def measure(stage: str) -> Iterator[None]:
+    if not TIMING_ENABLED:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+
+    finally:
+        record({stage: (time.perf_counter() - start) * 1000})
+
+
+@router.get("/wiki-timing")
+async def wiki_timing():
+    if not TIMING_ENABLED:
+        raise HTTPException(status_code=404, detail="WIKI_TIMING is off")
+
+    return stage_stats.snapshot()
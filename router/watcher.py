@@ -0,0 +1,250 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+
+log = logging.getLogger(__name__)
+
+ChangeCallback = Callable[[set[Path]], None]
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+)
+
+_EVENT = struct.Struct("iIII")
+
+
+class FileWatcher:
+    # Следит за деревьями папок и раздаёт подписчикам пачки изменившихся
+    # путей. На Linux через inotify, иначе - опрос mtime раз в poll_interval.
+    # В пачку попадает и сам файл, и его папка: у папки меняется состав.
+
+    def __init__(
+        self,
+        roots: Iterable[Path],
+        poll_interval: float = 1.0,
+        debounce: float = 0.1,
+        use_inotify: Optional[bool] = None,
+    ):
+        self.roots = [Path(r).resolve() for r in roots]
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.use_inotify = (
+            sys.platform.startswith("linux") if use_inotify is None else use_inotify
+        )
+        self.backend = ""
+
+        self._callbacks: list[ChangeCallback] = []
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def subscribe(self, callback: ChangeCallback) -> None:
+        self._callbacks.append(callback)
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+
+        self._stop.clear()
+        target = self._run_polling
+        self.backend = "polling"
+
+        if self.use_inotify:
+            try:
+                inotify = _Inotify()
+
+            except OSError as e:
+                log.warning("inotify unavailable (%s), falling back to polling", e)
+
+            else:
+                target = lambda: self._run_inotify(inotify)  # noqa: E731
+                self.backend = "inotify"
+
+        self._thread = threading.Thread(target=target, name="wiki-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+
+        self._stop.set()
+        self._thread.join(timeout=5)
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _publish(self, changed: set[Path]) -> None:
+        if not changed:
+            return
+
+        for callback in self._callbacks:
+            try:
+                callback(changed)
+
+            except Exception:
+                log.exception("watcher callback %r failed", callback)
+
+    # region inotify
+
+    def _run_inotify(self, inotify: "_Inotify") -> None:
+        try:
+            for root in self.roots:
+                inotify.add_tree(root)
+
+            while not self._stop.is_set():
+                changed = inotify.read(timeout=self.poll_interval)
+                if not changed:
+                    continue
+
+                # Сохранение файла редактором или git - это пачка событий,
+                # собираем их все и публикуем одним списком
+                deadline = time.monotonic() + self.debounce
+                while (left := deadline - time.monotonic()) > 0:
+                    changed |= inotify.read(timeout=left)
+
+                self._publish(changed)
+
+        finally:
+            inotify.close()
+
+    # endregion
+
+    # region polling
+
+    def _snapshot(self) -> dict[Path, tuple[int, int]]:
+        snap: dict[Path, tuple[int, int]] = {}
+        for root in self.roots:
+            for dirpath, dirnames, filenames in os.walk(root):
+                for name in (dirpath, *(os.path.join(dirpath, f) for f in filenames)):
+                    try:
+                        st = os.stat(name)
+
+                    except OSError:
+                        continue
+
+                    snap[Path(name)] = (st.st_mtime_ns, st.st_size)
+
+        return snap
+
+    def _run_polling(self) -> None:
+        prev = self._snapshot()
+        while not self._stop.wait(self.poll_interval):
+            cur = self._snapshot()
+            changed = {p for p in prev.keys() | cur.keys() if prev.get(p) != cur.get(p)}
+            changed |= {p.parent for p in changed}
+            prev = cur
+            self._publish(changed)
+
+    # endregion
+
+
+class _Inotify:
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+        self.roots: list[Path] = []
+        self._wd_to_dir: dict[int, Path] = {}
+
+    def add_tree(self, root: Path) -> set[Path]:
+        # Возвращает всё, что нашлось внутри: файлы в только что созданной
+        # папке могли появиться раньше, чем на неё повесили watch
+        if root not in self.roots and all(
+            not root.is_relative_to(r) for r in self.roots
+        ):
+            self.roots.append(root)
+
+        found: set[Path] = set()
+        for dirpath, _, filenames in os.walk(root):
+            wd = self._add_watch(self.fd, os.fsencode(dirpath), WATCH_MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                log.warning("inotify_add_watch(%s): %s", dirpath, os.strerror(err))
+                continue
+
+            self._wd_to_dir[wd] = Path(dirpath)
+            found.add(Path(dirpath))
+            found.update(Path(dirpath, f) for f in filenames)
+
+        return found
+
+    def read(self, timeout: float) -> set[Path]:
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+
+        try:
+            buf = os.read(self.fd, 64 * 1024)
+
+        except BlockingIOError:
+            return set()
+
+        changed: set[Path] = set()
+        offset = 0
+        while offset < len(buf):
+            wd, mask, _, name_len = _EVENT.unpack_from(buf, offset)
+            offset += _EVENT.size
+            name = buf[offset : offset + name_len].rstrip(b"\0")
+            offset += name_len
+
+            if mask & IN_Q_OVERFLOW:
+                # События потеряны, честно считаем, что поменялось всё
+                for root in self.roots:
+                    changed |= self.add_tree(root)
+                continue
+
+            directory = self._wd_to_dir.get(wd)
+            if directory is None:
+                continue
+
+            if mask & IN_IGNORED:
+                del self._wd_to_dir[wd]
+                continue
+
+            path = directory / os.fsdecode(name) if name else directory
+            changed.add(path)
+            changed.add(path.parent if name else directory.parent)
+
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                changed |= self.add_tree(path)
+
+        return changed
+
+    def close(self) -> None:
+        os.close(self.fd)
@@ -1,105 +1,380 @@
+import hashlib
+import time
+from email.utils import formatdate, parsedate_to_datetime
 from pathlib import Path
+from typing import Iterable, NamedTuple, Optional
 
-from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi import APIRouter, Request, Response
 from fastapi.responses import HTMLResponse
-from markdown import Markdown
+from starlette.concurrency import run_in_threadpool
 
-from data_control.constants import Constants
+import template_env
+from data_control.constants import Constants, ConstSnapshot
 from template_env import templates
 
-from .extensions import (
-    AutoLinkButtonsExtension,
-    ButtonExtension,
-    ConstExtension,
-    FolderTreeExtension,
-    ImgBlockExtension,
-    ImgExtension,
-    ImgUrlExtension,
-    LobotomyExtension,
-    RedactExtension,
-    SmallTextExtension,
-    StrikethroughExtension,
-    StripCommentsExtension,
-    TableImgExtension,
-    TocTreeExtension,
-    WarnIncludeExtension,
-    WikiLinkExtension,
-)
+from . import timing
+from .compression import MIN_SIZE, choose_encoding, compress
+from .extensions.constant_extension import fits_constants
+from .extensions.warn_include_extension import warn_templates
+from .link_graph import get_link_graph
+from .metrics import render_latency
+from .page_index import PageInfo, get_page_index
+from .render_cache import CacheEntry, file_stamp, render_cache
+from .render_pool import RenderQueueFull, render_executor
+from .renderer import WIKI_DIR, RenderedPage, bind_constants
+from .single_flight import SingleFlight
 
 router = APIRouter()
 
-BASE_DIR = Path(__file__).resolve().parents[1]
-WIKI_DIR = BASE_DIR / "wiki"
+TEMPLATE_NAME = "wiki_template.html"
+TEMPLATE_PATH = template_env.BASE_DIR / "templates" / TEMPLATE_NAME
+
+
+class PageBody(NamedTuple):
+    body: bytes
+    etag: str
+    last_modified: int
+    static_generation: int
+    # Версия констант, под которую собрано тело, и значения тех из них, что
+    # есть на странице: сменились другие - тело остаётся
+    const_version: int
+    const_values: tuple
+    # encoding -> сжатое тело, считается при первом запросе с этим encoding
+    compressed: dict[str, bytes]
+
+
+page_index = get_page_index(WIKI_DIR)
+link_graph = get_link_graph(WIKI_DIR)
+render_flight = SingleFlight()
+
+
+def on_stale_paths(paths: Iterable[Path]) -> None:
+    warn_templates.invalidate(paths)
+    page_index.refresh_paths(paths)
+    relinked = link_graph.refresh_paths(paths)
+    if relinked:
+        render_cache.invalidate_paths(relinked)
+
+
+render_cache.on_stale(on_stale_paths)
+
+
+def on_constants_changed(keys: set[str], version: int) -> None:
+    render_cache.invalidate_constants(keys, version)
+
+
+Constants.subscribe(on_constants_changed)
+
+
+def on_files_changed(paths: set[Path]) -> None:
+    # Сначала индекс, чтобы перерендер уже видел свежую мету соседей.
+    # Страницы, у которых поменялся блок «ссылаются сюда», тоже протухли
+    warn_templates.invalidate(paths)
+    page_index.refresh_paths(paths)
+    relinked = link_graph.refresh_paths(paths)
+    render_cache.invalidate_paths(set(paths) | relinked)
 
 
 @router.get("/wiki/{page:path}", response_class=HTMLResponse)
-def wiki_page(request: Request, page: Path):
+async def wiki_page(request: Request, page: Path):
+    timing.start_request()
     md_path = WIKI_DIR / page
     if md_path.is_dir() or str(page).endswith("/"):
         md_path = md_path / "index.md"
     else:
         md_path = md_path.with_suffix(".md")
 
-    if not md_path.resolve().is_relative_to(WIKI_DIR.resolve()):
+    md_path = md_path.resolve()
+    if not md_path.is_relative_to(WIKI_DIR.resolve()):
         return Response(
             content="Invalid path",
             status_code=403,
             media_type="text/html",
         )
 
-    try:
-        content = md_path.read_text(encoding="utf-8")
+    # Версия и значения констант из одного снапшота, даже если overlord
+    # обновит их посреди запроса
+    constants = Constants.snapshot()
+    entry = render_cache.get(md_path, constants.version)
+    if entry is not None and not fits_entry(entry, constants):
+        entry = None
 
-    except FileNotFoundError:
-        return Response(
-            content="Page not found",
-            status_code=404,
-            media_type="text/html",
+    # Без вотчера протухшие файлы замечает get(), а индексы по ним
+    # обновляются до рендера, но не в event loop
+    if render_cache.has_stale():
+        await run_in_threadpool(render_cache.process_stale)
+
+    if entry is None:
+        # Одновременные промахи по одной и той же версии страницы ждут
+        # один рендер. Поколение кеша в ключе: запрос, пришедший после
+        # инвалидации, не должен получить рендер, начатый до неё
+        generation = render_cache.generation
+        try:
+            with timing.measure("render"):
+                entry = await render_flight.do(
+                    (md_path, constants.version, generation),
+                    lambda: render_entry(md_path, constants, generation),
+                )
+
+        except RenderQueueFull:
+            return Response(
+                content="Server is busy",
+                status_code=503,
+                media_type="text/html",
+                headers={"Retry-After": "1"},
+            )
+
+        if entry is None:
+            return Response(
+                content="Page not found",
+                status_code=404,
+                media_type="text/html",
+            )
+
+    encoding = choose_encoding(request.headers.get("accept-encoding"))
+
+    # Горячий путь: тело уже собрано, отвечаем прямо из event loop
+    page_body = current_page_body(entry, constants)
+    if page_body is not None and not_modified(request, page_body):
+        return page_response(page_body, encoding, status_code=304)
+
+    if page_body is None or not has_encoding(page_body, encoding):
+        page_body = await run_in_threadpool(
+            prepare_page_body, entry, encoding, constants
         )
+        if not_modified(request, page_body):
+            return page_response(page_body, encoding, status_code=304)
 
-    md = Markdown(
-        extensions=[
-            AutoLinkButtonsExtension(wiki_dir=WIKI_DIR),  # Динамические кнопки
-            "fenced_code",  # Блоки кода через тройные кавычки (```), как на GitHub
-            "tables",  # Markdown-таблицы
-            TableImgExtension(),  # Поддержка картинок в таблицах
-            "meta",  # Заголовки-мета в начале файла (например, автор, дата)
-            TocTreeExtension(),  # Автоматическое оглавление по заголовкам
-            "admonition",  # Поддержка блоков с предупреждениями, заметками и пр.
-            "footnotes",  # Сноски
-            "smarty",  # Типографические ковычки
-            "nl2br",  # Превращает одиночные \n в <br />
-            WikiLinkExtension(),  # Поддержка [[url|name]] для вики-стилей
-            ConstExtension(constants=Constants.get_all_const()),  # Константы для замены
-            ImgUrlExtension(),  # Для нормальной работы ссылок
-            ImgBlockExtension(),  # Для блоков с картинками и текстом
-            RedactExtension(),  # Для обфускации информации с сайта пока не заглянут в код
-            ImgExtension(),  # Макрос для картинок
-            ButtonExtension(),  # Работа с кнопками и их оформлением
-            StripCommentsExtension(),  # В пизду комментарии, так же стрипает весь текст
-            FolderTreeExtension(),  # Для создания красивых деревьев
-            SmallTextExtension(),  # Маленький текст
-            StrikethroughExtension(),  # Зачёркнутый текст
-            LobotomyExtension(),  # Немного красоты в вики
-            WarnIncludeExtension(),  # Подстановка теплейтов
-        ],
+    return page_response(page_body, encoding)
+
+
+async def render_entry(
+    md_path: Path, constants: ConstSnapshot, generation: int
+) -> Optional[CacheEntry]:
+    # Чтение и конвертация уходят в отдельный пул, event loop их не ждёт
+    start = time.perf_counter()
+    result = await render_executor.render(md_path, constants.data)
+    render_latency.observe(
+        (("backend", render_executor.backend),), time.perf_counter() - start
+    )
+    if result is None:
+        return None
+
+    page_stamp, page_data, render_timings = result
+    # Стадии рендера достаются запросу, который его запустил
+    timing.record(render_timings)
+    # Страницу со слотами под константы смена конфига не трогает
+    const_version = constants.version if page_data.const_slots is None else None
+    # Тело собирается тут же, чтобы и шаблон рендерился один раз на всех
+    return await run_in_threadpool(
+        store_entry,
+        md_path,
+        page_data,
+        const_version,
+        page_stamp,
+        generation,
+        constants,
     )
 
-    setattr(md, "current_file", md_path)
-    rendered_html = md.convert(content)
-    meta = getattr(md, "Meta", {})
-
-    title = meta.get("title", [None])[0] or "ЗАБЫЛИ НАИМЕНОВАНИЕ УСТАНОВИТЬ"
-    data = meta.get("date", [None])[0] or "ЗАБЫЛИ ДАТУ УСТАНОВИТЬ"
-    background_url = meta.get("background", [None])[0] or "images/wallpaper.jpeg"
-
-    return templates.TemplateResponse(
-        "wiki_template.html",
-        {
-            "request": request,
-            "content": rendered_html,
-            "title": title,
-            "data": data,
-            "background_url": background_url,
+
+def fits_entry(entry: CacheEntry, constants: ConstSnapshot) -> bool:
+    # Значения, меняющие разбор макросов, вставкой не подставить - под них
+    # страница рендерится заново, уже привязанной к версии констант
+    slots = entry.page.const_slots
+    return slots is None or fits_constants(slots, constants.data)
+
+
+def const_values(page: RenderedPage, constants: ConstSnapshot) -> tuple:
+    return tuple(constants.data.get(key) for _, key in page.const_slots or ())
+
+
+def store_entry(
+    md_path: Path,
+    page_data: RenderedPage,
+    const_version: Optional[int],
+    page_stamp: Optional[int],
+    generation: int,
+    constants: ConstSnapshot,
+) -> CacheEntry:
+    # «Ссылаются сюда» снимаются на момент рендера. Когда список меняется,
+    # страница выкидывается из кеша целиком, а файлы ссылающихся страниц -
+    # её зависимости: их заголовки стоят в этом блоке. Запись попадает в
+    # кеш уже с ними, чтобы параллельный хит не собрал тело без блока
+    backlinks = page_backlinks(md_path)
+    entry = render_cache.put(
+        md_path,
+        page_data,
+        const_version,
+        page_stamp,
+        generation,
+        extra_dependencies=[info.path for info in backlinks],
+        artifacts={
+            "backlinks": backlinks,
+            "backlinks_at": link_graph.changed_at(md_path),
         },
     )
+    get_page_body(entry, constants)
+    return entry
+
+
+def page_backlinks(md_path: Path) -> list[PageInfo]:
+    infos = [page_index.get(path) for path in link_graph.backlinks(md_path)]
+    return sorted(
+        (info for info in infos if info is not None),
+        key=lambda info: (info.title or info.path.stem).lower(),
+    )
+
+
+def current_page_body(
+    entry: CacheEntry, constants: ConstSnapshot
+) -> Optional[PageBody]:
+    # Тело страницы собирается один раз на запись кеша; пересобирается,
+    # только если поменялись ?v= у статики, зашитые в шаблон, или значения
+    # констант, которые есть на этой странице
+    page_body: Optional[PageBody] = entry.artifacts.get("body")
+    if (
+        page_body is None
+        or page_body.static_generation != template_env.static_generation
+    ):
+        return None
+
+    if page_body.const_version != constants.version:
+        if page_body.const_values != const_values(entry.page, constants):
+            return None
+
+        page_body = page_body._replace(const_version=constants.version)
+        entry.artifacts["body"] = page_body
+
+    return page_body
+
+
+def get_page_body(entry: CacheEntry, constants: ConstSnapshot) -> PageBody:
+    page_body = current_page_body(entry, constants)
+    if page_body is not None:
+        return page_body
+
+    static_generation = template_env.static_generation
+    backlinks = entry.artifacts.get("backlinks", [])
+    # Константы вставляются в готовый HTML, Markdown тут уже не нужен
+    with timing.measure("constants"):
+        page = bind_constants(entry.page, constants.data)
+
+    with timing.measure("template"):
+        body = templates.get_template(TEMPLATE_NAME).render(
+            template_context(page, backlinks)
+        )
+    body = body.encode("utf-8")
+
+    stamps = [s for s in entry.stamps.values() if s is not None]
+    # Страница без констант от их смены не меняется
+    const_changed_at = constants.updated_at if entry.page.const_slots != () else 0.0
+    last_modified = max(
+        [s / 1e9 for s in stamps]
+        + [(file_stamp(TEMPLATE_PATH) or 0) / 1e9, template_env.static_changed_at]
+        + [entry.artifacts.get("backlinks_at", 0.0), const_changed_at]
+        + [info.mtime for info in backlinks]
+    )
+
+    page_body = PageBody(
+        body=body,
+        etag=f'"{hashlib.sha256(body).hexdigest()[:16]}"',
+        last_modified=int(last_modified),
+        static_generation=static_generation,
+        const_version=constants.version,
+        const_values=const_values(entry.page, constants),
+        compressed={},
+    )
+    entry.artifacts["body"] = page_body
+    return page_body
+
+
+def has_encoding(page_body: PageBody, encoding: Optional[str]) -> bool:
+    return (
+        encoding is None
+        or len(page_body.body) < MIN_SIZE
+        or encoding in page_body.compressed
+    )
+
+
+def prepare_page_body(
+    entry: CacheEntry, encoding: Optional[str], constants: ConstSnapshot
+) -> PageBody:
+    # Сжатый вариант считается один раз на версию тела
+    page_body = get_page_body(entry, constants)
+    if not has_encoding(page_body, encoding):
+        with timing.measure("compress"):
+            page_body.compressed[encoding] = compress(page_body.body, encoding)
+
+    return page_body
+
+
+def not_modified(request: Request, page_body: PageBody) -> bool:
+    # If-None-Match главнее If-Modified-Since (RFC 9110, 13.2.2)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [strip_etag(t) for t in if_none_match.split(",")]
+        return "*" in tags or page_body.etag in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+
+        except (TypeError, ValueError):
+            return False
+
+        return page_body.last_modified <= since
+
+    return False
+
+
+def strip_etag(tag: str) -> str:
+    # У сжатых вариантов к тегу приписан encoding, но содержимое то же
+    tag = tag.strip().removeprefix("W/")
+    for encoding in ("br", "gzip"):
+        tag = tag.replace(f'-{encoding}"', '"')
+
+    return tag
+
+
+def page_response(
+    page_body: PageBody, encoding: Optional[str], status_code: int = 200
+) -> Response:
+    headers = {
+        "ETag": page_body.etag,
+        "Last-Modified": formatdate(page_body.last_modified, usegmt=True),
+        # Кешировать можно, но каждый раз сверяясь с сервером
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+    }
+
+    server_timing = timing.finish_request()
+    if server_timing is not None:
+        headers["Server-Timing"] = server_timing
+
+    body = page_body.body
+    if encoding is not None and len(body) >= MIN_SIZE:
+        headers["ETag"] = f'{page_body.etag[:-1]}-{encoding}"'
+        if status_code != 304:
+            body = page_body.compressed[encoding]
+            headers["Content-Encoding"] = encoding
+
+    if status_code == 304:
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=body, media_type="text/html", headers=headers)
+
+
+def template_context(
+    page_data: RenderedPage, backlinks: Iterable[PageInfo] = ()
+) -> dict:
+    return {
+        "content": page_data.html,
+        "title": page_data.title,
+        "data": page_data.data,
+        "background_url": page_data.background_url,
+        "backlinks": [
+            {"href": info.href, "title": info.title or info.path.stem}
+            for info in backlinks
+        ],
+    }
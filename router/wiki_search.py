@@ -0,0 +1,338 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from fastapi import APIRouter, Query
+
+from data_control.constants import Constants
+from template_env import BASE_DIR
+
+from .extensions.constant_extension import fits_constants
+from .page_index import get_page_index, page_href
+from .render_cache import file_stamp, render_cache
+from .renderer import WIKI_DIR, RenderedPage, bind_constants, get_renderer
+from .search_index import (
+    VERSION,
+    SearchIndex,
+    Section,
+    SectionTerms,
+    build_index,
+    extract_sections,
+    section_terms,
+)
+
+log = logging.getLogger(__name__)
+
+router = APIRouter()
+
+SEARCH_INDEX = BASE_DIR / "build" / "search-index.bin"
+
+
+def is_page(md_path: Path) -> bool:
+    # _warn и прочие служебные папки - это шаблоны, а не страницы
+    rel = md_path.relative_to(WIKI_DIR.resolve())
+    return not any(part.startswith("_") for part in rel.parts)
+
+
+def fingerprint(constants: dict[str, str]) -> str:
+    # Всё, от чего зависит индекс: тексты (включая шаблоны _warn),
+    # константы и формат файла
+    h = hashlib.sha256(f"v{VERSION}\n".encode())
+    h.update(json.dumps(constants, sort_keys=True, ensure_ascii=False).encode())
+    for md_file in sorted(WIKI_DIR.rglob("*.md")):
+        h.update(f"{md_file.relative_to(WIKI_DIR)}:{file_stamp(md_file)}\n".encode())
+
+    return h.hexdigest()
+
+
+class IndexedPage(NamedTuple):
+    sections: tuple[Section, ...]
+    # section_terms() по каждому разделу: токенизация - заметная часть сборки
+    terms: tuple[SectionTerms, ...]
+    # Правка любого из этих файлов или констант меняет текст страницы
+    dependencies: frozenset[Path]
+    const_keys: frozenset[str]
+
+
+def wiki_pages() -> list[Path]:
+    return [
+        info.path for info in get_page_index(WIKI_DIR).pages() if is_page(info.path)
+    ]
+
+
+def cached_page(
+    md_path: Path, constants: dict[str, str], const_version: int
+) -> Optional[RenderedPage]:
+    # Страница, которую уже отрендерили для запроса, даёт тот же HTML, что
+    # и полный рендер, если константы подставляются вставкой
+    entry = render_cache.peek(md_path, const_version)
+    if entry is None:
+        return None
+
+    slots = entry.page.const_slots
+    if slots is not None and not fits_constants(slots, constants):
+        return None
+
+    return bind_constants(entry.page, constants)
+
+
+def index_page(
+    md_path: Path, constants: dict[str, str], const_version: Optional[int] = None
+) -> Optional[IndexedPage]:
+    page = None
+    if const_version is not None:
+        page = cached_page(md_path, constants, const_version)
+
+    if page is None:
+        try:
+            content = md_path.read_text(encoding="utf-8")
+
+        except FileNotFoundError:
+            return None
+
+        page = get_renderer().render(md_path, content, constants)
+
+    href = page_href(WIKI_DIR.resolve(), md_path)
+    sections = tuple(extract_sections(page.html, href, page.title))
+    return IndexedPage(
+        sections,
+        tuple(section_terms(section) for section in sections),
+        page.dependencies,
+        page.const_keys,
+    )
+
+
+def update_pages(
+    pages: Optional[dict[Path, IndexedPage]],
+    changed: set[Path],
+    keys: set[str],
+    constants: dict[str, str],
+    const_version: Optional[int] = None,
+) -> dict[Path, IndexedPage]:
+    # Перерендериваются только новые страницы и те, что зависят от
+    # изменившихся файлов или констант. pages=None - все страницы заново
+    current = wiki_pages()
+    old = pages or {}
+    pages = {}
+    for md_path in current:
+        page = old.get(md_path)
+        if (
+            page is None
+            or md_path in changed
+            or not page.dependencies.isdisjoint(changed)
+            or not page.const_keys.isdisjoint(keys)
+        ):
+            page = index_page(md_path, constants, const_version)
+
+        if page is not None:
+            pages[md_path] = page
+
+    return pages
+
+
+def pages_meta(pages: dict[Path, IndexedPage]) -> list:
+    # Зависимости страниц лежат в самом индексе: после рестарта по ним
+    # можно продолжить обновлять его по кусочку, см. restore_pages()
+    return [
+        [
+            rel_path(md_path),
+            sorted(rel_path(dep) for dep in page.dependencies),
+            sorted(page.const_keys),
+        ]
+        for md_path, page in pages.items()
+    ]
+
+
+def rel_path(path: Path) -> str:
+    return Path(os.path.relpath(path, BASE_DIR)).as_posix()
+
+
+def restore_pages(index: SearchIndex) -> Optional[dict[Path, IndexedPage]]:
+    meta = index.meta.get("pages")
+    if meta is None:
+        return None
+
+    sections: dict[str, list[Section]] = {}
+    for doc_id, (href, anchor, title, heading, *_) in enumerate(index.docs):
+        section = Section(href, anchor, title, heading, index.text(doc_id))
+        sections.setdefault(href, []).append(section)
+
+    pages = {}
+    wiki_dir = WIKI_DIR.resolve()
+    for rel, deps, const_keys in meta:
+        md_path = (BASE_DIR / rel).resolve()
+        page_sections = tuple(sections.get(page_href(wiki_dir, md_path), ()))
+        pages[md_path] = IndexedPage(
+            page_sections,
+            tuple(section_terms(section) for section in page_sections),
+            frozenset((BASE_DIR / dep).resolve() for dep in deps),
+            frozenset(const_keys),
+        )
+
+    return pages
+
+
+def save_index(path: Path, pages: dict[Path, IndexedPage], meta: dict) -> None:
+    # Порядок страниц - как в индексе страниц, от него зависят номера разделов
+    ordered = [pages[md_path] for md_path in sorted(pages)]
+    sections = [section for page in ordered for section in page.sections]
+    terms = [terms for page in ordered for terms in page.terms]
+    # По const_keys видно, касается ли индекса смена констант
+    const_keys = set().union(*(page.const_keys for page in ordered))
+    meta = {**meta, "const_keys": sorted(const_keys), "pages": pages_meta(pages)}
+    data = build_index(sections, meta, terms)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def write_index(path: Path, constants: dict[str, str]) -> None:
+    # Отпечаток снимается до рендера: правка посреди сборки сделает индекс
+    # устаревшим, а не свежим с виду
+    meta = {"fingerprint": fingerprint(constants)}
+    save_index(path, update_pages(None, set(), set(), constants), meta)
+
+
+class SearchService:
+    # Держит открытый индекс и обновляет его в фоне: при старте, если файл
+    # устарел, и после правок в вики, пачкой раз в debounce секунд. Заново
+    # рендерятся только страницы, которых коснулись правки
+
+    def __init__(self, path: Path, debounce: float = 2.0):
+        self.path = Path(path)
+        self.debounce = debounce
+        self.index: Optional[SearchIndex] = None
+        self.rebuilds = 0
+
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        # Поиск идёт по mmap старого индекса, закрыть его можно, только
+        # когда по нему никто не ищет
+        self._index_lock = threading.Lock()
+        # Пересборки по одной: таймер мог сработать, пока идёт прошлая
+        self._rebuild_lock = threading.Lock()
+        # Страницы текущего индекса. None - неизвестны, собрать все заново
+        self._pages: Optional[dict[Path, IndexedPage]] = None
+        # Файл на диске свежий, страницы можно поднять из него
+        self._restorable = False
+        self._changed: set[Path] = set()
+        self._changed_keys: set[str] = set()
+
+    def start(self) -> None:
+        try:
+            index = SearchIndex(self.path)
+
+        except (OSError, ValueError):
+            index = None
+
+        if index is not None:
+            self._swap(index)
+            if index.meta.get("fingerprint") == fingerprint(Constants.get_all_const()):
+                self._restorable = True
+                return
+
+        self.schedule_rebuild(delay=0)
+
+    def stop(self) -> None:
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+        with self._rebuild_lock:
+            self._swap(None)
+            self._pages = None
+            self._restorable = False
+
+    def schedule_rebuild(self, delay: Optional[float] = None) -> None:
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+
+            self._timer = threading.Timer(
+                self.debounce if delay is None else delay, self._rebuild
+            )
+            self._timer.daemon = True
+            self._timer.start()
+
+    def on_files_changed(self, paths: set[Path]) -> None:
+        wiki_dir = WIKI_DIR.resolve()
+        changed = {Path(p) for p in paths if Path(p).is_relative_to(wiki_dir)}
+        if changed:
+            with self._lock:
+                self._changed |= changed
+
+            self.schedule_rebuild()
+
+    def on_constants_changed(self, keys: set[str], version: int) -> None:
+        index = self.index
+        used = index.meta.get("const_keys") if index is not None else None
+        if used is None or keys & set(used):
+            with self._lock:
+                self._changed_keys |= keys
+
+            self.schedule_rebuild()
+
+    def _rebuild(self) -> None:
+        with self._rebuild_lock:
+            with self._lock:
+                changed, self._changed = self._changed, set()
+                keys, self._changed_keys = self._changed_keys, set()
+
+            try:
+                pages = self._pages
+                if pages is None and self._restorable and self.index is not None:
+                    pages = restore_pages(self.index)
+
+                constants = Constants.snapshot()
+                meta = {"fingerprint": fingerprint(constants.data)}
+                pages = update_pages(
+                    pages, changed, keys, constants.data, constants.version
+                )
+                save_index(self.path, pages, meta)
+                index = SearchIndex(self.path)
+
+            except Exception:
+                log.exception("search index rebuild failed")
+                # Что успело поменяться, неизвестно: в следующий раз всё заново
+                self._pages = None
+                self._restorable = False
+                return
+
+            self._pages = pages
+            self._swap(index)
+            self.rebuilds += 1
+
+    def _swap(self, index: Optional[SearchIndex]) -> None:
+        with self._index_lock:
+            old, self.index = self.index, index
+
+        if old is not None:
+            old.close()
+
+    def search(self, query: str, limit: int = 10) -> Optional[list[dict]]:
+        with self._index_lock:
+            if self.index is None:
+                return None
+
+            return self.index.search(query, limit)
+
+
+search_service = SearchService(Path(os.getenv("WIKI_SEARCH_INDEX", SEARCH_INDEX)))
+
+
+@router.get("/wiki-search")
+async def wiki_search(
+    q: str = Query("", max_length=200), limit: int = Query(10, ge=1, le=50)
+):
+    results = search_service.search(q, limit)
+    if results is None:
+        return {"query": q, "ready": False, "results": []}
+
+    return {"query": q, "ready": True, "results": results}
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# Сравнивает общий проход по макросам с цепочкой из трёх постпроцессоров
+# на большой странице, склеенной из всей вики.
+#
+#   python scripts/bench_macros.py [--rounds N] [--copies N]
+import re
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from router.renderer import WIKI_DIR, build_markdown  # noqa: E402
+
+
+def bench(fn, text: str, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn(text)
+
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    rounds = 20
+    copies = 5
+    args = sys.argv[1:]
+    for i, a in enumerate(args):
+        if a == "--rounds" and i + 1 < len(args):
+            rounds = int(args[i + 1])
+
+        if a == "--copies" and i + 1 < len(args):
+            copies = int(args[i + 1])
+
+    text = "\n".join(
+        p.read_text(encoding="utf-8") for p in sorted(WIKI_DIR.rglob("*.md"))
+    )
+    text *= copies
+
+    md = build_markdown()
+    setattr(md, "dependencies", set())
+    macro = md.postprocessors["macro_postprocessor"]
+    keys = set(re.findall(r"!const\[(.+?)\]", text))
+    macro.const.constants = {k.strip(): f"value of {k.strip()}" for k in keys}
+
+    if macro.run(text) != macro.run_sequential(text):
+        sys.exit("Fused output differs from the sequential chain")
+
+    fused = bench(macro.run, text, rounds)
+    sequential = bench(macro.run_sequential, text, rounds)
+
+    print(f"document: {len(text) / 1024:.0f} KiB, rounds: {rounds}")
+    print(f"sequential:  {sequential / rounds * 1000:8.3f} ms/page")
+    print(f"fused:       {fused / rounds * 1000:8.3f} ms/page")
+    print(f"speedup:     {sequential / fused:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from router.renderer import WIKI_DIR, WikiRenderer, build_markdown  # noqa: E402
+
+
+def bench_fresh(pages: list[tuple[Path, str]], rounds: int) -> float:
+    # Как было раньше: новый Markdown на каждый запрос
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for md_path, content in pages:
+            md = build_markdown()
+            setattr(md, "current_file", md_path)
+            md.convert(content)
+
+    return time.perf_counter() - start
+
+
+def bench_pooled(pages: list[tuple[Path, str]], rounds: int) -> float:
+    renderer = WikiRenderer()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for md_path, content in pages:
+            renderer.render(md_path, content, {})
+
+    return time.perf_counter() - start
+
+
+def bench_setup(rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        build_markdown()
+
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    rounds = 20
+    args = sys.argv[1:]
+    for i, a in enumerate(args):
+        if a == "--rounds" and i + 1 < len(args):
+            rounds = int(args[i + 1])
+
+    pages = [
+        (p, p.read_text(encoding="utf-8"))
+        for p in sorted(WIKI_DIR.rglob("*.md"))
+        if "_warn" not in p.parts
+    ]
+    total = len(pages) * rounds
+
+    setup = bench_setup(total)
+    fresh = bench_fresh(pages, rounds)
+    pooled = bench_pooled(pages, rounds)
+
+    print(f"pages: {len(pages)}, rounds: {rounds}")
+    print(f"setup only:       {setup / total * 1000:8.3f} ms/page")
+    print(f"fresh Markdown:   {fresh / total * 1000:8.3f} ms/page")
+    print(f"pooled renderer:  {pooled / total * 1000:8.3f} ms/page")
+    print(f"speedup:          {fresh / pooled:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+# Бенчмарк рендера по всей вики: холодный и тёплый рендер каждой страницы,
+# время каждого процессора Markdown, задержка запросов через ASGI внутри
+# процесса и пик памяти. Результат можно сохранить и потом сравнивать с
+# ним, чтобы замедление любого расширения было видно до деплоя.
+#
+#   python scripts/bench_wiki.py [--rounds N] [--requests N] [--constants F]
+#                                [--save bench.json] [--baseline bench.json]
+#                                [--threshold 0.2]
+#
+# С --baseline код выхода 1, если общие цифры или какой-то процессор стали
+# медленнее больше чем на threshold (и больше чем на шум в абсолютных
+# цифрах). Отдельные страницы слишком шумят, по ним только отчёт.
+import argparse
+import asyncio
+import json
+import platform
+import resource
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from app import app  # noqa: E402
+from router.extensions.warn_include_extension import warn_templates  # noqa: E402
+from router.page_index import get_page_index, page_href  # noqa: E402
+from router.render_cache import render_cache  # noqa: E402
+from router.render_pool import render_executor  # noqa: E402
+from router.renderer import WIKI_DIR, WikiRenderer  # noqa: E402
+from router.timing import Profiler, instrument  # noqa: E402
+from scripts.build_static import (  # noqa: E402
+    _init_worker,
+    discover_pages,
+    load_constants,
+)
+from template_env import warm_static_versions  # noqa: E402
+
+BASELINE_VERSION = 1
+# Разница меньше этого - шум, а не регрессия (мс, для памяти МиБ)
+MIN_DELTA = {"page": 0.5, "extension": 0.05, "latency": 0.3, "memory": 1.0}
+# Единичные замеры, сравнивать их бессмысленно
+UNGATED = {"cold_request_max_ms", "warm_request_max_ms", "max_rss_mb"}
+
+
+def load_pages() -> list[tuple[Path, str]]:
+    return [(p, p.read_text(encoding="utf-8")) for p in discover_pages()]
+
+
+def rel(md_path: Path) -> str:
+    return str(md_path.relative_to(WIKI_DIR))
+
+
+def bench_cold(
+    pages: list[tuple[Path, str]], constants: dict, rounds: int = 1
+) -> dict[str, float]:
+    # Первый проход после старта: новый рендерер, пустые индекс и шаблоны.
+    # Из нескольких таких проходов берётся лучший, чтобы не мерить шум
+    times: dict[str, float] = {}
+    for _ in range(rounds):
+        warn_templates.invalidate()
+        get_page_index(WIKI_DIR).build()
+        renderer = WikiRenderer()
+        for md_path, content in pages:
+            start = time.perf_counter()
+            renderer.render(md_path, content, constants)
+            elapsed = (time.perf_counter() - start) * 1000
+            key = rel(md_path)
+            times[key] = min(times.get(key, elapsed), elapsed)
+
+    return times
+
+
+def bench_warm(
+    pages: list[tuple[Path, str]], constants: dict, rounds: int
+) -> dict[str, float]:
+    renderer = WikiRenderer()
+    times: dict[str, float] = {}
+    for _ in range(rounds):
+        for md_path, content in pages:
+            start = time.perf_counter()
+            renderer.render(md_path, content, constants)
+            elapsed = (time.perf_counter() - start) * 1000
+            key = rel(md_path)
+            times[key] = min(times.get(key, elapsed), elapsed)
+
+    return times
+
+
+def bench_extensions(
+    pages: list[tuple[Path, str]], constants: dict, rounds: int
+) -> tuple[dict[str, float], set[str]]:
+    renderer = WikiRenderer()
+    profiler = Profiler()
+    custom = instrument(renderer.md, profiler)
+
+    best: dict[str, float] = {}
+    for _ in range(rounds):
+        profiler.totals.clear()
+        for md_path, content in pages:
+            renderer.render(md_path, content, constants)
+
+        for name, total in profiler.totals.items():
+            per_page = total / len(pages) * 1000
+            best[name] = min(best.get(name, per_page), per_page)
+
+    return best, custom
+
+
+async def asgi_get(path: str) -> int:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"bench"), (b"accept-encoding", b"gzip")],
+        "server": ("bench", 80),
+        "client": ("127.0.0.1", 1),
+    }
+    status = 0
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+async def bench_requests(
+    urls: list[str], count: int
+) -> tuple[list[float], list[float], int]:
+    # Холодный проход - по разу на страницу с пустым кешем, дальше тёплые.
+    # Память меряется отдельным проходом: tracemalloc сильно тормозит
+    cold = await timed_requests(urls, len(urls), cold=True)
+    warm = await timed_requests(urls, count, cold=False)
+    peak = await traced(timed_requests(urls, len(urls), cold=True))
+    return cold, warm, peak
+
+
+async def traced(coro) -> int:
+    tracemalloc.start()
+    try:
+        await coro
+        return tracemalloc.get_traced_memory()[1]
+
+    finally:
+        tracemalloc.stop()
+
+
+async def timed_requests(urls: list[str], count: int, cold: bool) -> list[float]:
+    latencies = []
+    for i in range(count):
+        if cold and i % len(urls) == 0:
+            render_cache.invalidate()
+
+        start = time.perf_counter()
+        status = await asgi_get(urls[i % len(urls)])
+        latencies.append((time.perf_counter() - start) * 1000)
+        if status != 200:
+            raise RuntimeError(f"{urls[i % len(urls)]}: HTTP {status}")
+
+    return latencies
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def latency_summary(latencies: list[float]) -> dict[str, float]:
+    return {
+        "p50": percentile(latencies, 0.50),
+        "p99": percentile(latencies, 0.99),
+        "max": max(latencies),
+    }
+
+
+def compare(
+    current: dict, baseline: dict, threshold: float
+) -> tuple[list[str], list[str]]:
+    # (регрессии, заметно замедлившиеся страницы)
+    def slower(kind: str, items: dict, old_items: dict) -> list[str]:
+        found = []
+        for name, new in items.items():
+            old = old_items.get(name)
+            if old and new > old * (1 + threshold) and new - old > MIN_DELTA[kind]:
+                found.append(
+                    f"{name}: {old:.3f} -> {new:.3f} (+{(new / old - 1) * 100:.0f}%)"
+                )
+
+        return found
+
+    summary = {k: v for k, v in current["summary"].items() if k not in UNGATED}
+    regressions = slower(
+        "latency",
+        {k: v for k, v in summary.items() if not k.endswith("_mb")},
+        baseline["summary"],
+    )
+    regressions += slower(
+        "memory",
+        {k: v for k, v in summary.items() if k.endswith("_mb")},
+        baseline["summary"],
+    )
+    regressions += slower("extension", current["extensions"], baseline["extensions"])
+    pages = slower("page", current["pages"], baseline["pages"])
+    return regressions, pages
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark wiki rendering")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument(
+        "--constants", type=Path, help="JSON file instead of asking overlord"
+    )
+    parser.add_argument("--save", type=Path, help="write results as a baseline")
+    parser.add_argument("--baseline", type=Path, help="compare against a baseline")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument("--top", type=int, default=10, help="slowest pages to show")
+    args = parser.parse_args()
+
+    constants = load_constants(args.constants)
+    _init_worker(constants)
+    warm_static_versions()
+
+    pages = load_pages()
+
+    cold = bench_cold(pages, constants, args.rounds)
+    tracemalloc.start()
+    bench_cold(pages, constants)
+    render_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    warm = bench_warm(pages, constants, args.rounds)
+    extensions, custom = bench_extensions(pages, constants, args.rounds)
+
+    # Запросы идут через тот же путь, что и в проде: роут, кеш, пул рендера
+    urls = [page_href(WIKI_DIR, md_path) for md_path, _ in pages]
+    render_executor.start()
+    try:
+        cold_latency, warm_latency, request_peak = asyncio.run(
+            bench_requests(urls, args.requests)
+        )
+
+    finally:
+        render_executor.shutdown()
+
+    summary = {
+        "cold_render_ms": sum(cold.values()),
+        "warm_render_ms": sum(warm.values()),
+        **{f"cold_request_{k}_ms": v for k, v in latency_summary(cold_latency).items()},
+        **{f"warm_request_{k}_ms": v for k, v in latency_summary(warm_latency).items()},
+        "render_peak_mb": render_peak / 2**20,
+        "request_peak_mb": request_peak / 2**20,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+    result = {
+        "version": BASELINE_VERSION,
+        "meta": {
+            "python": platform.python_version(),
+            "pages": len(pages),
+            "rounds": args.rounds,
+            "requests": args.requests,
+        },
+        "summary": summary,
+        "extensions": extensions,
+        "pages": warm,
+    }
+
+    print(f"pages: {len(pages)}, rounds: {args.rounds}, requests: {args.requests}")
+    print()
+    for name, value in summary.items():
+        print(f"{name:<28}{value:10.3f}")
+
+    print()
+    print(f"{'processor (ms/page)':<44}{'time':>10}")
+    for name, value in sorted(extensions.items(), key=lambda x: -x[1]):
+        mark = "*" if name in custom else " "
+        print(f"{mark} {name:<42}{value:10.3f}")
+
+    print("  * - расширения из router/extensions")
+    print()
+    print(f"{'slowest pages (warm, ms)':<60}{'warm':>8}{'cold':>8}")
+    for name, value in sorted(warm.items(), key=lambda x: -x[1])[: args.top]:
+        print(f"{name:<60}{value:8.2f}{cold[name]:8.2f}")
+    print(f"median page: {statistics.median(warm.values()):.2f} ms")
+
+    if args.save:
+        args.save.parent.mkdir(parents=True, exist_ok=True)
+        args.save.write_text(json.dumps(result, indent=1), encoding="utf-8")
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        if baseline.get("version") != BASELINE_VERSION:
+            sys.exit(f"{args.baseline}: unsupported baseline version")
+
+        regressions, pages = compare(result, baseline, args.threshold)
+        print()
+        if pages:
+            print(f"Slower pages against {args.baseline} (not gated):")
+            for line in pages:
+                print(f"  {line}")
+            print()
+
+        if regressions:
+            print(f"Regressions against {args.baseline}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+
+        print(f"No regressions against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
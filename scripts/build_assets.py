@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+# Хеширует всё из static/ в манифест, который app.py грузит на старте:
+# ссылки static_url получают ?v=<хеш содержимого> без чтения файлов.
+import json
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from template_env import ASSET_MANIFEST, build_asset_manifest  # noqa: E402
+
+
+def main() -> None:
+    out = Path(sys.argv[1]) if len(sys.argv) > 1 else ASSET_MANIFEST
+    manifest = build_asset_manifest()
+
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out.with_name(f".{out.name}.tmp")
+    tmp.write_text(json.dumps(manifest, ensure_ascii=False, indent=1), encoding="utf-8")
+    tmp.replace(out)
+
+    print(f"Done: {out} ({len(manifest['files'])} files)")
+
+
+if __name__ == "__main__":
+    main()
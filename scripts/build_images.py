@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# Нарезает картинки из static/images в уменьшенные копии WebP + JPEG (PNG,
+# если есть прозрачность) под srcset. Результат лежит в static/derived,
+# список - в build/images-manifest.json, который app.py грузит на старте.
+#
+#   python scripts/build_images.py [--jobs N] [--full]
+import argparse
+import json
+import os
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+from PIL import Image
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from template_env import (  # noqa: E402
+    DERIVED_DIR,
+    IMAGE_MANIFEST,
+    IMAGE_MANIFEST_VERSION,
+    STATIC_DIR,
+)
+
+SOURCE_DIR = STATIC_DIR / "images"
+SUFFIXES = {".png", ".jpg", ".jpeg"}
+WIDTHS = (320, 640, 960, 1280, 1920)
+
+
+def discover_sources() -> list[Path]:
+    return [
+        p
+        for p in sorted(SOURCE_DIR.rglob("*"))
+        if p.is_file() and p.suffix.lower() in SUFFIXES
+    ]
+
+
+def stamp(path: Path) -> list[int]:
+    st = path.stat()
+    return [st.st_mtime_ns, st.st_size]
+
+
+def has_alpha(img: Image.Image) -> bool:
+    if img.mode in ("RGBA", "LA", "PA"):
+        return img.getchannel("A").getextrema()[0] < 255
+
+    return img.mode == "P" and "transparency" in img.info
+
+
+def build_one(src: Path) -> tuple[str, dict]:
+    rel = src.relative_to(STATIC_DIR).as_posix()
+    out_dir = DERIVED_DIR / src.relative_to(STATIC_DIR).with_suffix("")
+    shutil.rmtree(out_dir, ignore_errors=True)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    with Image.open(src) as img:
+        img.load()
+        width, height = img.size
+        alpha = has_alpha(img)
+        img = img.convert("RGBA" if alpha else "RGB")
+
+        fallback_ext = "png" if alpha else "jpg"
+        entry = {
+            "stamp": stamp(src),
+            "width": width,
+            "height": height,
+            "type": "image/png" if alpha else "image/jpeg",
+            "webp": [],
+            "fallback": [],
+        }
+
+        for w in [w for w in WIDTHS if w < width] + [width]:
+            h = max(1, round(height * w / width))
+            resized = img if w == width else img.resize((w, h), Image.LANCZOS)
+
+            webp = out_dir / f"{w}.webp"
+            resized.save(webp, "WEBP", quality=80, method=4)
+            entry["webp"].append([w, webp.relative_to(STATIC_DIR).as_posix()])
+
+            if w == width:
+                # В полном размере фоллбеком остаётся оригинал
+                entry["fallback"].append([w, rel])
+                continue
+
+            fallback = out_dir / f"{w}.{fallback_ext}"
+            if alpha:
+                resized.save(fallback, "PNG", optimize=True)
+            else:
+                resized.save(
+                    fallback, "JPEG", quality=82, optimize=True, progressive=True
+                )
+
+            entry["fallback"].append([w, fallback.relative_to(STATIC_DIR).as_posix()])
+
+    return rel, entry
+
+
+def load_manifest() -> dict:
+    try:
+        manifest = json.loads(IMAGE_MANIFEST.read_text(encoding="utf-8"))
+
+    except (FileNotFoundError, ValueError):
+        return {}
+
+    if manifest.get("version") != IMAGE_MANIFEST_VERSION:
+        return {}
+
+    return manifest.get("images", {})
+
+
+def is_fresh(src: Path, entry: Optional[dict]) -> bool:
+    if entry is None or entry["stamp"] != stamp(src):
+        return False
+
+    return all(
+        (STATIC_DIR / rel).exists() for _, rel in entry["webp"] + entry["fallback"]
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build responsive image variants")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--full", action="store_true", help="ignore the manifest")
+    args = parser.parse_args()
+
+    old = {} if args.full else load_manifest()
+    sources = discover_sources()
+    images = {}
+    todo = []
+    for src in sources:
+        rel = src.relative_to(STATIC_DIR).as_posix()
+        if is_fresh(src, old.get(rel)):
+            images[rel] = old[rel]
+        else:
+            todo.append(src)
+
+    if args.jobs > 1 and len(todo) > 1:
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            images.update(pool.map(build_one, todo))
+
+    else:
+        images.update(map(build_one, todo))
+
+    # Подчищаем нарезку картинок, которых больше нет
+    removed = 0
+    for rel in old:
+        if rel not in images:
+            shutil.rmtree(DERIVED_DIR / Path(rel).with_suffix(""), ignore_errors=True)
+            removed += 1
+
+    IMAGE_MANIFEST.parent.mkdir(parents=True, exist_ok=True)
+    tmp = IMAGE_MANIFEST.with_name(f".{IMAGE_MANIFEST.name}.tmp")
+    tmp.write_text(
+        json.dumps(
+            {"version": IMAGE_MANIFEST_VERSION, "images": images},
+            ensure_ascii=False,
+            indent=1,
+        ),
+        encoding="utf-8",
+    )
+    tmp.replace(IMAGE_MANIFEST)
+
+    print(f"Images: {len(sources)}, rebuilt: {len(todo)}, removed: {removed}")
+
+
+if __name__ == "__main__":
+    main()
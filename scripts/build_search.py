@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+# Собирает поисковый индекс заранее, чтобы приложение при старте только
+# открыло файл. Без этого app.py соберёт его сам в фоне.
+#
+#   python scripts/build_search.py [--out build/search-index.bin] [--constants F]
+import argparse
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from router.search_index import SearchIndex  # noqa: E402
+from router.wiki_search import SEARCH_INDEX, write_index  # noqa: E402
+from scripts.build_static import _init_worker, load_constants  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build the wiki search index")
+    parser.add_argument("--out", type=Path, default=SEARCH_INDEX)
+    parser.add_argument(
+        "--constants", type=Path, help="JSON file instead of asking overlord"
+    )
+    args = parser.parse_args()
+
+    constants = load_constants(args.constants)
+    _init_worker(constants)
+    write_index(args.out, constants)
+
+    index = SearchIndex(args.out)
+    size = args.out.stat().st_size
+    print(f"Sections: {len(index.docs)}, terms: {index.n_terms}, {size // 1024} KiB")
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
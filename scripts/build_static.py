@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+# Пререндер всей вики в статичные .html, чтобы nginx отдавал их сам.
+#
+#   python scripts/build_static.py [--out build/wiki] [--jobs N] [--full]
+#
+# /wiki/a/b -> a/b.html, /wiki/a/ -> a/index.html, поэтому в nginx достаточно:
+#
+#   location /wiki/ {
+#       root /root/spf/wiki/build;
+#       gzip_static on;
+#       try_files $uri/index.html $uri.html @app;
+#   }
+#
+# По умолчанию сборка инкрементальная: рядом с результатом лежит
+# .build-manifest.json со штампами всех входов каждой страницы, и
+# пересобираются только страницы, у которых что-то поменялось.
+#
+# Рядом с каждым .html кладутся .html.gz (и .html.br, если установлен
+# brotli) для gzip_static / brotli_static в nginx.
+#
+# Тот же проход заодно режет страницы на разделы для поиска в браузере:
+# шарды ложатся в static/derived/search/ (см. router/search_shards.py) и
+# читаются static/js/wiki-search.js без запросов к приложению. Разделы
+# хранятся в манифесте, так что инкрементальная сборка их не теряет.
+import argparse
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from data_control.constants import Constants  # noqa: E402
+from router.compression import ENCODINGS, MIN_SIZE, compress  # noqa: E402
+from router.page_index import page_href  # noqa: E402
+from router.render_cache import file_stamp  # noqa: E402
+from router.renderer import WIKI_DIR, get_renderer  # noqa: E402
+from router.search_index import Section, extract_sections  # noqa: E402
+from router.search_shards import SEARCH_DIR, write_shards  # noqa: E402
+from router.wiki_render import (  # noqa: E402
+    TEMPLATE_NAME,
+    page_backlinks,
+    template_context,
+)
+from template_env import (  # noqa: E402
+    BASE_DIR,
+    IMAGE_MANIFEST,
+    STATIC_DIR,
+    load_image_manifest,
+    templates,
+)
+
+MANIFEST_NAME = ".build-manifest.json"
+MANIFEST_VERSION = 4
+SUFFIXES = {"gzip": ".gz", "br": ".br"}
+
+
+def discover_pages() -> list[Path]:
+    # _warn и прочие служебные папки - это шаблоны, а не страницы
+    return [
+        p
+        for p in sorted(WIKI_DIR.rglob("*.md"))
+        if not any(part.startswith("_") for part in p.relative_to(WIKI_DIR).parts)
+    ]
+
+
+def output_path(out_dir: Path, md_path: Path) -> Path:
+    rel = md_path.relative_to(WIKI_DIR)
+    if rel.name == "index.md":
+        return out_dir / rel.parent / "index.html"
+
+    return out_dir / rel.with_suffix(".html")
+
+
+def rel_key(path: Path) -> str:
+    path = Path(path).resolve()
+    try:
+        return str(path.relative_to(BASE_DIR))
+
+    except ValueError:
+        return str(path)
+
+
+def global_fingerprint(constants: dict[str, str]) -> str:
+    # То, от чего зависит каждая страница: константы, сам шаблон и
+    # css/js, которые шаблон подключает через фильтр ver, нарезка картинок
+    # и набор доступных сжатий
+    h = hashlib.sha256()
+    h.update(json.dumps(constants, sort_keys=True, ensure_ascii=False).encode())
+    h.update(",".join(ENCODINGS).encode())
+
+    files = [BASE_DIR / "templates" / TEMPLATE_NAME, IMAGE_MANIFEST]
+    for sub in ("css", "js"):
+        files.extend(sorted((STATIC_DIR / sub).rglob("*")))
+
+    for f in files:
+        if f.is_file():
+            h.update(f"{rel_key(f)}:{file_stamp(f)}\n".encode())
+
+    return h.hexdigest()
+
+
+def load_manifest(out_dir: Path) -> dict:
+    try:
+        manifest = json.loads((out_dir / MANIFEST_NAME).read_text(encoding="utf-8"))
+
+    except (FileNotFoundError, ValueError):
+        return {}
+
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {}
+
+    return manifest
+
+
+def backlink_keys(md_path: Path) -> list[str]:
+    return [rel_key(info.path) for info in page_backlinks(md_path)]
+
+
+def is_stale(md_path: Path, out_dir: Path, entry: Optional[dict]) -> bool:
+    if entry is None or not output_path(out_dir, md_path).exists():
+        return True
+
+    # Правки в уже ссылающихся страницах ловят штампы в deps, а новые
+    # ссылки на страницу видно только по самому списку
+    if entry.get("backlinks") != backlink_keys(md_path):
+        return True
+
+    for dep, stamp in entry["deps"].items():
+        if file_stamp(BASE_DIR / dep) != stamp:
+            return True
+
+    return False
+
+
+def write_atomic(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def compressed_paths(path: Path) -> list[Path]:
+    return [path.with_name(path.name + suffix) for suffix in SUFFIXES.values()]
+
+
+def write_page(path: Path, html: str) -> None:
+    body = html.encode("utf-8")
+    write_atomic(path, body)
+
+    # Сжатые копии пишутся после .html: nginx отдаёт их только при наличии
+    # оригинала, а устаревшая копия хуже отсутствующей
+    for encoding, suffix in SUFFIXES.items():
+        compressed_path = path.with_name(path.name + suffix)
+        if encoding in ENCODINGS and len(body) >= MIN_SIZE:
+            write_atomic(compressed_path, compress(body, encoding))
+
+        elif compressed_path.exists():
+            compressed_path.unlink()
+
+
+def _init_worker(constants: dict[str, str]) -> None:
+    Constants.set_all_const(constants)
+    load_image_manifest(IMAGE_MANIFEST)
+
+
+def build_page(md_path: Path, out_dir: Path) -> tuple[str, dict]:
+    page_stamp = file_stamp(md_path)
+    content = md_path.read_text(encoding="utf-8")
+
+    page_data = get_renderer().render(md_path, content, Constants.get_all_const())
+    backlinks = page_backlinks(md_path)
+    html = templates.get_template(TEMPLATE_NAME).render(
+        template_context(page_data, backlinks)
+    )
+    write_page(output_path(out_dir, md_path), html)
+
+    deps = {rel_key(dep): file_stamp(dep) for dep in page_data.dependencies}
+    deps[rel_key(STATIC_DIR / page_data.background_url)] = file_stamp(
+        STATIC_DIR / page_data.background_url
+    )
+    for info in backlinks:
+        deps[rel_key(info.path)] = file_stamp(info.path)
+    deps[rel_key(md_path)] = page_stamp
+
+    sections = extract_sections(
+        page_data.html, page_href(WIKI_DIR, md_path), page_data.title
+    )
+    return rel_key(md_path), {
+        "deps": deps,
+        "backlinks": [rel_key(info.path) for info in backlinks],
+        "sections": [list(s) for s in sections],
+    }
+
+
+def _build_chunk(chunk: list[Path], out_dir: Path) -> list[tuple[str, dict]]:
+    return [build_page(md_path, out_dir) for md_path in chunk]
+
+
+def load_constants(path: Optional[Path]) -> dict[str, str]:
+    if path is not None:
+        return json.loads(path.read_text(encoding="utf-8"))
+
+    try:
+        Constants.req_from_over()
+
+    except Exception as e:
+        sys.exit(f"Cannot fetch constants from overlord ({e}), pass --constants")
+
+    return Constants.get_all_const()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Pre-render wiki/ to static HTML")
+    parser.add_argument("--out", type=Path, default=BASE_DIR / "build" / "wiki")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--full", action="store_true", help="ignore the manifest")
+    parser.add_argument(
+        "--constants", type=Path, help="JSON file instead of asking overlord"
+    )
+    parser.add_argument("--search-out", type=Path, default=SEARCH_DIR)
+    args = parser.parse_args()
+
+    out_dir: Path = args.out.resolve()
+    constants = load_constants(args.constants)
+    _init_worker(constants)
+
+    fingerprint = global_fingerprint(constants)
+    manifest = {} if args.full else load_manifest(out_dir)
+    old_pages: dict[str, dict] = (
+        manifest.get("pages", {}) if manifest.get("global") == fingerprint else {}
+    )
+
+    pages = discover_pages()
+    todo = [p for p in pages if is_stale(p, out_dir, old_pages.get(rel_key(p)))]
+
+    new_pages = {
+        rel_key(p): old_pages[rel_key(p)] for p in pages if rel_key(p) in old_pages
+    }
+
+    if args.jobs > 1 and len(todo) > 1:
+        chunk_size = max(1, len(todo) // (args.jobs * 4))
+        chunks = [todo[i : i + chunk_size] for i in range(0, len(todo), chunk_size)]
+        with ProcessPoolExecutor(
+            max_workers=args.jobs,
+            initializer=_init_worker,
+            initargs=(constants,),
+        ) as pool:
+            for results in pool.map(_build_chunk, chunks, [out_dir] * len(chunks)):
+                new_pages.update(results)
+
+    else:
+        new_pages.update(_build_chunk(todo, out_dir))
+
+    # Удалённые из вики страницы не должны остаться висеть в билде
+    removed = 0
+    for key in manifest.get("pages", {}):
+        if key not in new_pages:
+            out_file = output_path(out_dir, BASE_DIR / key)
+            if out_file.exists():
+                out_file.unlink()
+                removed += 1
+
+            for compressed_path in compressed_paths(out_file):
+                compressed_path.unlink(missing_ok=True)
+
+    write_atomic(
+        out_dir / MANIFEST_NAME,
+        json.dumps(
+            {"version": MANIFEST_VERSION, "global": fingerprint, "pages": new_pages},
+            ensure_ascii=False,
+            indent=1,
+        ).encode("utf-8"),
+    )
+
+    sections = [
+        Section(*section)
+        for p in pages
+        for section in new_pages[rel_key(p)].get("sections", [])
+    ]
+    search = write_shards(sections, args.search_out.resolve())
+
+    print(f"Pages: {len(pages)}, rebuilt: {len(todo)}, removed: {removed}")
+    print(f"Search: {len(sections)} sections, {len(search['shards'])} shards")
+
+
+if __name__ == "__main__":
+    main()
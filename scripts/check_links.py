@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# Проверяет внутренние ссылки вики без рендера: [[path|name]], !btn[...],
+# markdown-ссылки и <a href>. Битые ссылки - код выхода 1, страницы, на
+# которые никто не ссылается, - просто отчёт.
+#
+#   python scripts/check_links.py [--cache build/link-graph.json] [--no-cache]
+#
+# Разобранные ссылки кешируются по mtime, повторный запуск перечитывает
+# только изменившиеся файлы.
+import argparse
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from router.link_graph import LinkGraph  # noqa: E402
+from router.renderer import WIKI_DIR  # noqa: E402
+from template_env import BASE_DIR  # noqa: E402
+
+LINKS_CACHE = BASE_DIR / "build" / "link-graph.json"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Find dead internal wiki links")
+    parser.add_argument("--cache", type=Path, default=LINKS_CACHE)
+    parser.add_argument("--no-cache", action="store_true")
+    args = parser.parse_args()
+
+    graph = LinkGraph(WIKI_DIR)
+    if not args.no_cache:
+        graph.load(args.cache)
+
+    graph.build()
+    if not args.no_cache:
+        graph.save(args.cache)
+
+    dead = graph.dead_links()
+    for link in dead:
+        print(f"{link.source.relative_to(graph.wiki_dir)}: dead link {link.url}")
+
+    orphans = graph.orphans()
+    for path in orphans:
+        print(f"{path.relative_to(graph.wiki_dir)}: no pages link here")
+
+    print(f"Dead links: {len(dead)}, orphaned pages: {len(orphans)}")
+    if dead:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
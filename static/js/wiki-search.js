@@ -0,0 +1,267 @@
+(function () {
+    // Поиск в браузере по шардам из scripts/build_static.py
+    // (router/search_shards.py). Если шардов нет (приложение без
+    // пререндера), запрос уходит в /wiki-search.
+    const LIMIT = 10;
+    const DEBOUNCE = 150;
+    const MAX_PREFIX_TERMS = 64;
+    const WORD_RE = /[0-9a-zа-я]+/g;
+    const CYRILLIC_RE = /[а-я]/;
+
+    const script = document.currentScript;
+    const BASE = new URL('../derived/search/', script ? script.src : location.href);
+
+    let manifestPromise = null;
+    const shards = new Map();
+    const shardKeys = new WeakMap();
+    const excerpts = new Map();
+
+    function fetchJson(url, options) {
+        return fetch(url, options).then(res => {
+            if (!res.ok) throw new Error(res.status + ' ' + url);
+            return res.json();
+        });
+    }
+
+    function loadManifest() {
+        if (!manifestPromise) {
+            // Шарды с хешем в имени, а index.json перепроверяется всегда
+            manifestPromise = fetchJson(new URL('index.json', BASE), { cache: 'no-cache' })
+                .then(manifest => manifest.version === 1 ? manifest : null)
+                .catch(() => null);
+        }
+        return manifestPromise;
+    }
+
+    function loadFile(cache, name) {
+        let promise = cache.get(name);
+        if (!promise) {
+            promise = fetchJson(new URL(name, BASE));
+            cache.set(name, promise);
+            // После пересборки старые файлы удаляются: перечитываем index.json
+            promise.catch(() => {
+                cache.delete(name);
+                manifestPromise = null;
+            });
+        }
+        return promise;
+    }
+
+    function loadShard(manifest, key) {
+        const name = manifest.shards[key];
+        if (!name) return Promise.resolve(null);
+        return loadFile(shards, name).then(terms => {
+            if (!shardKeys.has(terms)) shardKeys.set(terms, Object.keys(terms).sort());
+            return terms;
+        });
+    }
+
+    function lowerBound(keys, key) {
+        let lo = 0, hi = keys.length;
+        while (lo < hi) {
+            const mid = (lo + hi) >> 1;
+            if (keys[mid] < key) lo = mid + 1; else hi = mid;
+        }
+        return lo;
+    }
+
+    function findStems(keys, word) {
+        // Стеммер на сервере только отрезает окончания, так что основа слова -
+        // один из терминов, с которых оно начинается. Какой именно, без
+        // стеммера не понять, поэтому берутся все не короче половины слова.
+        // Латиницу и короткие слова стеммер не трогает
+        const stems = [];
+        const minLength = word.length < 3 || !CYRILLIC_RE.test(word) ? word.length : word.length / 2;
+        for (let len = word.length; len >= minLength; len--) {
+            const prefix = word.slice(0, len);
+            if (keys[lowerBound(keys, prefix)] === prefix) stems.push(prefix);
+        }
+        return stems;
+    }
+
+    function matchTerms(terms, word, typing) {
+        const keys = shardKeys.get(terms);
+        const stems = findStems(keys, word);
+        if (!typing) return stems;
+
+        // Недописанное слово - ещё и все термины, начинающиеся с самой
+        // длинной основы
+        const base = stems.length ? stems[0] : word;
+        const found = new Set(stems);
+        for (let i = lowerBound(keys, base); i < keys.length && found.size < MAX_PREFIX_TERMS; i++) {
+            if (!keys[i].startsWith(base)) break;
+            found.add(keys[i]);
+        }
+        return [...found];
+    }
+
+    function normalize(text) {
+        return text.toLowerCase().replace(/ё/g, 'е');
+    }
+
+    function rank(manifest, words, typing) {
+        return Promise.all(words.map(w => loadShard(manifest, w[0]))).then(loaded => {
+            const perWord = words.map((word, i) => {
+                const scores = new Map();
+                const terms = loaded[i];
+                if (!terms) return scores;
+
+                const prefix = typing && i === words.length - 1;
+                for (const term of matchTerms(terms, word, prefix)) {
+                    const postings = terms[term];
+                    for (let j = 0; j < postings.length; j += 2) {
+                        const doc = postings[j], score = postings[j + 1];
+                        if (score > (scores.get(doc) || 0)) scores.set(doc, score);
+                    }
+                }
+                return scores;
+            });
+
+            // Сначала разделы, где нашлись все слова, если таких нет - любые
+            let candidates = [...perWord[0].keys()].filter(doc => perWord.every(s => s.has(doc)));
+            if (!candidates.length) {
+                candidates = [...new Set(perWord.flatMap(s => [...s.keys()]))];
+            }
+
+            const total = doc => perWord.reduce((sum, s) => sum + (s.get(doc) || 0), 0);
+            return candidates
+                .map(doc => [doc, total(doc)])
+                .sort((a, b) => b[1] - a[1])
+                .slice(0, LIMIT)
+                .map(([doc]) => doc);
+        });
+    }
+
+    function describe(manifest, docs) {
+        const chunk = manifest.excerpt_chunk;
+        const names = [...new Set(docs.map(doc => manifest.excerpts[Math.floor(doc / chunk)]))];
+        return Promise.all(names.map(name => loadFile(excerpts, name).catch(() => []))).then(loaded => {
+            const byName = new Map(names.map((name, i) => [name, loaded[i]]));
+            return docs.map(doc => {
+                const [page, anchor, heading] = manifest.docs[doc];
+                const [href, title] = manifest.pages[page];
+                const texts = byName.get(manifest.excerpts[Math.floor(doc / chunk)]);
+                return {
+                    url: anchor ? href + '#' + anchor : href,
+                    title,
+                    heading,
+                    snippet: texts[doc % chunk] || '',
+                };
+            });
+        });
+    }
+
+    function search(query) {
+        const words = normalize(query).match(WORD_RE);
+        if (!words) return Promise.resolve([]);
+        const typing = !/\s$/.test(query);
+
+        return loadManifest().then(manifest => {
+            if (!manifest) {
+                return fetchJson('/wiki-search?limit=' + LIMIT + '&q=' + encodeURIComponent(query))
+                    .then(data => data.results);
+            }
+            return rank(manifest, words, typing).then(docs => describe(manifest, docs));
+        });
+    }
+
+    function renderResults(list, results) {
+        list.innerHTML = '';
+        if (!results.length) {
+            const empty = document.createElement('li');
+            empty.className = 'wiki-search-empty';
+            empty.textContent = 'Ничего не найдено';
+            list.appendChild(empty);
+            return;
+        }
+
+        results.forEach(result => {
+            const item = document.createElement('li');
+            const link = document.createElement('a');
+            link.href = result.url;
+
+            const title = document.createElement('span');
+            title.className = 'wiki-search-title';
+            title.textContent = result.heading ? result.title + ' → ' + result.heading : result.title;
+            link.appendChild(title);
+
+            if (result.snippet) {
+                const excerpt = document.createElement('span');
+                excerpt.className = 'wiki-search-excerpt';
+                excerpt.textContent = result.snippet;
+                link.appendChild(excerpt);
+            }
+
+            item.appendChild(link);
+            list.appendChild(item);
+        });
+    }
+
+    function initForm(form) {
+        const input = form.querySelector('.wiki-search-input');
+        const list = form.querySelector('.wiki-search-results');
+        if (!input || !list) return;
+
+        let timer = null;
+        let seq = 0;
+
+        function run() {
+            const query = input.value;
+            const current = ++seq;
+            if (!query.trim()) {
+                list.classList.remove('open');
+                return;
+            }
+
+            search(query).then(results => {
+                if (current !== seq) return;
+                renderResults(list, results);
+                list.classList.add('open');
+            }).catch(() => {
+                if (current === seq) list.classList.remove('open');
+            });
+        }
+
+        input.addEventListener('input', () => {
+            clearTimeout(timer);
+            timer = setTimeout(run, DEBOUNCE);
+        });
+
+        input.addEventListener('focus', () => {
+            loadManifest();
+            if (list.childElementCount && input.value.trim()) list.classList.add('open');
+        });
+
+        form.addEventListener('submit', (e) => {
+            e.preventDefault();
+            const first = list.querySelector('a');
+            if (first) window.location.href = first.href;
+        });
+
+        form.addEventListener('keydown', (e) => {
+            if (e.key === 'Escape') {
+                list.classList.remove('open');
+                input.blur();
+                return;
+            }
+            if (e.key !== 'ArrowDown' && e.key !== 'ArrowUp') return;
+
+            const links = [...list.querySelectorAll('a')];
+            if (!links.length) return;
+            e.preventDefault();
+            const i = links.indexOf(document.activeElement);
+            const next = e.key === 'ArrowDown' ? i + 1 : i - 1;
+            if (next < 0) input.focus(); else links[Math.min(next, links.length - 1)].focus();
+        });
+
+        document.addEventListener('click', (e) => {
+            if (!form.contains(e.target)) list.classList.remove('open');
+        });
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        document.querySelectorAll('.wiki-search').forEach(initForm);
+    });
+
+    window.wikiSearch = { search };
+})();
@@ -1,19 +1,106 @@
+import hashlib
+import json
 import os
+import stat
+import time
 from pathlib import Path
+from typing import Iterable, Optional
 
 from fastapi.templating import Jinja2Templates
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
 
 BASE_DIR = Path(__file__).resolve().parent
 STATIC_DIR = BASE_DIR / "static"
+ASSET_MANIFEST = BASE_DIR / "build" / "assets-manifest.json"
+ASSET_MANIFEST_VERSION = 1
+DERIVED_DIR = STATIC_DIR / "derived"
+IMAGE_MANIFEST = BASE_DIR / "build" / "images-manifest.json"
+IMAGE_MANIFEST_VERSION = 1
+# Ширина, под которую рендерится фон страницы
+BACKGROUND_WIDTH = 1920
 
 templates = Jinja2Templates(directory=str(BASE_DIR / "templates"))
 
 USE_ACCEL = os.getenv("FASTAPISTATIC") != "1"
 
+# Пока изменения статики ловит вотчер, штамп на каждом вызове не проверяется,
+# свежесть держит invalidate_static_versions()
+validate_static_stamps = True
+
+# (mtime_ns, size) файла
+Stamp = tuple[int, int]
+
+# file -> (штамп, хеш содержимого) для ?v=: ссылки не зависят от времени
+# чекаута на машине, а файл перечитывается, только если штамп сменился
+_versions: dict[str, tuple[Stamp, str]] = {}
+# Растёт, когда какие-то версии сбросились: по ней перерендериваются
+# закешированные страницы, в которые ver зашил старые ?v=
+static_generation = 0
+static_changed_at = 0.0
+# images/... -> нарезка из scripts/build_images.py
+_image_variants: dict[str, dict] = {}
+
+
+def file_hash(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            h.update(chunk)
+
+    return h.hexdigest()[:16]
+
+
+def stat_stamp(st: os.stat_result) -> Stamp:
+    return st.st_mtime_ns, st.st_size
+
+
+def static_version(file: str, st: Optional[os.stat_result] = None) -> str:
+    # Хеш считается лениво, по первому запросу файла. Без вотчера он
+    # сверяется со штампом на каждом вызове, иначе правку никто не заметит
+    global static_generation, static_changed_at
+
+    cached = _versions.get(file)
+    if cached is not None and st is None and not validate_static_stamps:
+        return cached[1]
+
+    try:
+        stamp = stat_stamp(st or (STATIC_DIR / file).stat())
+
+    except OSError:
+        return "0"
+
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    try:
+        v = file_hash(STATIC_DIR / file)
+
+    except OSError:
+        return "0"
+
+    _versions[file] = (stamp, v)
+    if cached is not None:
+        # В закешированных страницах зашит старый ?v=
+        static_generation += 1
+        static_changed_at = time.time()
+
+    return v
+
+
+def known_static_version(file: str, st: os.stat_result) -> Optional[str]:
+    # Без чтения файла: только уже посчитанный хеш, и только для этого штампа
+    cached = _versions.get(file)
+    if cached is not None and cached[0] == stat_stamp(st):
+        return cached[1]
+
+    return None
+
 
 def static_url(file: str) -> str:
-    static_path = STATIC_DIR / file
-    v = int(static_path.stat().st_mtime) if static_path.exists() else 0
+    v = static_version(file)
 
     if USE_ACCEL:
         return f"/wiki/static/{file}?v={v}"
@@ -22,4 +109,192 @@ def static_url(file: str) -> str:
         return f"/static/{file}?v={v}"
 
 
+def warm_static_versions() -> None:
+    # Для бенчмарков: на старте сервера без манифеста хеши считаются лениво
+    for path in STATIC_DIR.rglob("*"):
+        if path.is_file():
+            static_version(path.relative_to(STATIC_DIR).as_posix())
+
+
+def build_asset_manifest() -> dict:
+    files: dict[str, str] = {}
+    stamps: dict[str, list[int]] = {}
+    for path in sorted(STATIC_DIR.rglob("*")):
+        if not path.is_file():
+            continue
+
+        rel = path.relative_to(STATIC_DIR).as_posix()
+        stamps[rel] = list(stat_stamp(path.stat()))
+        files[rel] = file_hash(path)
+
+    return {"version": ASSET_MANIFEST_VERSION, "files": files, "stamps": stamps}
+
+
+def load_asset_manifest(path: Path) -> bool:
+    # Манифест собирается scripts/build_assets.py при деплое
+    try:
+        manifest = json.loads(Path(path).read_text(encoding="utf-8"))
+
+    except (FileNotFoundError, ValueError):
+        return False
+
+    if manifest.get("version") != ASSET_MANIFEST_VERSION:
+        return False
+
+    # Файлы, поменявшиеся после сборки манифеста, досчитаются лениво,
+    # static_version() всё равно сверит штамп
+    stamps = manifest.get("stamps", {})
+    for file, v in manifest.get("files", {}).items():
+        try:
+            st = (STATIC_DIR / file).stat()
+
+        except OSError:
+            continue
+
+        if stamps.get(file) == list(stat_stamp(st)):
+            _versions[file] = (stat_stamp(st), v)
+
+    return True
+
+
+def load_image_manifest(path: Path) -> bool:
+    try:
+        manifest = json.loads(Path(path).read_text(encoding="utf-8"))
+
+    except (FileNotFoundError, ValueError):
+        return False
+
+    if manifest.get("version") != IMAGE_MANIFEST_VERSION:
+        return False
+
+    # Нарезка от старой версии картинки хуже, чем её отсутствие, а
+    # недособранная даст в srcset ссылки на 404
+    for file, entry in manifest.get("images", {}).items():
+        try:
+            st = (STATIC_DIR / file).stat()
+
+        except OSError:
+            continue
+
+        if entry.get("stamp") != [st.st_mtime_ns, st.st_size]:
+            continue
+
+        variants = entry.get("webp", []) + entry.get("fallback", [])
+        if all((STATIC_DIR / rel).is_file() for _, rel in variants):
+            _image_variants[file] = entry
+
+    return True
+
+
+def image_variants(file: str) -> Optional[dict]:
+    return _image_variants.get(file)
+
+
+def srcset(items: list[list]) -> str:
+    return ", ".join(f"{static_url(rel)} {w}w" for w, rel in items)
+
+
+def background_image_set(file: str) -> str:
+    # Дописывает к фону image-set с WebP нужной ширины, старые браузеры
+    # проигнорируют второе объявление и останутся на оригинале
+    entry = _image_variants.get(file)
+    if entry is None:
+        return ""
+
+    def pick(items: list[list]) -> str:
+        fitting = [it for it in items if it[0] <= BACKGROUND_WIDTH] or items[:1]
+        return static_url(fitting[-1][1])
+
+    return (
+        f" background-image: image-set(url('{pick(entry['webp'])}') type('image/webp'),"
+        f" url('{pick(entry['fallback'])}') type('{entry['type']}'));"
+    )
+
+
+def invalidate_static_versions(paths: Optional[Iterable[Path]] = None) -> None:
+    global static_generation, static_changed_at
+
+    if paths is None:
+        _versions.clear()
+        static_generation += 1
+        static_changed_at = time.time()
+        return
+
+    changed = [Path(p) for p in paths]
+    changed = [p for p in changed if p == STATIC_DIR or p.is_relative_to(STATIC_DIR)]
+    if not changed:
+        return
+
+    dropped = False
+    for file in list(_versions):
+        static_path = STATIC_DIR / file
+        if any(static_path == p or static_path.is_relative_to(p) for p in changed):
+            _versions.pop(file, None)
+            dropped = True
+
+    if dropped:
+        static_generation += 1
+        static_changed_at = time.time()
+
+
+class AssetStaticFiles(StaticFiles):
+    # Для FASTAPISTATIC=1: сильный ETag из хеша содержимого и immutable,
+    # если в ссылке актуальный ?v=, иначе пусть браузер ревалидирует
+
+    def lookup_path(self, path: str) -> tuple[str, Optional[os.stat_result]]:
+        # Выполняется в тредпуле, так что файл без манифеста хешируется
+        # здесь, а не в file_response() на event loop
+        full_path, stat_result = super().lookup_path(path)
+        if stat_result is not None and stat.S_ISREG(stat_result.st_mode):
+            rel = self._static_rel(full_path)
+            if rel is not None:
+                static_version(rel, stat_result)
+
+        return full_path, stat_result
+
+    @staticmethod
+    def _static_rel(full_path) -> Optional[str]:
+        try:
+            return Path(full_path).resolve().relative_to(STATIC_DIR).as_posix()
+
+        except ValueError:
+            return None
+
+    def file_response(
+        self,
+        full_path,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        request_headers = Headers(scope=scope)
+        response = FileResponse(
+            full_path, status_code=status_code, stat_result=stat_result
+        )
+
+        rel = self._static_rel(full_path)
+        if rel is not None:
+            # Штамп отдаваемого файла: immutable только если хеш от него же.
+            # Если файл успел поменяться после lookup_path(), хеша нет -
+            # остаётся ETag Starlette и ревалидация
+            v = known_static_version(rel, stat_result)
+            if v is not None:
+                response.headers["etag"] = f'"{v}"'
+
+            query = scope.get("query_string", b"").decode("latin-1")
+            if v is not None and f"v={v}" in query.split("&"):
+                response.headers["cache-control"] = (
+                    "public, max-age=31536000, immutable"
+                )
+
+            else:
+                response.headers["cache-control"] = "no-cache"
+
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+
+        return response
+
+
 templates.env.filters["ver"] = static_url
+templates.env.filters["bg_set"] = background_image_set
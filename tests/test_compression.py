@@ -0,0 +1,57 @@
+import gzip
+
+import pytest
+
+from router import compression
+from router.compression import ENCODINGS, MIN_SIZE, choose_encoding, compress
+
+BOTH = ("br", "gzip")
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        (None, None),
+        ("", None),
+        ("gzip", "gzip"),
+        ("br", "br"),
+        ("gzip, deflate, br", "br"),
+        ("GZIP", "gzip"),
+        ("deflate", None),
+        ("gzip;q=0.5, br;q=0.8", "br"),
+        ("gzip;q=0.9, br;q=0.8", "gzip"),
+        ("gzip; q=0.8, br ;Q=0.8", "br"),
+        ("br;q=0, gzip", "gzip"),
+        ("br;q=0, gzip;q=0", None),
+        ("gzip;q=oops, br;q=0.1", "br"),
+        ("gzip;level=1;q=0.2, br;q=0.1", "gzip"),
+        ("*", "br"),
+        ("*;q=0.1, gzip;q=0", "br"),
+        ("identity;q=0", None),
+        ("gzip, identity;q=0", "gzip"),
+        ("identity", None),
+    ],
+)
+def test_choose_encoding(header, expected):
+    assert choose_encoding(header, BOTH) == expected
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [("br", None), ("br, gzip;q=0.1", "gzip"), ("*", "gzip")],
+)
+def test_choose_encoding_without_brotli(header, expected):
+    assert choose_encoding(header, ("gzip",)) == expected
+
+
+def test_default_encodings_follow_brotli_availability():
+    expected = BOTH if compression.brotli is not None else ("gzip",)
+
+    assert ENCODINGS == expected
+
+
+def test_gzip_is_deterministic():
+    body = b"<p>wiki</p>" * MIN_SIZE
+
+    assert compress(body, "gzip") == compress(body, "gzip")
+    assert gzip.decompress(compress(body, "gzip")) == body
@@ -0,0 +1,59 @@
+import pytest
+
+from router.extensions.constant_extension import (
+    SLOT_END,
+    SLOT_START,
+    cut_slots,
+    fits_constants,
+    splice_constants,
+)
+from router.renderer import WIKI_DIR, bind_constants, get_renderer
+
+PAGES = sorted(WIKI_DIR.rglob("*.md"))
+
+
+def slot(key: str) -> str:
+    return f"{SLOT_START}{key}{SLOT_END}"
+
+
+def test_cut_and_splice():
+    html, slots = cut_slots(f"<p>{slot('a')} и {slot('b')}{slot('a')}</p>")
+
+    assert html == "<p> и </p>"
+    assert slots == ((3, "a"), (6, "b"), (6, "a"))
+    assert splice_constants(html, slots, {"a": "1"}) == (
+        "<p>1 и <missing const: b>1</p>"
+    )
+
+
+def test_values_that_change_parsing_do_not_fit():
+    slots = ((0, "a"),)
+
+    assert fits_constants(slots, {"a": "plain"})
+    assert fits_constants(slots, {})
+    assert not fits_constants(slots, {"a": "!img_url[x]"})
+    assert not fits_constants(slots, {"a": "back\\slash"})
+
+
+@pytest.mark.parametrize("md_path", PAGES, ids=lambda p: str(p.relative_to(WIKI_DIR)))
+def test_splice_matches_full_render(md_path):
+    renderer = get_renderer()
+    content = md_path.read_text(encoding="utf-8")
+    keys = renderer.render(md_path, content, {}).const_keys
+    constants = {key: f"<b>{key}</b> & co" for key in sorted(keys)[::2]}
+
+    full = renderer.render(md_path, content, constants)
+    deferred = renderer.render(md_path, content, {}, deferred=True)
+
+    assert deferred.const_keys == full.const_keys
+    assert bind_constants(deferred, constants).html == full.html
+
+
+def test_unfit_value_falls_back_to_full_render():
+    md_path = WIKI_DIR / "docs" / "about.md"
+    content = "Сайт !const[site_name]"
+
+    page = get_renderer().render(md_path, content, {"site_name": "a!b"}, True)
+
+    assert page.const_slots is None
+    assert "a!b" in page.html
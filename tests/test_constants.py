@@ -0,0 +1,294 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from data_control.constants import (
+    Constants,
+    ConstantsService,
+    ConstSnapshot,
+    parse_constants,
+)
+
+
+@pytest.fixture(autouse=True)
+def constants(monkeypatch):
+    # Снапшот и подписчики общие на процесс, каждому тесту - свои
+    monkeypatch.setattr(Constants, "_snapshot", ConstSnapshot(0, {}, 0.0))
+    monkeypatch.setattr(Constants, "_callbacks", [])
+    return Constants
+
+
+@pytest.fixture
+def service(tmp_path):
+    return ConstantsService(snapshot_path=tmp_path / "constants.json")
+
+
+def test_parse_constants_coerces_values():
+    assert parse_constants({"port": 7777, "open": True, "name": "x"}) == {
+        "port": "7777",
+        "open": "True",
+        "name": "x",
+    }
+
+    with pytest.raises(ValueError):
+        parse_constants(["not", "a", "dict"])
+
+
+def test_version_moves_only_on_change():
+    seen = []
+    Constants.subscribe(lambda keys, version: seen.append((keys, version)))
+
+    assert Constants.set_all_const({"a": "1", "b": "2"}) == {"a", "b"}
+    assert Constants.set_all_const({"a": "1", "b": "2"}) == set()
+    assert Constants.update_const({"b": "3"}, removed=["a"]) == {"a", "b"}
+
+    assert Constants.get_version() == 2
+    assert Constants.get_all_const() == {"b": "3"}
+    assert seen == [({"a", "b"}, 1), ({"a", "b"}, 2)]
+
+
+def test_snapshot_round_trip(service):
+    Constants.set_all_const({"site_name": "SPF"}, updated_at=123.0)
+    service.save_snapshot(Constants.snapshot())
+
+    Constants._snapshot = ConstSnapshot(0, {}, 0.0)
+    assert service.load_snapshot()
+    assert Constants.get_all_const() == {"site_name": "SPF"}
+    assert Constants.snapshot().updated_at == 123.0
+    assert service.stats()["source"] == "snapshot"
+
+
+def test_missing_or_broken_snapshot(service):
+    assert not service.load_snapshot()
+
+    service.snapshot_path.write_text("{not json")
+    assert not service.load_snapshot()
+    assert Constants.get_version() == 0
+
+
+def test_older_snapshot_does_not_overwrite_newer(service):
+    service.save_snapshot(ConstSnapshot(2, {"a": "new"}, 2.0))
+    service.save_snapshot(ConstSnapshot(1, {"a": "old"}, 1.0))
+
+    saved = json.loads(service.snapshot_path.read_text())
+    assert saved["constants"] == {"a": "new"}
+
+
+def test_concurrent_saves_keep_the_newest(service):
+    snapshots = [ConstSnapshot(v, {"v": str(v)}, float(v)) for v in range(1, 41)]
+    threads = [
+        threading.Thread(target=service.save_snapshot, args=(s,)) for s in snapshots
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    saved = json.loads(service.snapshot_path.read_text())
+    assert saved["constants"] == {"v": "40"}
+    assert list(service.snapshot_path.parent.glob("*.tmp")) == []
+
+
+class Overlord:
+    # Заглушка overlord на локальном порту: GET /config отдаёт config,
+    # отвечая с задержкой delay
+    def __init__(self):
+        self.config: dict = {"site_name": "SPF"}
+        self.delay = 0.0
+        self.requests = 0
+        self.in_flight = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+        overlord = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with overlord._lock:
+                    overlord.requests += 1
+                    overlord.in_flight += 1
+                    overlord.peak = max(overlord.peak, overlord.in_flight)
+
+                try:
+                    time.sleep(overlord.delay)
+                    body = json.dumps(overlord.config).encode()
+                    self.send_response(200 if self.path == "/config" else 404)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                except OSError:
+                    pass
+
+                finally:
+                    with overlord._lock:
+                        overlord.in_flight -= 1
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self._thread = threading.Thread(
+            target=self.server.serve_forever, args=(0.05,), daemon=True
+        )
+        self._thread.start()
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def overlord():
+    server = Overlord()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def down_url():
+    # Порт, который только что был свободен: соединение сразу отклоняется
+    server = Overlord()
+    server.close()
+    return server.url
+
+
+def make_service(url, tmp_path, **kwargs) -> ConstantsService:
+    kwargs.setdefault("timeout", (0.5, 0.5))
+    return ConstantsService(
+        url=url, snapshot_path=tmp_path / "constants.json", **kwargs
+    )
+
+
+def run_service(service: ConstantsService, body):
+    async def main():
+        await service.start()
+        try:
+            return await body()
+
+        finally:
+            await service.stop()
+
+    return asyncio.run(main())
+
+
+def test_start_fetches_and_saves(overlord, tmp_path):
+    service = make_service(overlord.url, tmp_path)
+
+    async def body():
+        return service.stats()
+
+    stats = run_service(service, body)
+    assert stats["source"] == "overlord"
+    assert stats["refreshes"] == 1
+    assert Constants.get_all_const() == {"site_name": "SPF"}
+    saved = json.loads(service.snapshot_path.read_text())
+    assert saved["constants"] == {"site_name": "SPF"}
+
+
+def test_refresh_returns_changed_keys(overlord, tmp_path):
+    service = make_service(overlord.url, tmp_path)
+
+    async def body():
+        unchanged = await service.refresh()
+        overlord.config = {"site_name": "SPF", "port": 7777}
+        return unchanged, await service.refresh()
+
+    assert run_service(service, body) == (set(), {"port"})
+    assert Constants.get_all_const() == {"site_name": "SPF", "port": "7777"}
+
+
+def test_refresh_times_out(overlord, tmp_path):
+    overlord.delay = 2.0
+    service = make_service(overlord.url, tmp_path, timeout=(0.5, 0.2))
+
+    async def body():
+        start = time.monotonic()
+        changed = await service.refresh()
+        return changed, time.monotonic() - start
+
+    # start() без снапшота тоже ждёт overlord, но не дольше таймаута
+    started = time.monotonic()
+    changed, elapsed = run_service(service, body)
+
+    assert changed is None
+    assert elapsed < 1.5
+    assert time.monotonic() - started < 3.0
+    assert service.failures == 2
+    assert Constants.get_version() == 0
+
+
+def test_failed_refresh_keeps_last_values(overlord, tmp_path):
+    service = make_service(overlord.url, tmp_path)
+
+    async def body():
+        await service.refresh()
+        overlord.config = ["not", "an", "object"]
+        return await service.refresh()
+
+    assert run_service(service, body) is None
+    assert Constants.get_all_const() == {"site_name": "SPF"}
+    assert service.failures == 1
+    assert service.last_error
+
+
+def test_start_from_snapshot_when_overlord_is_down(down_url, tmp_path):
+    service = make_service(down_url, tmp_path)
+    service.save_snapshot(ConstSnapshot(1, {"site_name": "cached"}, 5.0))
+
+    async def body():
+        return Constants.get_all_const(), service.stats()["source"]
+
+    assert run_service(service, body) == ({"site_name": "cached"}, "snapshot")
+    assert Constants.snapshot().updated_at == 5.0
+
+
+def test_start_without_snapshot_when_overlord_is_down(down_url, tmp_path):
+    service = make_service(down_url, tmp_path, retry=0.05)
+
+    async def body():
+        await asyncio.sleep(0.3)
+        return service.failures
+
+    # Стартуем пустыми, а фоновый цикл продолжает стучаться в overlord
+    assert run_service(service, body) >= 2
+    assert Constants.get_version() == 0
+    assert not service.snapshot_path.exists()
+
+
+def test_background_loop_picks_up_changes(overlord, tmp_path):
+    service = make_service(overlord.url, tmp_path, interval=0.05)
+
+    async def body():
+        overlord.config = {"site_name": "new"}
+        for _ in range(100):
+            if Constants.get_all_const() == {"site_name": "new"}:
+                break
+
+            await asyncio.sleep(0.02)
+
+        return Constants.get_all_const()
+
+    assert run_service(service, body) == {"site_name": "new"}
+
+
+def test_concurrent_refreshes_share_the_session_in_turn(overlord, tmp_path):
+    overlord.delay = 0.05
+    service = make_service(overlord.url, tmp_path, interval=60.0)
+
+    async def body():
+        overlord.requests = overlord.peak = 0
+        return await asyncio.gather(*(service.refresh() for _ in range(5)))
+
+    results = run_service(service, body)
+
+    assert None not in results
+    assert overlord.requests == 5
+    assert overlord.peak == 1
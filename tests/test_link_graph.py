@@ -0,0 +1,148 @@
+import os
+
+import pytest
+
+from router.link_graph import LinkGraph
+
+
+def write(path, text: str) -> None:
+    # Правки в тестах идут быстрее разрешения mtime, штамп двигается явно
+    old = path.stat().st_mtime_ns if path.exists() else 0
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, max(st.st_mtime_ns, old + 1000)))
+
+
+@pytest.fixture
+def wiki(tmp_path):
+    wiki = tmp_path / "wiki"
+    write(wiki / "index.md", "[Документы](/wiki/docs/)\n")
+    write(wiki / "docs" / "index.md", "Title: Документы\n\n!auto_link_btn\n")
+    write(wiki / "docs" / "about.md", "Title: О проекте\n\n!warn[wip]\n")
+    write(wiki / "docs" / "rules.md", "[О проекте](about)\n")
+    write(wiki / "_warn" / "wip.md", "[Главная](/wiki/index)\n")
+    return wiki.resolve()
+
+
+def graph_state(graph: LinkGraph) -> tuple:
+    pages = sorted(graph.wiki_dir.rglob("*.md"))
+    return (
+        {p: graph.backlinks(p) for p in pages},
+        graph.dead_links(),
+        graph.orphans(),
+        {p: graph.outgoing(p) for p in pages},
+    )
+
+
+def assert_matches_full_build(graph: LinkGraph) -> None:
+    fresh = LinkGraph(graph.wiki_dir)
+    fresh.build()
+    assert graph_state(graph) == graph_state(fresh)
+
+
+def test_backlinks(wiki):
+    graph = LinkGraph(wiki)
+    graph.build()
+
+    assert graph.backlinks(wiki / "docs" / "about.md") == [
+        wiki / "docs" / "index.md",
+        wiki / "docs" / "rules.md",
+    ]
+    # Ссылка из шаблона !warn достаётся включившей его странице
+    assert graph.backlinks(wiki / "index.md") == [wiki / "docs" / "about.md"]
+    assert graph.backlinks(wiki / "docs" / "index.md") == [wiki / "index.md"]
+    assert graph.dead_links() == []
+    assert graph.orphans() == []
+
+
+def test_dead_links_and_orphans(wiki):
+    write(wiki / "docs" / "rules.md", "[Нет такой](missing)\n")
+    write(wiki / "lonely.md", "Title: Сирота\n")
+    graph = LinkGraph(wiki)
+    graph.build()
+
+    assert [link.url for link in graph.dead_links()] == ["missing"]
+    assert graph.orphans() == [wiki / "lonely.md"]
+
+
+def test_text_edit_changes_nothing(wiki):
+    graph = LinkGraph(wiki)
+    graph.build()
+
+    write(wiki / "docs" / "rules.md", "Title: Правила\n\n[О проекте](about)\n")
+
+    assert graph.refresh_paths([wiki / "docs" / "rules.md"]) == set()
+
+
+def test_new_link(wiki):
+    graph = LinkGraph(wiki)
+    graph.build()
+
+    write(wiki / "docs" / "rules.md", "[О проекте](about)\n[Главная](/wiki/)\n")
+
+    assert graph.refresh_paths([wiki / "docs" / "rules.md"]) == {wiki / "index.md"}
+    assert wiki / "docs" / "rules.md" in graph.backlinks(wiki / "index.md")
+    assert_matches_full_build(graph)
+
+
+def test_warn_template_edit_reaches_including_pages(wiki):
+    graph = LinkGraph(wiki)
+    graph.build()
+
+    write(wiki / "_warn" / "wip.md", "[Правила](/wiki/docs/rules)\n")
+
+    changed = graph.refresh_paths([wiki / "_warn" / "wip.md"])
+    assert changed == {wiki / "index.md", wiki / "docs" / "rules.md"}
+    assert graph.backlinks(wiki / "index.md") == []
+    assert_matches_full_build(graph)
+
+
+def test_new_page_reaches_auto_links(wiki):
+    graph = LinkGraph(wiki)
+    graph.build()
+
+    write(wiki / "docs" / "faq.md", "Title: FAQ\n")
+    write(wiki / "docs" / "guides" / "index.md", "Title: Гайды\n")
+
+    changed = graph.refresh_paths([wiki / "docs"])
+    assert changed == {wiki / "docs" / "faq.md", wiki / "docs" / "guides" / "index.md"}
+    assert graph.backlinks(wiki / "docs" / "faq.md") == [wiki / "docs" / "index.md"]
+    assert_matches_full_build(graph)
+
+
+def test_removed_folder(wiki):
+    graph = LinkGraph(wiki)
+    graph.build()
+
+    for path in (wiki / "docs").iterdir():
+        path.unlink()
+    (wiki / "docs").rmdir()
+
+    graph.refresh_paths([wiki / "docs"])
+    assert [link.url for link in graph.dead_links()] == ["/wiki/docs/"]
+    assert_matches_full_build(graph)
+
+
+def test_link_to_folder_follows_its_creation(wiki):
+    write(wiki / "index.md", "[Лор](/wiki/lore)\n")
+    graph = LinkGraph(wiki)
+    graph.build()
+    assert graph.outgoing(wiki / "index.md")[0].target == wiki / "lore.md"
+
+    write(wiki / "lore" / "index.md", "Title: Лор\n")
+
+    graph.refresh_paths([wiki / "lore"])
+    assert graph.outgoing(wiki / "index.md")[0].target == wiki / "lore" / "index.md"
+    assert_matches_full_build(graph)
+
+
+def test_cache_round_trip(wiki, tmp_path):
+    graph = LinkGraph(wiki)
+    graph.build()
+    graph.save(tmp_path / "links.json")
+
+    loaded = LinkGraph(wiki)
+    assert loaded.load(tmp_path / "links.json")
+    loaded.build()
+    assert graph_state(loaded) == graph_state(graph)
@@ -0,0 +1,80 @@
+import random
+
+import pytest
+
+from router.renderer import build_markdown
+
+CONSTANTS = {
+    "k": "redact[x]",
+    "r": "re",
+    "i": "img_url",
+    "plain": "value",
+    "bang": "a!b",
+    "tail": "end\\",
+    "head": "!redact[y]",
+    "html": "<b>x</b> & co",
+}
+
+TEXTS = [
+    "",
+    "no macros here",
+    "!const[plain]",
+    "!!const[k]",
+    "!!const[r]dact[y]",
+    "!!const[i][cat.png]",
+    "!\\!const[k]",
+    "\\!!const[k]",
+    "!const[k]",
+    "!const[bang]!redact[z]",
+    "!const[tail]!redact[z]",
+    "!const[head]",
+    "!const[missing]",
+    "!redact[!const[plain]]",
+    "!redact[a !const[html] b]",
+    "!img_url[!const[plain]]",
+    "!img_url[cat.png] !redact[секрет] !const[html]",
+    "!!img_url[cat.png]",
+    "!!redact[x]",
+    "\\!const[plain] \\!img_url[a] \\!redact[b]",
+    "\\\\!const[plain] \\\\!redact[b]",
+    "!const[plain]]!redact[]]",
+    "!redact[a\n!const[plain]]",
+    "!img_url[../etc/passwd]",
+    "!const[ plain ]!const[k]!const[r]",
+]
+
+
+@pytest.fixture(scope="module")
+def macro():
+    md = build_markdown(dict(CONSTANTS))
+    setattr(md, "dependencies", set())
+    return md.postprocessors["macro_postprocessor"]
+
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_matches_sequential_chain(macro, text):
+    assert macro.run(text) == macro.run_sequential(text)
+
+
+def test_matches_sequential_chain_on_random_text(macro):
+    tokens = [
+        "!",
+        "\\",
+        "[",
+        "]",
+        " ",
+        "x",
+        "const",
+        "img_url",
+        "redact",
+        "!const[k]",
+        "!const[r]",
+        "!const[tail]",
+        "!const[plain]",
+        "!redact[",
+        "!img_url[",
+    ]
+    rnd = random.Random(14)
+    for _ in range(5000):
+        text = "".join(rnd.choice(tokens) for _ in range(rnd.randint(1, 12)))
+        assert macro.run(text) == macro.run_sequential(text), text
@@ -0,0 +1,64 @@
+import math
+
+from router.metrics import Histogram, escape_label, exposition, format_value
+
+
+def parse(text: str) -> dict[str, float]:
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+
+    return samples
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram(buckets=(0.1, 1))
+    labels = (("route", "/x"),)
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe(labels, value)
+
+    samples = parse(exposition([("h", "histogram", "help", histogram.samples("h"))]))
+    assert samples == {
+        'h_bucket{route="/x",le="0.1"}': 2,
+        'h_bucket{route="/x",le="1"}': 3,
+        'h_bucket{route="/x",le="+Inf"}': 4,
+        'h_sum{route="/x"}': 3.65,
+        'h_count{route="/x"}': 4,
+    }
+
+
+def test_exposition_format():
+    text = exposition([("up", "gauge", "Is it up.", [("up", (), 1)])])
+
+    assert text == "# HELP up Is it up.\n# TYPE up gauge\nup 1\n"
+
+
+def test_values_and_labels():
+    assert format_value(3.0) == "3"
+    assert format_value(0.25) == "0.25"
+    assert format_value(math.inf) == "+Inf"
+    assert escape_label('a"b\\c\nd') == 'a\\"b\\\\c\\nd'
+
+
+def test_metrics_endpoint(client):
+    client("GET", "/ping")
+    client("GET", "/no/such/page")
+
+    reply = client("GET", "/metrics")
+    assert reply.status == 200
+    assert reply.headers["content-type"].startswith("text/plain; version=0.0.4")
+
+    samples = parse(reply.body.decode())
+    # Маршрут - шаблоном, неизвестные пути - одной меткой
+    count = "wiki_http_request_duration_seconds_count"
+    assert samples[f'{count}{{route="/ping",status="200"}}'] >= 1
+    assert samples[f'{count}{{route="unmatched",status="404"}}'] >= 1
+    for name in (
+        "wiki_render_cache_hit_ratio",
+        "wiki_render_executor_queued",
+        "wiki_constants_age_seconds",
+        "process_resident_memory_bytes",
+    ):
+        assert name in samples
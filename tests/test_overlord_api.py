@@ -0,0 +1,131 @@
+import json
+
+import pytest
+
+from data_control.constants import Constants, ConstSnapshot, constants_service
+from router import overlord_api
+from router.render_cache import RenderCache, file_stamp
+from router.renderer import WIKI_DIR, RenderedPage
+
+TOKEN = "s3cret"
+AUTH = [("Authorization", f"Bearer {TOKEN}")]
+
+
+@pytest.fixture(autouse=True)
+def isolated(monkeypatch, tmp_path):
+    monkeypatch.setenv("OVERLORD_PUSH_TOKEN", TOKEN)
+    monkeypatch.setattr(Constants, "_snapshot", ConstSnapshot(0, {}, 0.0))
+    monkeypatch.setattr(Constants, "_callbacks", [])
+    monkeypatch.setattr(constants_service, "snapshot_path", tmp_path / "c.json")
+    monkeypatch.setattr(constants_service, "_saved_version", 0)
+    monkeypatch.setattr(overlord_api, "render_cache", RenderCache())
+
+
+def push(client, body, headers=AUTH):
+    data = body if isinstance(body, bytes) else json.dumps(body).encode()
+    return client(
+        "POST",
+        "/overlord/constants",
+        data,
+        [("Content-Type", "application/json"), *headers],
+    )
+
+
+def test_push_disabled_without_token(client, monkeypatch):
+    monkeypatch.delenv("OVERLORD_PUSH_TOKEN")
+
+    assert push(client, {"constants": {"a": "1"}}).status == 403
+
+
+@pytest.mark.parametrize("body", [b"{broken", b'{"constants": []}', b""])
+def test_auth_runs_before_body_validation(client, body):
+    assert push(client, body, headers=[]).status == 401
+    assert push(client, body, headers=[("Authorization", "Bearer nope")]).status == 401
+    assert push(client, body).status == 422
+
+
+def test_bad_token_asks_for_bearer(client):
+    reply = push(client, {"constants": {"a": "1"}}, headers=[])
+
+    assert reply.headers["www-authenticate"] == "Bearer"
+
+
+def test_push_coerces_values_like_polling(client):
+    reply = push(client, {"constants": {"port": 7777, "open": True, "name": "x"}})
+
+    assert reply.status == 200
+    assert Constants.get_all_const() == {"port": "7777", "open": "True", "name": "x"}
+    assert json.loads(reply.body)["changed"] == ["name", "open", "port"]
+
+
+def test_push_reports_pages_using_changed_keys(client):
+    page = RenderedPage(
+        "<p></p>", "", "", "", frozenset(), const_keys=frozenset({"site_name"})
+    )
+    about = (WIKI_DIR / "docs" / "about.md").resolve()
+    overlord_api.render_cache.put(about, page, None, None)
+    Constants.set_all_const({"site_name": "old", "other": "1"})
+
+    reply = push(client, {"constants": {"site_name": "new"}, "removed": ["other"]})
+
+    assert json.loads(reply.body) == {
+        "version": 2,
+        "changed": ["other", "site_name"],
+        "pages": ["/wiki/docs/about"],
+    }
+
+
+def cache_page(key: str, name: str):
+    page = RenderedPage("<p></p>", "", "", "", frozenset(), const_keys=frozenset({key}))
+    md_path = (WIKI_DIR / "docs" / f"{name}.md").resolve()
+    overlord_api.render_cache.put(
+        md_path, page, Constants.get_version(), file_stamp(md_path)
+    )
+    return md_path
+
+
+def test_keys_only_push_fetches_just_those_keys(client, monkeypatch):
+    Constants.set_all_const({"a": "1", "b": "1", "gone": "1"})
+    monkeypatch.setattr(
+        constants_service, "_fetch", lambda: {"a": "2", "b": "2", "c": "3"}
+    )
+    cache_page("a", "about")
+    cache_page("b", "index")
+    version = Constants.get_version()
+
+    reply = push(client, {"keys": ["a", "c", "gone"]})
+
+    assert reply.status == 200
+    assert json.loads(reply.body) == {
+        "version": version + 1,
+        "changed": ["a", "c", "gone"],
+        "pages": ["/wiki/docs/about"],
+    }
+    # b тоже поменялся в overlord, но о нём пуш не говорил
+    assert Constants.get_all_const() == {"a": "2", "b": "1", "c": "3"}
+
+
+def test_keys_only_push_invalidates_only_pages_with_those_keys(client, monkeypatch):
+    from router import wiki_render
+
+    monkeypatch.setattr(wiki_render, "render_cache", overlord_api.render_cache)
+    Constants.subscribe(wiki_render.on_constants_changed)
+    Constants.set_all_const({"a": "1", "b": "1"})
+    monkeypatch.setattr(constants_service, "_fetch", lambda: {"a": "2", "b": "2"})
+    about = cache_page("a", "about")
+    other = cache_page("b", "index")
+
+    push(client, {"keys": ["a"]})
+
+    version = Constants.get_version()
+    assert overlord_api.render_cache.get(about, version) is None
+    assert overlord_api.render_cache.get(other, version) is not None
+
+
+def test_keys_only_push_fails_without_overlord(client, monkeypatch):
+    async def fetch():
+        return None
+
+    monkeypatch.setattr(constants_service, "_fetch_or_log", fetch)
+
+    assert push(client, {"keys": ["site_name"]}).status == 502
@@ -0,0 +1,173 @@
+import os
+import shutil
+
+import pytest
+
+from router.page_index import PageIndex, parse_date
+
+
+def write(path, title=None, date=None) -> None:
+    # Каждая запись сдвигает mtime на секунду: индекс сверяет именно его
+    old = path.stat().st_mtime_ns if path.exists() else None
+    path.parent.mkdir(parents=True, exist_ok=True)
+    meta = [f"title: {title}"] * bool(title) + [f"date: {date}"] * bool(date)
+    path.write_text("\n".join(meta) + "\n\nBody\n", encoding="utf-8")
+    if old is not None:
+        os.utime(path, ns=(old, old + 1_000_000_000))
+
+
+def state(index: PageIndex) -> dict:
+    folders = {index.wiki_dir} | {p.path.parent for p in index.pages()}
+    folders |= {folder.parent for folder in folders}
+    return {
+        "pages": index.pages(),
+        "children": {folder: index.children(folder) for folder in sorted(folders)},
+    }
+
+
+def fresh(wiki) -> dict:
+    index = PageIndex(wiki)
+    index.build()
+    return state(index)
+
+
+@pytest.fixture
+def wiki(tmp_path):
+    wiki = tmp_path / "wiki"
+    write(wiki / "index.md", "Главная")
+    write(wiki / "about.md", "О нас", "2024-03-01")
+    write(wiki / "guides" / "index.md", "Гайды")
+    write(wiki / "guides" / "start.md", "Старт", "5 мая 2023")
+    write(wiki / "lore" / "index.md", "Лор")
+    write(wiki / "lore" / "old" / "index.md", "Архив")
+    write(wiki / "lore" / "old" / "war.md", "Война")
+    return wiki.resolve()
+
+
+@pytest.fixture
+def index(wiki):
+    index = PageIndex(wiki)
+    index.build()
+    return index
+
+
+def test_children_of_folder(index, wiki):
+    files, indexes = index.children(wiki / "lore")
+
+    assert [p.title for p in files] == ["Лор"]
+    assert [p.path for p in indexes] == [wiki / "lore" / "old" / "index.md"]
+    assert index.get(wiki / "guides" / "start.md").href == "/wiki/guides/start"
+    assert index.get(wiki / "guides" / "start.md").date == "2023-05-05T00:00:00"
+
+
+def test_add_and_edit(index, wiki):
+    generation = index.generation
+    write(wiki / "guides" / "next.md", "Дальше")
+    write(wiki / "about.md", "Про нас")
+    index.refresh_paths([wiki / "guides" / "next.md", wiki / "about.md"])
+
+    assert index.get(wiki / "about.md").title == "Про нас"
+    assert index.generation == generation + 2
+    assert state(index) == fresh(wiki)
+
+
+def test_unchanged_file_is_not_reread(index, wiki):
+    generation = index.generation
+    index.refresh_paths([wiki / "about.md", wiki / "guides"])
+    index.refresh()
+
+    assert index.generation == generation
+
+
+def test_remove(index, wiki):
+    (wiki / "guides" / "start.md").unlink()
+    (wiki / "lore" / "old" / "index.md").unlink()
+    index.refresh_paths(
+        [wiki / "guides" / "start.md", wiki / "lore" / "old" / "index.md"]
+    )
+
+    assert index.get(wiki / "guides" / "start.md") is None
+    assert index.children(wiki / "lore")[1] == []
+    assert state(index) == fresh(wiki)
+
+
+def test_rename(index, wiki):
+    # Вотчер присылает старый путь, новый и их папки
+    (wiki / "guides" / "start.md").rename(wiki / "lore" / "start.md")
+    (wiki / "lore" / "old").rename(wiki / "guides" / "old")
+    index.refresh_paths(
+        [
+            wiki / "guides" / "start.md",
+            wiki / "lore" / "start.md",
+            wiki / "lore" / "old",
+            wiki / "guides" / "old",
+            wiki / "guides",
+            wiki / "lore",
+        ]
+    )
+
+    assert state(index) == fresh(wiki)
+
+
+def test_deleted_folder(index, wiki):
+    shutil.rmtree(wiki / "lore")
+    index.refresh_paths([wiki / "lore"])
+
+    assert [p.href for p in index.pages()] == [
+        "/wiki/about",
+        "/wiki/guides/index",
+        "/wiki/guides/start",
+        "/wiki/index",
+    ]
+    assert state(index) == fresh(wiki)
+
+
+def test_refresh_catches_everything(index, wiki):
+    write(wiki / "new" / "index.md", "Новое")
+    write(wiki / "new" / "page.md")
+    write(wiki / "index.md", "Главная 2")
+    (wiki / "about.md").unlink()
+    shutil.rmtree(wiki / "lore" / "old")
+    index.refresh()
+
+    assert state(index) == fresh(wiki)
+
+
+def test_paths_outside_wiki_are_ignored(index, wiki, tmp_path):
+    outside = tmp_path / "other.md"
+    write(outside, "Чужая")
+    generation = index.generation
+    index.refresh_paths([outside, tmp_path])
+
+    assert index.get(outside) is None
+    assert index.generation == generation
+
+
+def test_shared_meta_parser_does_not_leak(index, wiki):
+    # Парсер меты один на индекс, мета прошлой страницы не должна остаться
+    write(wiki / "a.md", "С заголовком", "2020-01-02")
+    write(wiki / "b.md")
+    index.refresh_paths([wiki / "a.md", wiki / "b.md"])
+
+    assert index.get(wiki / "a.md").title == "С заголовком"
+    assert index.get(wiki / "b.md").title is None
+    assert state(index) == fresh(wiki)
+
+
+@pytest.mark.parametrize(
+    "raw, expected",
+    [
+        ("2024-03-01", "2024-03-01"),
+        ("2024/03/01", "2024-03-01"),
+        ("01.03.2024", "2024-03-01"),
+        ("1 марта 2024", "2024-03-01"),
+        ("1 Марта 2024 года", "2024-03-01"),
+    ],
+)
+def test_parse_date(raw, expected):
+    assert parse_date(raw, 0).date().isoformat() == expected
+
+
+def test_parse_date_falls_back_to_mtime():
+    assert parse_date("вчера", 86400 * 365).year == 1971
+    assert parse_date(None, 86400 * 365).year == 1971
@@ -0,0 +1,122 @@
+import random
+from pathlib import Path
+
+import pytest
+from markdown.util import Registry
+
+from router.extensions.strip_comments_extension import StripCommentsPreprocessor
+from router.renderer import WIKI_DIR, WikiRenderer
+
+PAGE = (WIKI_DIR / "docs" / "test.md").resolve()
+CORPUS = sorted(WIKI_DIR.rglob("*.md"))
+
+TEXTS = [
+    "",
+    "\n\n  \n",
+    "<!-- only a comment -->",
+    "text <!-- inline --> text",
+    "a <!-- one --> b <!-- two --> c",
+    "before\n<!--\nmultiline\n-->\nafter",
+    "<!-- open\nnever closed\n\ntext",
+    "<!-- a --> <!-- b\nc -->",
+    "  \n\ntext   \n\n\n",
+    "~~del~~ <!-- x --> ~~del~~",
+    "-# small\n-# <!-- hidden --> small",
+    "!folder[\nroot/a.md\nroot/b/c.md\n]",
+    "!folder[\nroot/a.md",
+    "!lob[\nstyle: base\ntext: line\n  continued\n\n]",
+    "!tblimg[\n]",
+    "```\n<!-- in code -->\n~~x~~\n```",
+    "title: Meta\ndate: 2024-01-01\n\n<!-- c -->\nbody",
+    "<div>\n<!-- c -->\n~~x~~\n</div>",
+    "[TOC]\n\n# One\n\n## Two <!-- c -->",
+]
+
+
+class ListStripCommentsPreprocessor(StripCommentsPreprocessor):
+    # Как было до цепочки: весь документ склеивается и режется обратно
+    def run(self, lines):
+        text = "\n".join(lines)
+        text = self.RE.sub("", text)
+        stripped_lines = [line.rstrip() for line in text.split("\n")]
+        while stripped_lines and not stripped_lines[0].strip():
+            stripped_lines.pop(0)
+        while stripped_lines and not stripped_lines[-1].strip():
+            stripped_lines.pop()
+
+        return stripped_lines
+
+
+def list_based(renderer: WikiRenderer) -> WikiRenderer:
+    # Те же препроцессоры, но обычным реестром: каждый run() на списке
+    md = renderer.md
+    chain = md.preprocessors["preprocessor_chain"]
+    md.preprocessors = Registry()
+    for i, processor in enumerate(chain.processors):
+        if isinstance(processor, StripCommentsPreprocessor):
+            processor = ListStripCommentsPreprocessor(md)
+
+        md.preprocessors.register(processor, f"pre{i}", 100 - i)
+
+    return renderer
+
+
+@pytest.fixture(scope="module")
+def renderers():
+    return WikiRenderer(), list_based(WikiRenderer())
+
+
+def render(renderer: WikiRenderer, md_path: Path, content: str):
+    page = renderer.render(md_path, content, {})
+    return page.html.encode("utf-8"), page.title, page.dependencies
+
+
+def test_list_based_registry_has_no_chain(renderers):
+    chained, plain = renderers
+
+    assert list(chained.md.preprocessors) == [
+        chained.md.preprocessors["preprocessor_chain"]
+    ]
+    assert "preprocessor_chain" not in plain.md.preprocessors
+
+
+@pytest.mark.parametrize("md_path", CORPUS, ids=lambda p: str(p.relative_to(WIKI_DIR)))
+def test_corpus_matches_list_based(renderers, md_path):
+    chained, plain = renderers
+    content = md_path.read_text(encoding="utf-8")
+
+    assert render(chained, md_path, content) == render(plain, md_path, content)
+
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_text_matches_list_based(renderers, text):
+    chained, plain = renderers
+
+    assert render(chained, PAGE, text) == render(plain, PAGE, text)
+
+
+def test_random_text_matches_list_based(renderers):
+    chained, plain = renderers
+    tokens = [
+        "\n",
+        "\n\n",
+        "  ",
+        "x",
+        "<!--",
+        "-->",
+        "~~",
+        "-# ",
+        "!folder[\n",
+        "a/b.md\n",
+        "!lob[\n",
+        "style: base\n",
+        "]\n",
+        "```\n",
+        "<div>\n",
+        "</div>\n",
+        "# h\n",
+    ]
+    rnd = random.Random(15)
+    for _ in range(500):
+        text = "".join(rnd.choice(tokens) for _ in range(rnd.randint(1, 16)))
+        assert render(chained, PAGE, text) == render(plain, PAGE, text), text
@@ -0,0 +1,153 @@
+import os
+
+import pytest
+
+from router.render_cache import RenderCache, file_stamp
+from router.renderer import RenderedPage
+
+
+def make_page(*deps, const_keys=()) -> RenderedPage:
+    return RenderedPage(
+        html="<p>page</p>",
+        title="page",
+        data="",
+        background_url="",
+        dependencies=frozenset(deps),
+        const_keys=frozenset(const_keys),
+    )
+
+
+def touch(path) -> None:
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+
+@pytest.fixture
+def files(tmp_path):
+    page = tmp_path / "page.md"
+    warn = tmp_path / "warn.md"
+    page.write_text("page")
+    warn.write_text("warn")
+    return page, warn
+
+
+def test_hit_and_miss(files):
+    page, warn = files
+    cache = RenderCache()
+
+    assert cache.get(page, 1) is None
+    cache.put(page, make_page(warn), None, file_stamp(page))
+
+    assert cache.get(page, 1) is not None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_stale_dependency_is_reported_later(files):
+    page, warn = files
+    cache = RenderCache()
+    seen = []
+    cache.on_stale(seen.append)
+    cache.put(page, make_page(warn), None, file_stamp(page))
+
+    touch(warn)
+
+    # get() сам слушателей не зовёт, это работа process_stale()
+    assert cache.get(page, 1) is None
+    assert seen == []
+    assert cache.has_stale()
+
+    cache.process_stale()
+    assert seen == [{warn}]
+    assert not cache.has_stale()
+
+    cache.process_stale()
+    assert len(seen) == 1
+
+
+def test_stamps_are_not_checked_under_watcher(files):
+    page, warn = files
+    cache = RenderCache()
+    cache.validate_stamps = False
+    cache.put(page, make_page(warn), None, file_stamp(page))
+
+    touch(warn)
+
+    assert cache.get(page, 1) is not None
+    assert not cache.has_stale()
+
+
+def test_invalidate_paths_drops_dependents(files, tmp_path):
+    page, warn = files
+    other = tmp_path / "other.md"
+    other.write_text("other")
+    cache = RenderCache()
+    cache.put(page, make_page(warn), None, file_stamp(page))
+    cache.put(other, make_page(), None, file_stamp(other))
+
+    assert cache.invalidate_paths({warn}) == 1
+    assert cache.get(page, 1) is None
+    assert cache.get(other, 1) is not None
+
+
+def test_render_started_before_invalidation_is_not_cached(files):
+    page, warn = files
+    cache = RenderCache()
+    generation = cache.generation
+
+    cache.invalidate_paths({warn})
+    cache.put(page, make_page(warn), None, file_stamp(page), generation)
+
+    assert cache.get(page, 1) is None
+
+
+def test_eviction(tmp_path):
+    cache = RenderCache(max_entries=2)
+    paths = [tmp_path / f"{i}.md" for i in range(3)]
+    for path in paths:
+        path.write_text("x")
+        cache.put(path, make_page(), None, file_stamp(path))
+
+    assert cache.get(paths[0], 1) is None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_constants_change_drops_only_pinned_users(tmp_path):
+    cache = RenderCache()
+    paths = {name: tmp_path / f"{name}.md" for name in ("spliced", "pinned", "other")}
+    for path in paths.values():
+        path.write_text("x")
+
+    site = {"site_name"}
+    for name, const_version, keys in (
+        ("spliced", None, site),
+        ("pinned", 1, site),
+        ("other", 1, {"port"}),
+    ):
+        path = paths[name]
+        cache.put(path, make_page(const_keys=keys), const_version, file_stamp(path))
+
+    assert cache.invalidate_constants({"site_name"}, 2) == {
+        paths["spliced"],
+        paths["pinned"],
+    }
+
+    # Слоты подставят новое значение сами, чужая страница переезжает на
+    # новую версию без перерендера
+    assert cache.get(paths["spliced"], 2) is not None
+    assert cache.get(paths["pinned"], 2) is None
+    assert cache.get(paths["other"], 2) is not None
+    assert cache.const_users() == {
+        "site_name": {paths["spliced"]},
+        "port": {paths["other"]},
+    }
+
+
+def test_pinned_entry_misses_other_versions(tmp_path):
+    path = tmp_path / "page.md"
+    path.write_text("x")
+    cache = RenderCache()
+    cache.put(path, make_page(), 1, file_stamp(path))
+
+    assert cache.get(path, 1) is not None
+    assert cache.get(path, 3) is None
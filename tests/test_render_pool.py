@@ -0,0 +1,42 @@
+import asyncio
+
+import pytest
+
+from router.render_pool import RenderExecutor
+from router.renderer import WIKI_DIR, bind_constants
+
+PAGE = WIKI_DIR / "docs" / "about.md"
+
+
+@pytest.fixture(params=["thread", "process"])
+def executor(request):
+    executor = RenderExecutor(backend=request.param, workers=1)
+    executor.start()
+    yield executor
+    executor.shutdown()
+
+
+def render(executor, constants):
+    async def run():
+        return await executor.render(PAGE, constants)
+
+    stamp, page, timings = asyncio.run(run())
+    return page
+
+
+def test_constants_are_spliced(executor):
+    page = render(executor, {"site_name": "first"})
+
+    assert page.const_slots
+    assert "site_name" in page.const_keys
+    assert "second" in bind_constants(page, {"site_name": "second"}).html
+
+
+def test_new_constants_reach_live_workers(executor):
+    # Значение с ! вставкой не подставить, воркер рендерит с ним целиком
+    for value in ("first!", "second!"):
+        page = render(executor, {"site_name": value})
+        assert page.const_slots is None
+        assert value in page.html
+
+    assert executor.stats()["completed"] == 2
@@ -0,0 +1,59 @@
+from router.search_index import SearchIndex, build_index, extract_sections, tokenize
+
+NAV = (
+    '<nav class="links-list">'
+    '<a href="/wiki/docs/anomaly_type">Классификация типов аномалий</a>'
+    '<a href="/wiki/docs/missions_type">Классификация типов миссий</a>'
+    "</nav>"
+)
+
+
+def section_text(html: str) -> str:
+    return "\n".join(s.text for s in extract_sections(html, "/wiki/x", "X"))
+
+
+def test_adjacent_links_are_separate_words():
+    text = section_text(NAV)
+
+    assert "аномалий Классификация" in text
+    assert "аномалийклассификация" not in tokenize(text)
+
+
+def test_inline_boundaries_break_words():
+    text = section_text('<p>один<img src="a.png">два<span>три</span>четыре</p>')
+
+    assert text.split() == ["один", "два", "три", "четыре"]
+
+
+def test_inline_formatting_keeps_words():
+    assert section_text("<p>Сло<b>во</b> и <em>ещё</em></p>") == "Слово и ещё"
+
+
+def test_toc_links_and_scripts_are_skipped():
+    html = '<p><a href="#intro">Оглавление</a>текст</p><script>var x</script>'
+
+    assert section_text(html) == "текст"
+
+
+def test_sections_by_heading():
+    html = '<p>вступление</p><h2 id="rules">Правила</h2><p>текст правил</p>'
+    sections = extract_sections(html, "/wiki/x", "X")
+
+    assert [(s.anchor, s.heading, s.text) for s in sections] == [
+        ("", None, "вступление"),
+        ("rules", "Правила", "текст правил"),
+    ]
+
+
+def test_search_finds_each_link_text(tmp_path):
+    path = tmp_path / "index.bin"
+    path.write_bytes(build_index(extract_sections(NAV, "/wiki/docs", "Документы")))
+    index = SearchIndex(path)
+    try:
+        for query in ("аномалий ", "миссий "):
+            results = index.search(query)
+            assert [r["url"] for r in results] == ["/wiki/docs"]
+            assert "аномалий Классификация" in results[0]["snippet"]
+
+    finally:
+        index.close()
@@ -0,0 +1,128 @@
+import asyncio
+
+import pytest
+
+from router.single_flight import SingleFlight
+
+
+class Work:
+    # fn для do(): считает запуски и ждёт, пока тест его отпустит
+    def __init__(self, result="page", error=None):
+        self.result = result
+        self.error = error
+        self.runs = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.runs += 1
+        await self.release.wait()
+        if self.error is not None:
+            raise self.error
+
+        return self.result
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_concurrent_callers_share_one_run():
+    async def main():
+        flight = SingleFlight()
+        work = Work()
+        calls = [asyncio.create_task(flight.do("about", work)) for _ in range(5)]
+        await settle()
+        assert flight.stats() == {"in_flight": 1, "calls": 1, "shared": 4}
+
+        work.release.set()
+        results = await asyncio.gather(*calls)
+
+        assert results == ["page"] * 5
+        assert work.runs == 1
+        assert flight.stats()["in_flight"] == 0
+
+        # Следующий вызов после завершения - уже новая работа
+        assert await flight.do("about", work) == "page"
+        assert work.runs == 2
+
+    asyncio.run(main())
+
+
+def test_different_keys_run_separately():
+    async def main():
+        flight = SingleFlight()
+        about, index = Work("about"), Work("index")
+        about.release.set()
+        index.release.set()
+
+        results = await asyncio.gather(
+            flight.do("about", about), flight.do("index", index)
+        )
+
+        assert results == ["about", "index"]
+        assert (about.runs, index.runs) == (1, 1)
+        assert flight.shared == 0
+
+    asyncio.run(main())
+
+
+def test_exception_reaches_every_waiter():
+    async def main():
+        flight = SingleFlight()
+        error = RuntimeError("render failed")
+        work = Work(error=error)
+        calls = [asyncio.create_task(flight.do("about", work)) for _ in range(3)]
+        await settle()
+
+        work.release.set()
+        results = await asyncio.gather(*calls, return_exceptions=True)
+
+        assert results == [error] * 3
+        assert work.runs == 1
+        assert flight.stats()["in_flight"] == 0
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize("cancelled", [0, 1])
+def test_cancelled_waiter_does_not_cancel_others(cancelled):
+    # 0 - отваливается тот, кто начал работу, 1 - присоединившийся
+    async def main():
+        flight = SingleFlight()
+        work = Work()
+        calls = [asyncio.create_task(flight.do("about", work)) for _ in range(3)]
+        await settle()
+
+        calls[cancelled].cancel()
+        await settle()
+        work.release.set()
+        results = await asyncio.gather(*calls, return_exceptions=True)
+
+        assert isinstance(results.pop(cancelled), asyncio.CancelledError)
+        assert results == ["page", "page"]
+        assert work.runs == 1
+
+    asyncio.run(main())
+
+
+def test_all_waiters_gone_work_still_finishes():
+    async def main():
+        flight = SingleFlight()
+        work = Work()
+        call = asyncio.create_task(flight.do("about", work))
+        await settle()
+
+        call.cancel()
+        await settle()
+        assert flight.stats()["in_flight"] == 1
+
+        # Новый запрос подхватывает уже идущую работу
+        late = asyncio.create_task(flight.do("about", work))
+        await settle()
+        work.release.set()
+
+        assert await late == "page"
+        assert work.runs == 1
+
+    asyncio.run(main())
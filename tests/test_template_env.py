@@ -0,0 +1,148 @@
+import json
+import os
+
+import pytest
+
+import template_env
+from template_env import AssetStaticFiles, static_version
+
+
+@pytest.fixture
+def static_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(template_env, "STATIC_DIR", tmp_path)
+    monkeypatch.setattr(template_env, "_versions", {})
+    (tmp_path / "app.css").write_text("body {}")
+    return tmp_path
+
+
+def serve(static_dir, query: str):
+    # Как StaticFiles.get_response(): lookup_path() в тредпуле, потом ответ
+    files = AssetStaticFiles(directory=static_dir)
+    path, st = files.lookup_path("app.css")
+    scope = {"type": "http", "headers": [], "query_string": query.encode()}
+    return files.file_response(path, st, scope)
+
+
+def touch(path, text: str) -> None:
+    st = path.stat()
+    path.write_text(text)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+
+def test_hashes_lazily(static_dir):
+    assert template_env._versions == {}
+
+    v = static_version("app.css")
+    assert v == template_env.file_hash(static_dir / "app.css")
+    assert list(template_env._versions) == ["app.css"]
+
+
+def test_changed_file_gets_new_version(static_dir):
+    old = static_version("app.css")
+    generation = template_env.static_generation
+
+    touch(static_dir / "app.css", "body { color: red }")
+
+    assert static_version("app.css") != old
+    assert template_env.static_generation == generation + 1
+
+
+def test_manifest_is_trusted_until_file_changes(static_dir, tmp_path_factory):
+    manifest = tmp_path_factory.mktemp("build") / "assets.json"
+    data = template_env.build_asset_manifest()
+    data["files"]["app.css"] = "from-manifest"
+    manifest.write_text(json.dumps(data))
+
+    assert template_env.load_asset_manifest(manifest)
+    assert static_version("app.css") == "from-manifest"
+
+    touch(static_dir / "app.css", "body { color: red }")
+    assert static_version("app.css") == template_env.file_hash(static_dir / "app.css")
+
+
+def test_immutable_only_for_current_version(static_dir):
+    v = static_version("app.css")
+
+    response = serve(static_dir, f"v={v}")
+    assert response.headers["etag"] == f'"{v}"'
+    assert "immutable" in response.headers["cache-control"]
+
+    touch(static_dir / "app.css", "body { color: red }")
+
+    response = serve(static_dir, f"v={v}")
+    assert response.headers["cache-control"] == "no-cache"
+    assert response.headers["etag"] != f'"{v}"'
+
+
+@pytest.mark.parametrize("query", ["", "v=0", "v=deadbeef", "x=1"])
+def test_no_immutable_without_current_version(static_dir, query):
+    response = serve(static_dir, query)
+
+    assert response.headers["cache-control"] == "no-cache"
+    assert response.headers["etag"] == f'"{static_version("app.css")}"'
+
+
+def test_file_response_never_hashes(static_dir, monkeypatch):
+    files = AssetStaticFiles(directory=static_dir)
+    path, st = files.lookup_path("app.css")
+    v = static_version("app.css")
+
+    def fail(path):
+        raise AssertionError("hashed on the event loop")
+
+    monkeypatch.setattr(template_env, "file_hash", fail)
+    scope = {"type": "http", "headers": [], "query_string": f"v={v}".encode()}
+    response = files.file_response(path, st, scope)
+    assert "immutable" in response.headers["cache-control"]
+
+    # Файл поменялся между lookup_path() и ответом: хеша под новый штамп нет
+    touch(static_dir / "app.css", "body { color: red }")
+    response = files.file_response(path, os.stat(path), scope)
+    assert response.headers["cache-control"] == "no-cache"
+
+
+def test_watch_mode_skips_stat(static_dir, monkeypatch):
+    v = static_version("app.css")
+    monkeypatch.setattr(template_env, "validate_static_stamps", False)
+    monkeypatch.setattr(template_env, "STATIC_DIR", static_dir / "missing")
+
+    # Без вотчера это был бы "0": файла по новому пути нет
+    assert static_version("app.css") == v
+
+    template_env.invalidate_static_versions()
+    assert static_version("app.css") == "0"
+
+
+def test_image_manifest_skips_missing_variants(
+    static_dir, monkeypatch, tmp_path_factory
+):
+    monkeypatch.setattr(template_env, "_image_variants", {})
+    for name in ("full", "partial", "stale"):
+        (static_dir / "images").mkdir(exist_ok=True)
+        (static_dir / "images" / f"{name}.png").write_bytes(b"png")
+        (static_dir / "derived" / name).mkdir(parents=True)
+        (static_dir / "derived" / name / "320.webp").write_bytes(b"webp")
+
+    def entry(name: str) -> dict:
+        st = (static_dir / "images" / f"{name}.png").stat()
+        return {
+            "stamp": [st.st_mtime_ns, st.st_size],
+            "type": "image/png",
+            "webp": [[320, f"derived/{name}/320.webp"]],
+            "fallback": [[320, f"derived/{name}/320.png"], [600, f"images/{name}.png"]],
+        }
+
+    (static_dir / "derived" / "full" / "320.png").write_bytes(b"png")
+    (static_dir / "derived" / "stale" / "320.png").write_bytes(b"png")
+    images = {
+        f"images/{name}.png": entry(name) for name in ("full", "partial", "stale")
+    }
+    images["images/stale.png"]["stamp"][1] += 1
+
+    manifest = tmp_path_factory.mktemp("build") / "images.json"
+    manifest.write_text(json.dumps({"version": 1, "images": images}))
+
+    assert template_env.load_image_manifest(manifest)
+    assert template_env.image_variants("images/full.png") is not None
+    assert template_env.image_variants("images/partial.png") is None
+    assert template_env.image_variants("images/stale.png") is None
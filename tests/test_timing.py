@@ -0,0 +1,157 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from router import timing
+from router.renderer import WIKI_DIR, WikiRenderer, build_markdown
+from router.timing import Profiler, RequestTiming, StageStats, instrument
+
+ROOT = Path(__file__).resolve().parents[1]
+ABOUT = WIKI_DIR / "docs" / "about.md"
+
+# Флаг читается при импорте, так что сервер с WIKI_TIMING=1 - отдельный процесс
+TIMED_SERVER = """
+import json, sys
+sys.path.insert(0, "tests")
+from conftest import call_asgi
+from app import app
+
+page = call_asgi(app, "GET", "/wiki/docs/about")
+again = call_asgi(app, "GET", "/wiki/docs/about")
+stats = call_asgi(app, "GET", "/wiki-timing")
+metrics = call_asgi(app, "GET", "/metrics")
+print(json.dumps({
+    "page": page.headers.get("server-timing"),
+    "again": again.headers.get("server-timing"),
+    "stats_status": stats.status,
+    "stats": json.loads(stats.body),
+    "metrics": metrics.body.decode(),
+}))
+"""
+
+
+@pytest.fixture(scope="module")
+def timed():
+    env = {**os.environ, "WIKI_TIMING": "1", "WIKI_WATCH": "0"}
+    out = subprocess.run(
+        [sys.executable, "-c", TIMED_SERVER],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(out.stdout.splitlines()[-1])
+
+
+def stage_names(header: str) -> list[str]:
+    return [entry.split(";")[0] for entry in header.split(", ")]
+
+
+def test_server_timing_header(timed):
+    names = stage_names(timed["page"])
+
+    assert names[0] == "total"
+    assert {"render", "template", "markdown"} <= set(names)
+    assert len(names) <= timing.SERVER_TIMING_LIMIT + 1
+    # Второй запрос - хит кеша: рендера в нём нет
+    assert "render" not in stage_names(timed["again"])
+
+
+def test_wiki_timing_endpoint(timed):
+    stats = timed["stats"]
+
+    assert timed["stats_status"] == 200
+    assert {"request", "render", "read", "markdown", "template"} <= set(stats)
+    assert "post:MacroPostprocessor" in stats
+    assert "pre:WarnIncludePreprocessor" in stats
+    assert stats["request"]["count"] == 2
+    assert stats["render"]["count"] == 1
+
+
+def test_stage_histogram_in_metrics(timed):
+    assert 'wiki_stage_duration_seconds_count{stage="render"} 1' in timed["metrics"]
+
+
+off = pytest.mark.skipif(timing.TIMING_ENABLED, reason="WIKI_TIMING=1")
+
+
+@off
+def test_disabled_by_default(client):
+    assert WikiRenderer().profiler is None
+
+    page = client("GET", "/wiki/docs/about")
+    assert page.status == 200
+    assert "server-timing" not in page.headers
+    assert client("GET", "/wiki-timing").status == 404
+
+
+@off
+def test_nothing_wrapped_when_disabled():
+    md = WikiRenderer().md
+
+    processors = [
+        *md.preprocessors,
+        *md.parser.blockprocessors,
+        *md.treeprocessors,
+        *md.postprocessors,
+    ]
+    for processor in processors:
+        assert "run" not in vars(processor), processor
+
+    for processor in md.inlinePatterns:
+        assert "handleMatch" not in vars(processor), processor
+
+
+def test_instrumented_markdown_renders_the_same():
+    content = ABOUT.read_text(encoding="utf-8")
+    plain = build_markdown()
+    timed = build_markdown()
+    profiler = Profiler()
+    custom = instrument(timed, profiler)
+
+    for md in (plain, timed):
+        setattr(md, "dependencies", set())
+
+    assert timed.convert(content) == plain.convert(content)
+    totals = profiler.take()
+    assert "post:MacroPostprocessor" in custom
+    assert "tree:InlineProcessor" not in custom
+    assert {"post:MacroPostprocessor", "tree:InlineProcessor"} <= set(totals)
+    assert profiler.take() == {}
+
+
+def test_profiler_subtracts_nested_calls(monkeypatch):
+    profiler = Profiler()
+    clock = iter([0.0, 1.0, 3.0, 10.0])
+    with monkeypatch.context() as m:
+        m.setattr(timing.time, "perf_counter", lambda: next(clock))
+        profiler.call("outer", lambda: profiler.call("inner", lambda: None))
+
+    assert profiler.take() == {"inner": 2000.0, "outer": 8000.0}
+
+
+def test_stage_stats_buckets():
+    stats = StageStats(buckets=(1, 10))
+    stats.observe({"render": 0.5})
+    stats.observe({"render": 10})
+    stats.observe({"render": 50})
+
+    assert stats.snapshot()["render"] == {
+        "count": 3,
+        "sum_ms": 60.5,
+        "buckets": {"1": 1, "10": 1, "+Inf": 1},
+    }
+
+
+def test_header_sanitises_names():
+    request = RequestTiming()
+    request.add({"pre:Strip Comments": 1.0, "render": 2.0})
+
+    assert request.header(5.0) == (
+        "total;dur=5.00, render;dur=2.00, pre-Strip-Comments;dur=1.00"
+    )
@@ -0,0 +1,134 @@
+import pytest
+from markdown import Markdown
+
+from router.extensions import warn_include_extension
+from router.extensions.warn_include_extension import (
+    MAX_DEPTH,
+    WarnIncludeExtension,
+    WarnTemplateStore,
+)
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = WarnTemplateStore()
+    monkeypatch.setattr(warn_include_extension, "warn_templates", store)
+    return store
+
+
+@pytest.fixture
+def expand(tmp_path, store):
+    md = Markdown(extensions=[WarnIncludeExtension(base_dir=tmp_path)])
+    setattr(md, "dependencies", set())
+
+    def run(*lines: str) -> list[str]:
+        return md.preprocessors["warn_include"].run(list(lines))
+
+    run.md = md
+    return run
+
+
+def template(tmp_path, name: str, *lines: str):
+    path = tmp_path / f"{name}.md"
+    path.write_text("\n".join(lines), encoding="utf-8")
+    return path
+
+
+def test_includes_nested_templates(tmp_path, expand):
+    template(tmp_path, "outer", "before", "!warn[inner]", "after")
+    template(tmp_path, "inner", "inside")
+
+    assert expand("top", "!warn[ outer ]") == ["top", "before", "inside", "after"]
+    assert expand.md.dependencies == {
+        (tmp_path / "outer.md").resolve(),
+        (tmp_path / "inner.md").resolve(),
+    }
+
+
+def test_escaped_macro_is_left_alone(tmp_path, expand):
+    template(tmp_path, "wip", "inside")
+
+    assert expand("\\!warn[wip]") == ["\\!warn[wip]"]
+
+
+def test_self_inclusion(tmp_path, expand):
+    template(tmp_path, "a", "a1", "!warn[a]", "a2")
+
+    assert expand("!warn[a]") == ["a1", "Template 'a' includes itself.", "a2"]
+
+
+def test_indirect_cycle(tmp_path, expand):
+    template(tmp_path, "a", "!warn[b]")
+    template(tmp_path, "b", "b", "!warn[c]")
+    template(tmp_path, "c", "c", "!warn[c]", "!warn[a]")
+
+    assert expand("!warn[a]") == [
+        "b",
+        "c",
+        "Template 'c' includes itself.",
+        "Template 'a' includes itself.",
+    ]
+
+
+def test_depth_limit(tmp_path, expand):
+    for i in range(MAX_DEPTH + 2):
+        template(tmp_path, f"t{i}", f"level {i}", f"!warn[t{i + 1}]")
+
+    assert expand("!warn[t0]") == [
+        *(f"level {i}" for i in range(MAX_DEPTH)),
+        f"Template 't{MAX_DEPTH}' is nested too deep.",
+    ]
+
+
+def test_missing_template_is_a_dependency(tmp_path, expand):
+    assert expand("!warn[nope]") == ["Template 'nope' not found."]
+    assert expand.md.dependencies == {(tmp_path / "nope.md").resolve()}
+
+
+def test_templates_are_read_once(tmp_path, expand, store):
+    template(tmp_path, "wip", "inside")
+
+    expand("!warn[wip]", "!warn[wip]")
+    expand("!warn[wip]")
+    expand("!warn[nope]", "!warn[nope]")
+
+    assert store.loads == 2
+
+
+def test_invalidate_bumps_generation_and_rereads(tmp_path, expand, store):
+    path = template(tmp_path, "wip", "old")
+    assert expand("!warn[wip]") == ["old"]
+    generation = store.generation
+
+    path.write_text("new", encoding="utf-8")
+    assert expand("!warn[wip]") == ["old"]
+
+    store.invalidate([path])
+    assert store.generation == generation + 1
+    assert expand("!warn[wip]") == ["new"]
+
+    path.write_text("newer", encoding="utf-8")
+    store.invalidate([tmp_path])
+    assert expand("!warn[wip]") == ["newer"]
+
+    store.invalidate()
+    assert store.generation == generation + 3
+    assert expand("!warn[wip]") == ["newer"]
+    assert store.loads == 4
+
+
+def test_read_racing_invalidate_is_not_cached(tmp_path, store, monkeypatch):
+    path = template(tmp_path, "wip", "old").resolve()
+    read_text = type(path).read_text
+
+    def racing_read(self, *args, **kwargs):
+        text = read_text(self, *args, **kwargs)
+        store.invalidate([self])
+        return text
+
+    with monkeypatch.context() as m:
+        m.setattr(type(path), "read_text", racing_read)
+        assert store.get(path) == ("old",)
+
+    path.write_text("new", encoding="utf-8")
+    assert store.get(path) == ("new",)
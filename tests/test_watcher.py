@@ -0,0 +1,130 @@
+import os
+import queue
+import sys
+
+import pytest
+
+from router.watcher import FileWatcher, _Inotify
+
+TIMEOUT = 5.0
+
+
+def inotify_available() -> bool:
+    if not sys.platform.startswith("linux"):
+        return False
+
+    try:
+        _Inotify().close()
+
+    except OSError:
+        return False
+
+    return True
+
+
+BACKENDS = [
+    "polling",
+    pytest.param(
+        "inotify",
+        marks=pytest.mark.skipif(
+            not inotify_available(), reason="inotify is not available"
+        ),
+    ),
+]
+
+
+@pytest.fixture(params=BACKENDS)
+def watch(request, tmp_path):
+    # Запускает вотчер над tmp_path и возвращает очередь пачек изменений
+    watcher = FileWatcher(
+        [tmp_path],
+        poll_interval=0.05,
+        debounce=0.05,
+        use_inotify=request.param == "inotify",
+    )
+    batches: queue.Queue = queue.Queue()
+    watcher.subscribe(batches.put)
+    watcher.start()
+    assert watcher.backend == request.param
+    # Первый снимок или watch на папки ставятся уже в потоке вотчера
+    settle(batches)
+    yield batches
+    watcher.stop()
+    assert not watcher.running
+
+
+def wait_for(batches: queue.Queue, path) -> set:
+    seen: set = set()
+    while path not in seen:
+        seen |= batches.get(timeout=TIMEOUT)
+
+    return seen
+
+
+def settle(batches: queue.Queue) -> None:
+    # Ждёт, пока вотчер выдаст все пачки от подготовки теста
+    while True:
+        try:
+            batches.get(timeout=0.3)
+
+        except queue.Empty:
+            return
+
+
+def bump(path, text: str) -> None:
+    # Меняет и размер, и mtime: опросу хватит любого из них
+    st = path.stat()
+    path.write_text(text)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+
+def test_modified_file(tmp_path, watch):
+    page = tmp_path / "page.md"
+    page.write_text("old")
+    wait_for(watch, page)
+    settle(watch)
+
+    bump(page, "new text")
+
+    assert wait_for(watch, page) >= {page, tmp_path}
+
+
+def test_created_and_deleted_file(tmp_path, watch):
+    page = tmp_path / "new.md"
+    page.write_text("x")
+    wait_for(watch, page)
+
+    page.unlink()
+    assert page in wait_for(watch, page)
+
+
+def test_file_in_new_subdirectory(tmp_path, watch):
+    folder = tmp_path / "guides"
+    folder.mkdir()
+    wait_for(watch, folder)
+
+    page = folder / "intro.md"
+    page.write_text("x")
+
+    assert wait_for(watch, page) >= {page, folder}
+
+
+def test_failing_subscriber_does_not_stop_others(tmp_path):
+    watcher = FileWatcher([tmp_path], poll_interval=0.05, use_inotify=False)
+    batches: queue.Queue = queue.Queue()
+
+    def fail(changed):
+        raise RuntimeError("boom")
+
+    watcher.subscribe(fail)
+    watcher.subscribe(batches.put)
+    watcher.start()
+    try:
+        settle(batches)
+        page = tmp_path / "page.md"
+        page.write_text("x")
+        wait_for(batches, page)
+        assert watcher.running
+
+    finally:
+        watcher.stop()
@@ -0,0 +1,183 @@
+import gzip
+from email.utils import formatdate
+
+import pytest
+from starlette.requests import Request
+
+from data_control.constants import Constants, ConstSnapshot
+from router import wiki_render
+from router.compression import MIN_SIZE, compress
+from router.render_cache import RenderCache, file_stamp
+from router.renderer import WIKI_DIR, get_renderer
+from router.wiki_render import PageBody, not_modified, page_response, store_entry
+
+ABOUT = (WIKI_DIR / "docs" / "about.md").resolve()
+
+
+def make_request(**headers) -> Request:
+    raw = [(k.replace("_", "-").encode(), v.encode()) for k, v in headers.items()]
+    return Request({"type": "http", "headers": raw})
+
+
+def make_body(etag: str = '"abc"', last_modified: int = 1000) -> PageBody:
+    return PageBody(b"<html>", etag, last_modified, 0, 0, (), {})
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = RenderCache()
+    monkeypatch.setattr(wiki_render, "render_cache", cache)
+    return cache
+
+
+def test_backlink_sources_are_dependencies(cache):
+    backlinks = wiki_render.page_backlinks(ABOUT)
+    assert backlinks
+
+    content = ABOUT.read_text(encoding="utf-8")
+    page = get_renderer().render(ABOUT, content, {}, deferred=True)
+    entry = store_entry(
+        ABOUT, page, None, file_stamp(ABOUT), cache.generation, Constants.snapshot()
+    )
+
+    assert [info.href for info in entry.artifacts["backlinks"]] == [
+        info.href for info in backlinks
+    ]
+    assert backlinks[0].href.encode() in entry.artifacts["body"].body
+
+    # Поменялся заголовок ссылающейся страницы - блок «ссылаются сюда» тоже
+    assert cache.invalidate_paths({backlinks[0].path}) == 1
+    assert cache.get(ABOUT, Constants.get_version()) is None
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ('"abc"', True),
+        ('W/"abc"', True),
+        ('"abc-gzip"', True),
+        ('"abc-br", "other"', True),
+        ("*", True),
+        ('"other"', False),
+    ],
+)
+def test_if_none_match(header, expected):
+    assert not_modified(make_request(if_none_match=header), make_body()) is expected
+
+
+def test_if_none_match_wins_over_if_modified_since():
+    request = make_request(
+        if_none_match='"other"', if_modified_since=formatdate(2000, usegmt=True)
+    )
+
+    assert not not_modified(request, make_body())
+
+
+@pytest.mark.parametrize("since, expected", [(1000, True), (2000, True), (999, False)])
+def test_if_modified_since(since, expected):
+    request = make_request(if_modified_since=formatdate(since, usegmt=True))
+
+    assert not_modified(request, make_body()) is expected
+
+
+def test_bad_if_modified_since():
+    assert not not_modified(make_request(if_modified_since="yesterday"), make_body())
+
+
+def test_body_is_rebuilt_only_for_own_constants(cache):
+    content = "Title: Тест\n\nСайт !const[site_name]\n"
+    page = get_renderer().render(ABOUT, content, {}, deferred=True)
+    assert page.const_slots
+
+    v1 = ConstSnapshot(1, {"site_name": "first", "other": "1"}, 1.0)
+    entry = store_entry(ABOUT, page, None, None, cache.generation, v1)
+    body = entry.artifacts["body"]
+    assert b"first" in body.body
+
+    # Чужая константа: тело то же, только переезжает на новую версию
+    v2 = ConstSnapshot(2, {"site_name": "first", "other": "2"}, 2.0)
+    same = wiki_render.current_page_body(entry, v2)
+    assert same.body is body.body
+    assert same.const_version == 2
+
+    v3 = ConstSnapshot(3, {"site_name": "second", "other": "2"}, 3.0)
+    assert wiki_render.current_page_body(entry, v3) is None
+    rebuilt = wiki_render.get_page_body(entry, v3)
+    assert b"second" in rebuilt.body
+    assert rebuilt.etag != body.etag
+
+
+def compressed_body(size: int) -> PageBody:
+    body = b"x" * size
+    return PageBody(body, '"abc"', 1000, 0, 0, (), {"gzip": compress(body, "gzip")})
+
+
+def conditional(page_body: PageBody, encoding, **headers):
+    # Как в wiki_page(): 304, если тег из запроса подходит к телу
+    status = 304 if not_modified(make_request(**headers), page_body) else 200
+    return page_response(page_body, encoding, status_code=status)
+
+
+@pytest.mark.parametrize("encoding", [None, "gzip"])
+def test_etag_suffix_round_trips_to_304(encoding):
+    page_body = compressed_body(MIN_SIZE)
+    first = page_response(page_body, encoding)
+    etag = '"abc-gzip"' if encoding else '"abc"'
+
+    assert first.headers["etag"] == etag
+    assert first.headers["vary"] == "Accept-Encoding"
+    assert ("content-encoding" in first.headers) is (encoding is not None)
+
+    again = conditional(page_body, encoding, if_none_match=etag)
+    assert again.status_code == 304
+    assert again.body == b""
+    assert again.headers["etag"] == etag
+    assert again.headers["vary"] == "Accept-Encoding"
+    assert "content-encoding" not in again.headers
+
+
+def test_tag_from_other_encoding_still_matches():
+    # Тело то же, сменился только Accept-Encoding - отвечаем 304 с тегом
+    # того варианта, который отдали бы сейчас
+    page_body = compressed_body(MIN_SIZE)
+
+    reply = conditional(page_body, None, if_none_match='"abc-gzip"')
+    assert reply.status_code == 304
+    assert reply.headers["etag"] == '"abc"'
+
+    reply = conditional(page_body, "gzip", if_none_match='"abc"')
+    assert reply.status_code == 304
+    assert reply.headers["etag"] == '"abc-gzip"'
+
+
+def test_small_body_is_not_compressed():
+    page_body = compressed_body(MIN_SIZE - 1)
+    reply = page_response(page_body, "gzip")
+
+    assert reply.body == page_body.body
+    assert reply.headers["etag"] == '"abc"'
+    assert "content-encoding" not in reply.headers
+    assert reply.headers["vary"] == "Accept-Encoding"
+
+
+def test_wiki_page_gzip_and_304(client):
+    path = "/wiki/docs/about"
+    plain = client("GET", path)
+    packed = client("GET", path, headers=[("Accept-Encoding", "gzip")])
+
+    assert plain.status == packed.status == 200
+    assert packed.headers["content-encoding"] == "gzip"
+    assert gzip.decompress(packed.body) == plain.body
+    assert packed.headers["etag"] == plain.headers["etag"][:-1] + '-gzip"'
+    assert plain.headers["vary"] == packed.headers["vary"] == "Accept-Encoding"
+
+    for etag in (plain.headers["etag"], packed.headers["etag"]):
+        reply = client(
+            "GET",
+            path,
+            headers=[("Accept-Encoding", "gzip"), ("If-None-Match", etag)],
+        )
+        assert reply.status == 304
+        assert reply.body == b""
+        assert reply.headers["etag"] == packed.headers["etag"]
+        assert reply.headers["vary"] == "Accept-Encoding"
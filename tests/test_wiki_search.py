@@ -0,0 +1,147 @@
+import time
+from pathlib import Path
+
+import pytest
+
+from data_control.constants import Constants
+from router import wiki_search
+from router.render_cache import file_stamp, render_cache
+from router.renderer import WIKI_DIR, get_renderer
+from router.wiki_search import SearchService, index_page, update_pages
+
+ABOUT = (WIKI_DIR / "docs" / "about.md").resolve()
+MARKER = "квазиблорк"
+TIMEOUT = 10.0
+
+
+@pytest.fixture(scope="module")
+def full():
+    return update_pages(None, set(), set(), {})
+
+
+def mark_about(monkeypatch) -> None:
+    # Правка about.md без записи на диск: к тексту дописывается слово-метка
+    read_text = Path.read_text
+
+    def patched(path, *args, **kwargs):
+        text = read_text(path, *args, **kwargs)
+        return text + f"\n\n{MARKER}\n" if path == ABOUT else text
+
+    monkeypatch.setattr(Path, "read_text", patched)
+    render_cache.invalidate(ABOUT)
+
+
+@pytest.fixture
+def marked(monkeypatch):
+    mark_about(monkeypatch)
+    yield
+    render_cache.invalidate(ABOUT)
+
+
+@pytest.fixture
+def indexed(monkeypatch):
+    # Какие страницы ушли в index_page()
+    calls = []
+    original = wiki_search.index_page
+
+    def counting(md_path, *args, **kwargs):
+        calls.append(md_path)
+        return original(md_path, *args, **kwargs)
+
+    monkeypatch.setattr(wiki_search, "index_page", counting)
+    return calls
+
+
+def wait_rebuilds(service: SearchService, count: int) -> None:
+    deadline = time.monotonic() + TIMEOUT
+    while service.rebuilds < count:
+        assert time.monotonic() < deadline, "search index was not rebuilt"
+        time.sleep(0.01)
+
+
+def test_incremental_update_matches_full_rebuild(full, marked, indexed):
+    pages = update_pages(full, {ABOUT, ABOUT.parent}, set(), {})
+
+    assert indexed == [ABOUT]
+    assert MARKER in pages[ABOUT].sections[-1].text
+    assert pages == update_pages(None, set(), set(), {})
+
+
+def test_dependants_are_reindexed(full, indexed):
+    # Оглавление папки собирается из её страниц
+    folder = WIKI_DIR.resolve() / "guides"
+    update_pages(full, {folder}, set(), {})
+
+    assert indexed == [folder / "index.md"]
+
+
+def test_removed_page_is_dropped(full, monkeypatch):
+    pages = wiki_search.wiki_pages()
+    monkeypatch.setattr(
+        wiki_search, "wiki_pages", lambda: [p for p in pages if p != ABOUT]
+    )
+
+    assert ABOUT not in update_pages(full, {ABOUT}, set(), {})
+
+
+def test_render_cache_page_is_reused(marked, indexed, monkeypatch):
+    content = Path.read_text(ABOUT, encoding="utf-8")
+    page = get_renderer().render(ABOUT, content, {})
+    version = Constants.get_version()
+    render_cache.put(ABOUT, page, version, file_stamp(ABOUT))
+    # Из кеша - значит, файл не читался
+    monkeypatch.setattr(Path, "read_text", None)
+
+    indexed_page = index_page(ABOUT, {}, version)
+
+    assert MARKER in indexed_page.sections[-1].text
+    assert indexed_page.dependencies == page.dependencies
+
+
+def test_service_updates_and_closes_old_index(tmp_path, indexed, monkeypatch):
+    path = tmp_path / "search-index.bin"
+    service = SearchService(path, debounce=0.01)
+    service.start()
+    try:
+        wait_rebuilds(service, 1)
+        old = service.index
+        assert service.search(MARKER) == []
+
+        mark_about(monkeypatch)
+        calls = len(indexed)
+        service.on_files_changed({ABOUT, ABOUT.parent, tmp_path})
+        wait_rebuilds(service, 2)
+
+        assert indexed[calls:] == [ABOUT]
+        assert old._mm.closed
+        (found,) = service.search(MARKER)
+        assert found["url"].startswith("/wiki/docs/about#")
+
+    finally:
+        service.stop()
+        render_cache.invalidate(ABOUT)
+
+    assert service.index is None
+    assert service.search(MARKER) is None
+
+
+def test_service_restores_pages_from_file(tmp_path, indexed):
+    path = tmp_path / "search-index.bin"
+    wiki_search.write_index(path, Constants.get_all_const())
+    fresh = update_pages(None, set(), set(), Constants.get_all_const())
+    indexed.clear()
+
+    service = SearchService(path, debounce=0.01)
+    service.start()
+    try:
+        assert service.rebuilds == 0
+        assert service.search("правила") is not None
+
+        service.on_files_changed({ABOUT})
+        wait_rebuilds(service, 1)
+
+        assert indexed == [ABOUT]
+        assert service._pages == fresh
+
+    finally:
+        service.stop()